@@ -10,9 +10,16 @@ from aiohttp import web
 from vj4 import db
 from vj4 import error
 from vj4.model import system
+from vj4.service import blobstore
 from vj4.service import bus
+from vj4.service import countcache
+from vj4.service import mailer
+from vj4.service import pagecache
+from vj4.service import pwhashpool
+from vj4.service import ranking
 from vj4.service import smallcache
 from vj4.service import staticmanifest
+from vj4.service import viewcount
 from vj4.util import json
 from vj4.util import options
 from vj4.util import tools
@@ -73,14 +80,13 @@ class Application(web.Application):
 
     static_path = path.join(path.dirname(__file__), '.uibuild')
 
-    # Initialize components.
+    # Initialize immutable components. Connections are made on startup, after workers are forked.
     staticmanifest.init(static_path)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(db.init())
-    loop.run_until_complete(system.setup())
-    loop.run_until_complete(system.ensure_db_version())
-    loop.run_until_complete(asyncio.gather(tools.ensure_all_indexes(), bus.init()))
-    smallcache.init()
+    self.on_startup.append(_init_connections)
+    self.on_shutdown.append(_flush_buffers)
+    self.on_shutdown.append(_shutdown_pools)
+    self.on_shutdown.append(_stop_senders)
+    self.on_cleanup.append(_close_sessions)
 
     # Load views.
     from vj4.handler import contest
@@ -99,6 +105,42 @@ class Application(web.Application):
     if options.static:
       self.router.add_static('/', static_path, name='static')
 
+    # Compile or load templates before accepting traffic.
+    if not options.debug:
+      from vj4 import template
+      _logger.info('Loaded %d templates', template.get_env().warm_up())
+
+
+async def _init_connections(app):
+  await db.init()
+  await system.setup()
+  await system.ensure_db_version()
+  await bus.init()
+  tools.ensure_all_indexes_later()
+  smallcache.init()
+  countcache.init()
+  mailer.init()
+  pagecache.init()
+  ranking.init()
+  viewcount.init()
+
+
+async def _flush_buffers(app):
+  await viewcount.uninit()
+
+
+async def _shutdown_pools(app):
+  pwhashpool.uninit()
+
+
+async def _stop_senders(app):
+  # Mails being sent are claimed with a lease, and are retried when it expires.
+  mailer.uninit()
+
+
+async def _close_sessions(app):
+  await blobstore.uninit()
+
 
 def route(url, name, global_route=False):
   def decorate(handler):
@@ -135,12 +177,20 @@ def connection_route(prefix, name, global_route=False):
         self.factory = conn
         self.timeout = datetime.timedelta(seconds=60)
 
-    loop = asyncio.get_event_loop()
+      @property
+      def loop(self):
+        # The event loop is created after workers are forked, which may be after this endpoint.
+        return asyncio.get_event_loop()
+
+      @loop.setter
+      def loop(self, value):
+        pass
+
     sockjs.add_endpoint(Application(), handler, name=name, prefix=prefix,
-                        manager=Manager(name, Application(), handler, loop))
+                        manager=Manager(name, Application(), handler, None))
     sockjs.add_endpoint(
         Application(), handler, name=name + '_with_domain_id', prefix='/d/{domain_id}' + prefix,
-        manager=Manager(name + '_with_domain_id', Application(), handler, loop))
+        manager=Manager(name + '_with_domain_id', Application(), handler, None))
     return conn
 
   return decorate
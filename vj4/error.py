@@ -32,6 +32,16 @@ class UserFacingError(Error):
     return 'An error has occurred.'
 
 
+class ServiceUnavailableError(UserFacingError):
+  @property
+  def http_status(self):
+    return 503
+
+  @property
+  def message(self):
+    return 'The service is busy, please try again later.'
+
+
 class BadRequestError(UserFacingError):
   @property
   def http_status(self):
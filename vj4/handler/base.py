@@ -2,11 +2,13 @@ import accept
 import asyncio
 import calendar
 import functools
+import hashlib
 import hmac
 import logging
 import markupsafe
 import pytz
 import sockjs
+import tempfile
 from aiohttp import web
 from email import utils
 
@@ -22,6 +24,7 @@ from vj4.model import token
 from vj4.model import user
 from vj4.model.adaptor import setting
 from vj4.service import mailer
+from vj4.service import pagecache
 from vj4.util import json
 from vj4.util import locale
 from vj4.util import options
@@ -29,6 +32,10 @@ from vj4.util import tools
 
 _logger = logging.getLogger(__name__)
 
+MULTIPART_SPOOL_SIZE = 2 ** 20
+# Allowance for form fields and part headers when checking Content-Length against upload limit.
+MULTIPART_OVERHEAD = 2 ** 16
+
 
 class HandlerBase(setting.SettingMixin):
   NAME = None
@@ -206,7 +213,7 @@ class HandlerBase(setting.SettingMixin):
       kwargs['path_components'] = self.build_path((self.translate(self.NAME), None))
     kwargs['reverse_url'] = self.reverse_url
     kwargs['datetime_span'] = functools.partial(_datetime_span, timezone=self.timezone)
-    return template.Environment().get_template(template_name).render(kwargs)
+    return template.get_env().get_template(template_name).render(kwargs)
 
   def render_title(self, page_title=None):
     if not page_title:
@@ -221,7 +228,7 @@ class HandlerBase(setting.SettingMixin):
     translate = self.translate
     if '_' in kwargs:
       translate = kwargs['_']
-    await mailer.send_mail(mail, '{0} - Vijos'.format(translate(title)), content)
+    await mailer.queue_mail(mail, '{0} - Vijos'.format(translate(title)), content)
 
 
 class Handler(web.View, HandlerBase):
@@ -454,29 +461,49 @@ def post_argument(coro):
   return wrapped
 
 
+def _spool_write(spool, sha256, md5, chunk):
+  sha256.update(chunk)
+  md5.update(chunk)
+  spool.write(chunk)
+
+
 def multipart_argument(coro):
+  """Parse multipart arguments, storing files and passing their file IDs.
+
+  Files are spooled to temporary files while hashing, and only stored if no file with the same
+  SHA-256, or the same MD5 for files stored without SHA-256, exists. Handlers may define
+  get_upload_limit to limit the total length of files, which is checked against Content-Length
+  before reading the body.
+  """
   @functools.wraps(coro)
   async def wrapped(self, **kwargs):
+    limit = await self.get_upload_limit() if hasattr(self, 'get_upload_limit') else None
+    if limit is not None and (self.request.content_length or 0) > limit + MULTIPART_OVERHEAD:
+      raise error.FileTooLongError()
+    loop = asyncio.get_event_loop()
     file_ids = list()
+    total_length = 0
     try:
       async for part in await self.request.multipart():
         if not part.filename:
           kwargs[part.name] = (await part.read()).decode()
         else:
-          grid_in = await fs.add(self.get_content_type(part.filename))
-          try:
+          content_type = self.get_content_type(part.filename)
+          with tempfile.SpooledTemporaryFile(MULTIPART_SPOOL_SIZE) as spool:
+            sha256 = hashlib.sha256()
+            md5 = hashlib.md5()
             chunk = await part.read_chunk()
             while chunk:
-              _, chunk = await asyncio.gather(grid_in.write(chunk), part.read_chunk())
-            await grid_in.close()
-          except:
-            await grid_in.abort()
-            raise
-          file_id = await fs.link_by_md5(grid_in.md5, grid_in._id)
-          if file_id:
-            await fs.unlink(grid_in._id)
-          else:
-            file_id = grid_in._id
+              total_length += len(chunk)
+              if limit is not None and total_length > limit:
+                raise error.FileTooLongError()
+              _, chunk = await asyncio.gather(
+                  loop.run_in_executor(None, _spool_write, spool, sha256, md5, chunk),
+                  part.read_chunk())
+            file_id = await fs.link_by_sha256(sha256.hexdigest(), md5.hexdigest())
+            if not file_id:
+              spool.seek(0)
+              file_id = await fs.add_file_object(content_type, spool, sha256=sha256.hexdigest())
           file_ids.append(file_id)
           kwargs[part.name] = file_id
       return await coro(self, **kwargs)
@@ -487,6 +514,41 @@ def multipart_argument(coro):
 
   return wrapped
 
+def guest_cache(coro):
+  """Cache the page for guests and let front end caches store it.
+
+  Pages are only cached for requests without a session, after permission checks of outer
+  decorators. Pages with a status other than 200 or setting cookies are not cached.
+  """
+  @functools.wraps(coro)
+  async def wrapped(self, **kwargs):
+    if self.session:
+      return await coro(self, **kwargs)
+    key = (self.request.path_qs, self.domain_id, self.view_lang, self.prefer_json)
+    entry = pagecache.get(key)
+    if entry:
+      self.response.content_type = entry.content_type
+      self.response.body = entry.body
+      self.response.headers['X-Cache'] = 'HIT'
+    else:
+      result = await coro(self, **kwargs)
+      if (self.response.status != 200 or type(self.response) is not web.Response
+          or self.response.cookies or self.response.body is None):
+        return result
+      entry = pagecache.set(key, self.response.body, self.response.content_type)
+      self.response.headers['X-Cache'] = 'MISS'
+    self.response.headers['Cache-Control'] = \
+      'public, max-age={}'.format(options.pagecache_max_age_seconds)
+    self.response.headers.popall('Pragma', None)
+    self.response.headers['Vary'] = 'Accept, Cookie'
+    self.response.headers['Etag'] = entry.etag
+    if self.request.headers.get('If-None-Match', '') == entry.etag:
+      self.response.set_status(304, None) # Not Modified
+      self.response.body = None
+
+  return wrapped
+
+
 def limit_rate(op, period_secs, max_operations):
   def decorate(coro):
     @functools.wraps(coro)
@@ -33,14 +33,17 @@ class ContestMainHandler(contest.ContestMixin, base.Handler):
   @base.sanitize
   async def get(self, *, rule: int=0, page: int=1):
     if not rule:
-      tdocs = contest.get_multi(self.domain_id, document.TYPE_CONTEST)
+      f = {}
       qs = ''
     else:
       if rule not in constant.contest.CONTEST_RULES:
         raise error.ValidationError('rule')
-      tdocs = contest.get_multi(self.domain_id, document.TYPE_CONTEST, rule=rule)
+      f = {'rule': rule}
       qs = 'rule={0}'.format(rule)
-    tdocs, tpcount, _ = await pagination.paginate(tdocs, page, self.CONTESTS_PER_PAGE)
+    tdocs, tpcount, _, _, _ = await pagination.paginate_by_key(
+        contest.get_multi, contest.count, [('doc_id', -1)], page, self.CONTESTS_PER_PAGE,
+        domain_id=self.domain_id, doc_type=document.TYPE_CONTEST, **f)
+    await contest.fill_counts(tdocs)
     tsdict = await contest.get_dict_status(self.domain_id, self.user['_id'], document.TYPE_CONTEST,
                                           (tdoc['doc_id'] for tdoc in tdocs))
     self.render('contest_main.html', page=page, tpcount=tpcount, qs=qs, rule=rule,
@@ -31,18 +31,21 @@ class DiscussionMainHandler(base.Handler):
   @base.require_perm(builtin.PERM_VIEW_DISCUSSION)
   @base.get_argument
   @base.sanitize
-  async def get(self, *, page: int=1):
-    # TODO(iceboy): continuation based pagination.
-    nodes, (ddocs, dpcount, _) = await asyncio.gather(
+  async def get(self, *, page: int=1, cursor: str=None):
+    nodes, (ddocs, dpcount, _, previous_cursor, next_cursor) = await asyncio.gather(
         discussion.get_nodes(self.domain_id),
         # TODO(twd2): exclude problem/contest discussions?
-        pagination.paginate(discussion.get_multi(self.domain_id), page, self.DISCUSSIONS_PER_PAGE))
+        pagination.paginate_by_key(discussion.get_multi, discussion.count,
+                                   [('update_at', -1), ('doc_id', -1)],
+                                   page, self.DISCUSSIONS_PER_PAGE, cursor,
+                                   domain_id=self.domain_id))
     udict, dudict, vndict = await asyncio.gather(
         user.get_dict(ddoc['owner_uid'] for ddoc in ddocs),
         domain.get_dict_user_by_uid(domain_id=self.domain_id, uids=(ddoc['owner_uid'] for ddoc in ddocs)),
         discussion.get_dict_vnodes(self.domain_id, map(discussion.node_id, ddocs)))
     self.render('discussion_main_or_node.html', discussion_nodes=nodes, ddocs=ddocs,
-                udict=udict, dudict=dudict, vndict=vndict, page=page, dpcount=dpcount)
+                udict=udict, dudict=dudict, vndict=vndict, page=page, dpcount=dpcount,
+                previous_cursor=previous_cursor, next_cursor=next_cursor)
 
 
 @app.route('/discuss/{doc_type:-?\d+}/{doc_id}', 'discussion_node_document_as_node')
@@ -54,7 +57,7 @@ class DiscussionNodeHandler(contest.ContestStatusMixin, base.Handler):
   @base.get_argument
   @base.route_argument
   @base.sanitize
-  async def get(self, *, doc_type: int=None, doc_id: str, page: int=1):
+  async def get(self, *, doc_type: int=None, doc_id: str, page: int=1, cursor: str=None):
     if doc_type is None:
       node_or_dtuple = doc_id
     else:
@@ -65,12 +68,10 @@ class DiscussionNodeHandler(contest.ContestStatusMixin, base.Handler):
     if vnode['doc_type'] == document.TYPE_PROBLEM and vnode.get('hidden', False):
       self.check_perm(builtin.PERM_VIEW_PROBLEM_HIDDEN)
     # TODO(twd2): do more visibility check eg. contest
-    # TODO(iceboy): continuation based pagination.
-    ddocs, dpcount, _ = await pagination.paginate(
-        discussion.get_multi(self.domain_id,
-                             parent_doc_type=vnode['doc_type'],
-                             parent_doc_id=vnode['doc_id']),
-        page, self.DISCUSSIONS_PER_PAGE)
+    ddocs, dpcount, _, previous_cursor, next_cursor = await pagination.paginate_by_key(
+        discussion.get_multi, discussion.count, [('update_at', -1), ('doc_id', -1)],
+        page, self.DISCUSSIONS_PER_PAGE, cursor, domain_id=self.domain_id,
+        parent_doc_type=vnode['doc_type'], parent_doc_id=vnode['doc_id'])
     uids = set(ddoc['owner_uid'] for ddoc in ddocs)
     if 'owner_uid' in vnode:
       uids.add(vnode['owner_uid'])
@@ -83,6 +84,7 @@ class DiscussionNodeHandler(contest.ContestStatusMixin, base.Handler):
         (vnode['title'], None))
     self.render('discussion_main_or_node.html', discussion_nodes=nodes, vnode=vnode, ddocs=ddocs,
                 udict=udict, dudict=dudict, vndict=vndict, page=page, dpcount=dpcount, **vncontext,
+                previous_cursor=previous_cursor, next_cursor=next_cursor,
                 path_components=path_components)
 
 
@@ -143,6 +145,7 @@ class DiscussionDetailHandler(base.OperationHandler):
   REPLIES_PER_PAGE = 50
 
   @base.require_perm(builtin.PERM_VIEW_DISCUSSION)
+  @base.guest_cache
   @base.get_argument
   @base.route_argument
   @base.sanitize
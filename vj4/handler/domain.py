@@ -33,6 +33,7 @@ class DomainMainHandler(contest.ContestStatusMixin, base.Handler):
       tdocs = await contest.get_multi(self.domain_id, document.TYPE_CONTEST) \
                            .limit(self.CONTESTS_ON_MAIN) \
                            .to_list()
+      await contest.fill_counts(tdocs)
       tsdict = await contest.get_dict_status(self.domain_id, self.user['_id'],
                                              document.TYPE_CONTEST,
                                              (tdoc['doc_id'] for tdoc in tdocs))
@@ -78,6 +79,7 @@ class DomainMainHandler(contest.ContestStatusMixin, base.Handler):
       vndict = {}
     return ddocs, vndict
 
+  @base.guest_cache
   async def get(self):
     (tdocs, tsdict), (htdocs, htsdict),\
     (trdocs, trsdict), (ddocs, vndict) = await asyncio.gather(
@@ -1,6 +1,9 @@
 import asyncio
+import binascii
 import functools
 import mimetypes
+import os
+from aiohttp import web
 from bson import objectid
 
 from vj4 import app
@@ -9,6 +12,9 @@ from vj4.handler import base
 from vj4.model import builtin
 from vj4.model import fs
 from vj4.model.adaptor import userfile
+from vj4.service import fscache
+from vj4.util import httprange
+from vj4.util import options
 
 FILE_MAX_LENGTH = 2 ** 27 # 128 MiB
 USER_QUOTA = 2 ** 27 # 128 MiB
@@ -50,18 +56,95 @@ class FsGetHandler(base.Handler):
       self.response.set_status(304, None) # Not Modified
       return
 
+    self.response.headers['Accept-Ranges'] = 'bytes'
+    ranges = None
+    if self._if_range_matches(grid_out):
+      ranges = httprange.parse(self.request.headers.get('Range'), grid_out.length)
+    if ranges is not None and not ranges:
+      self.response.set_status(416, None) # Range Not Satisfiable
+      self.response.headers['Content-Range'] = 'bytes */{}'.format(grid_out.length)
+      self.response.headers['Content-Length'] = '0'
+      return
+
+    # Whole files and single ranges are served from the local cache, where FileResponse handles
+    # the range and sends the file with sendfile.
+    range_header = self.request.headers.get('Range')
+    if not range_header or (ranges and len(ranges) == 1 and ',' not in range_header):
+      path = fscache.get_path(grid_out.md5)
+      if path:
+        self._respond_file(path)
+        return
+      if options.fscache_dir:
+        self.response.headers['X-Cache'] = 'MISS'
+        if not headers_only:
+          fscache.fill_later(grid_out)
+
+    if ranges is None:
+      if not headers_only:
+        await self.response.prepare(self.request)
+        await self._write_range(grid_out, 0, grid_out.length)
+        await self.response.write_eof()
+      return
+
+    self.response.set_status(206, None) # Partial Content
+    if len(ranges) == 1:
+      start, stop = ranges[0]
+      self.response.headers['Content-Range'] = \
+        'bytes {}-{}/{}'.format(start, stop - 1, grid_out.length)
+      self.response.headers['Content-Length'] = str(stop - start)
+      if not headers_only:
+        await self.response.prepare(self.request)
+        await self._write_range(grid_out, start, stop)
+        await self.response.write_eof()
+      return
+
+    boundary = binascii.hexlify(os.urandom(16)).decode()
+    part_headers = []
+    for start, stop in ranges:
+      part_headers.append('\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'
+                          .format(boundary, self.response.content_type, start, stop - 1,
+                                  grid_out.length).encode())
+    trailer = '\r\n--{}--\r\n'.format(boundary).encode()
+    self.response.headers['Content-Length'] = str(
+        sum(len(h) for h in part_headers) + sum(stop - start for start, stop in ranges)
+        + len(trailer))
+    self.response.content_type = 'multipart/byteranges; boundary=' + boundary
     if not headers_only:
       await self.response.prepare(self.request)
-      # TODO(twd2): Range
-      remaining = grid_out.length
-      chunk = await grid_out.readchunk()
-      while chunk and remaining >= len(chunk):
-        remaining -= len(chunk)
-        _, chunk = await asyncio.gather(self.response.write(chunk), grid_out.readchunk())
-      if chunk:
-        await self.response.write(chunk[:remaining])
+      for part_header, (start, stop) in zip(part_headers, ranges):
+        await self.response.write(part_header)
+        await self._write_range(grid_out, start, stop)
+      await self.response.write(trailer)
       await self.response.write_eof()
 
+  def _respond_file(self, path):
+    headers = {'X-Cache': 'HIT'}
+    for name in ['Content-Type', 'Content-Disposition', 'Last-Modified', 'Etag',
+                 'Cache-Control', 'Accept-Ranges']:
+      headers[name] = self.response.headers[name]
+    self.response = web.FileResponse(path, headers=headers)
+
+  def _if_range_matches(self, grid_out):
+    if_range = self.request.headers.get('If-Range', '')
+    if not if_range:
+      return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+      # Weak entity tags never match.
+      return if_range == '"{0}"'.format(grid_out.md5)
+    return self.request.if_range is not None \
+      and grid_out.upload_date.replace(microsecond=0) == self.request.if_range.replace(tzinfo=None)
+
+  async def _write_range(self, grid_out, start, stop):
+    # Seeking only moves the position, and the next read starts from the chunk containing it.
+    grid_out.seek(start)
+    remaining = stop - start
+    chunk = await grid_out.readchunk()
+    while chunk and remaining > len(chunk):
+      remaining -= len(chunk)
+      _, chunk = await asyncio.gather(self.response.write(chunk), grid_out.readchunk())
+    if chunk:
+      await self.response.write(chunk[:remaining])
+
   head = functools.partialmethod(stream_data, headers_only=True)
   get = stream_data
 
@@ -81,6 +164,9 @@ class FsUploadHandler(base.Handler):
       quota = 2 ** 63 - 1
     return quota
 
+  async def get_upload_limit(self):
+    return self.get_quota() - await userfile.get_usage(self.user['_id'])
+
   @base.require_priv(builtin.PRIV_USER_PROFILE | builtin.PRIV_CREATE_FILE)
   async def get(self):
     self.render('fs_upload.html', fdoc=None,
@@ -8,6 +8,7 @@ from vj4 import app
 from vj4 import constant
 from vj4 import job
 from vj4.handler import base
+from vj4.model import blob
 from vj4.model import builtin
 from vj4.model import document
 from vj4.model import domain
@@ -52,7 +53,8 @@ async def _post_judge(handler, rdoc):
       post_coros.append(contest.update_status(rdoc['domain_id'],
                                               rdoc.get('ttype', document.TYPE_CONTEST), rdoc['tid'],
                                               rdoc['uid'], rdoc['_id'], rdoc['pid'],
-                                              accept, rdoc['score']))
+                                              accept, rdoc['score'],
+                                              rdoc.get('rejudged', False)))
     if not rdoc.get('rejudged'):
       if await problem.update_status(rdoc['domain_id'], rdoc['pid'], rdoc['uid'],
                                      rdoc['_id'], rdoc['status']):
@@ -63,7 +65,7 @@ async def _post_judge(handler, rdoc):
     else:
       # TODO(twd2): enqueue rdoc['pid'] to recalculate rp.
       await job.record.user_in_problem(rdoc['uid'], rdoc['domain_id'], rdoc['pid'])
-    post_coros.append(job.difficulty.update_problem(rdoc['domain_id'], rdoc['pid']))
+    job.difficulty.update_problem_later(rdoc['domain_id'], rdoc['pid'])
   await asyncio.gather(*post_coros)
 
 
@@ -100,6 +102,28 @@ class JudgeDataListHandler(base.Handler):
                'time': calendar.timegm(datetime.datetime.utcnow().utctimetuple())})
 
 
+@app.route('/judge/blob/{sha256:[0-9a-f]{64}}', 'judge_blob', global_route=True)
+class JudgeBlobHandler(base.Handler):
+  @base.require_priv(builtin.PRIV_READ_PROBLEM_DATA)
+  @base.route_argument
+  @base.sanitize
+  async def get(self, *, sha256: str):
+    grid_out = await blob.get(sha256)
+    self.response.content_type = 'application/octet-stream'
+    self.response.headers['Content-Length'] = str(grid_out.length)
+    # Blobs are addressed by content and never change.
+    self.response.headers['Etag'] = '"{}"'.format(sha256)
+    self.response.headers['Cache-Control'] = 'max-age=31536000, immutable'
+    if self.request.headers.get('If-None-Match', '') == '"{}"'.format(sha256):
+      self.response.set_status(304, None) # Not Modified
+      return
+    await self.response.prepare(self.request)
+    chunk = await grid_out.readchunk()
+    while chunk:
+      _, chunk = await asyncio.gather(self.response.write(chunk), grid_out.readchunk())
+    await self.response.write_eof()
+
+
 # TODO(iceboy): Move this to RecordCancelHandler.
 @app.route('/judge/{rid}/score', 'judge_score')
 class JudgeScoreHandler(base.Handler):
@@ -12,6 +12,7 @@ from vj4 import error
 from vj4 import job
 from vj4.handler import base
 from vj4.handler import record as record_handler
+from vj4.model import blob
 from vj4.model import builtin
 from vj4.model import user
 from vj4.model import document
@@ -28,15 +29,22 @@ from vj4.util import options
 from vj4.util import misc
 
 
+def get_multi_problem_list(**kwargs):
+  return problem.get_multi(fields=problem.PROJECTION_LIST, **kwargs)
+
+
 async def render_or_json_problem_list(self, page, ppcount, pcount, pdocs,
                                       category, psdict, **kwargs):
   if 'page_title' not in kwargs:
     kwargs['page_title'] = self.translate(self.TITLE)
   if 'path_components' not in kwargs:
     kwargs['path_components'] = self.build_path((self.translate(self.NAME), None))
+  await problem.fill_counts(pdocs)
   if self.prefer_json:
     list_html = self.render_html('partials/problem_list.html', page=page, ppcount=ppcount,
-                                 pcount=pcount, pdocs=pdocs, psdict=psdict)
+                                 pcount=pcount, pdocs=pdocs, psdict=psdict,
+                                 previous_cursor=kwargs.get('previous_cursor'),
+                                 next_cursor=kwargs.get('next_cursor'))
     stat_html = self.render_html('partials/problem_stat.html', pcount=pcount)
     lucky_html = self.render_html('partials/problem_lucky.html', category=category)
     path_html = self.render_html('partials/path.html', path_components=kwargs['path_components'])
@@ -58,25 +66,24 @@ class ProblemMainHandler(base.OperationHandler):
   @base.require_perm(builtin.PERM_VIEW_PROBLEM)
   @base.get_argument
   @base.sanitize
-  async def get(self, *, page: int=1):
-    # TODO(iceboy): projection.
+  async def get(self, *, page: int=1, cursor: str=None):
     if not self.has_perm(builtin.PERM_VIEW_PROBLEM_HIDDEN):
       f = {'hidden': False}
     else:
       f = {}
-    pdocs, ppcount, pcount = await pagination.paginate(problem.get_multi(domain_id=self.domain_id,
-                                                                         **f) \
-                                                              .sort([('pname', 1), ('doc_id', 1)]),
-                                                       page, self.PROBLEMS_PER_PAGE)
+    pdocs, ppcount, pcount, previous_cursor, next_cursor = await pagination.paginate_by_key(
+        get_multi_problem_list, problem.count, [('pname', 1), ('doc_id', 1)],
+        page, self.PROBLEMS_PER_PAGE, cursor, domain_id=self.domain_id, **f)
     if self.has_priv(builtin.PRIV_USER_PROFILE):
-      # TODO(iceboy): projection.
       psdict = await problem.get_dict_status(self.domain_id,
                                              self.user['_id'],
-                                             (pdoc['doc_id'] for pdoc in pdocs))
+                                             (pdoc['doc_id'] for pdoc in pdocs),
+                                             fields=problem.PROJECTION_STATUS_LIST)
     else:
       psdict = None
     await render_or_json_problem_list(self, page=page, ppcount=ppcount, pcount=pcount,
-                                      pdocs=pdocs, category='', psdict=psdict)
+                                      pdocs=pdocs, category='', psdict=psdict,
+                                      previous_cursor=previous_cursor, next_cursor=next_cursor)
 
   @base.require_priv(builtin.PRIV_USER_PROFILE)
   @base.require_csrf_token
@@ -138,23 +145,20 @@ class ProblemCategoryHandler(base.OperationHandler):
   @base.get_argument
   @base.route_argument
   @base.sanitize
-  async def get(self, *, category: str, page: int=1):
-    # TODO(iceboy): projection.
+  async def get(self, *, category: str, page: int=1, cursor: str=None):
     if not self.has_perm(builtin.PERM_VIEW_PROBLEM_HIDDEN):
       f = {'hidden': False}
     else:
       f = {}
     query = ProblemCategoryHandler.build_query(category)
-    pdocs, ppcount, pcount = await pagination.paginate(problem.get_multi(domain_id=self.domain_id,
-                                                                         **query,
-                                                                         **f) \
-                                                              .sort([('pname', 1)]),
-                                                       page, self.PROBLEMS_PER_PAGE)
+    pdocs, ppcount, pcount, previous_cursor, next_cursor = await pagination.paginate_by_key(
+        get_multi_problem_list, problem.count, [('pname', 1), ('doc_id', 1)],
+        page, self.PROBLEMS_PER_PAGE, cursor, domain_id=self.domain_id, **query, **f)
     if self.has_priv(builtin.PRIV_USER_PROFILE):
-      # TODO(iceboy): projection.
       psdict = await problem.get_dict_status(self.domain_id,
                                              self.user['_id'],
-                                             (pdoc['doc_id'] for pdoc in pdocs))
+                                             (pdoc['doc_id'] for pdoc in pdocs),
+                                             fields=problem.PROJECTION_STATUS_LIST)
     else:
       psdict = None
     page_title = category or self.translate('(All Problems)')
@@ -163,7 +167,8 @@ class ProblemCategoryHandler(base.OperationHandler):
         (page_title, None))
     await render_or_json_problem_list(self, page=page, ppcount=ppcount, pcount=pcount,
                                       pdocs=pdocs, category=category, psdict=psdict,
-                                      page_title=page_title, path_components=path_components)
+                                      page_title=page_title, path_components=path_components,
+                                      previous_cursor=previous_cursor, next_cursor=next_cursor)
 
 
 @app.route('/p/category/{category:[^/]*}/random', 'problem_category_random')
@@ -203,6 +208,7 @@ class ProblemDetailHandler(base.OperationHandler):
     return None
 
   @base.require_perm(builtin.PERM_VIEW_PROBLEM)
+  @base.guest_cache
   @base.route_argument
   @base.sanitize
   async def get(self, *, pid: document.convert_doc_id):
@@ -368,14 +374,14 @@ class ProblemSolutionHandler(base.OperationHandler):
   @base.get_argument
   @base.route_argument
   @base.sanitize
-  async def get(self, *, pid: document.convert_doc_id, page: int=1):
+  async def get(self, *, pid: document.convert_doc_id, page: int=1, cursor: str=None):
     uid = self.user['_id'] if self.has_priv(builtin.PRIV_USER_PROFILE) else None
     pdoc = await problem.get(self.domain_id, pid, uid)
     if pdoc.get('hidden', False):
       self.check_perm(builtin.PERM_VIEW_PROBLEM_HIDDEN)
-    psdocs, pcount, pscount = await pagination.paginate(
-        problem.get_multi_solution(self.domain_id, pdoc['doc_id']),
-        page, self.SOLUTIONS_PER_PAGE)
+    psdocs, pcount, pscount, previous_cursor, next_cursor = await pagination.paginate_by_key(
+        problem.get_multi_solution, problem.count_solution, [('vote', -1), ('doc_id', -1)],
+        page, self.SOLUTIONS_PER_PAGE, cursor, domain_id=self.domain_id, pid=pdoc['doc_id'])
     uids = {pdoc['owner_uid']}
     uids.update(psdoc['owner_uid'] for psdoc in psdocs)
     for psdoc in psdocs:
@@ -393,6 +399,7 @@ class ProblemSolutionHandler(base.OperationHandler):
         (self.translate('problem_solution'), None))
     self.render('problem_solution.html', path_components=path_components,
                 pdoc=pdoc, psdocs=psdocs, page=page, pcount=pcount, pscount=pscount,
+                previous_cursor=previous_cursor, next_cursor=next_cursor,
                 udict=udict, dudict=dudict, pssdict=pssdict)
 
   @base.require_priv(builtin.PRIV_USER_PROFILE)
@@ -568,6 +575,25 @@ class ProblemDataHandler(base.Handler):
                                    secret=fdoc['metadata']['secret']))
 
 
+@app.route('/p/{pid}/data/manifest', 'problem_data_manifest')
+class ProblemDataManifestHandler(base.Handler):
+  @base.route_argument
+  @base.sanitize
+  async def get(self, *, pid: document.convert_doc_id):
+    pdoc = await problem.get(self.domain_id, pid)
+    if type(pdoc['data']) is dict:
+      return self.redirect(self.reverse_url('problem_data_manifest',
+                           domain_id=pdoc['data']['domain'],
+                           pid=pdoc['data']['pid']))
+    if (not self.own(pdoc, builtin.PERM_READ_PROBLEM_DATA_SELF)
+        and not self.has_perm(builtin.PERM_READ_PROBLEM_DATA)):
+      self.check_priv(builtin.PRIV_READ_PROBLEM_DATA)
+    if not pdoc.get('data'):
+      raise error.ProblemDataNotFoundError(self.domain_id, pid)
+    mdoc = await blob.get_manifest(pdoc['data'])
+    self.json({'md5': mdoc['md5'], 'files': mdoc['files']})
+
+
 @app.route('/problem/create', 'problem_create')
 class ProblemCreateHandler(base.Handler):
   @base.require_priv(builtin.PRIV_USER_PROFILE)
@@ -762,8 +788,14 @@ class ProblemUploadHandler(base.Handler):
     if (not self.own(pdoc, builtin.PERM_READ_PROBLEM_DATA_SELF)
         and not self.has_perm(builtin.PERM_READ_PROBLEM_DATA)):
       self.check_priv(builtin.PRIV_READ_PROBLEM_DATA)
+    try:
+      await blob.add_manifest(file)
+    except Exception:
+      await fs.unlink(file)
+      raise
     if pdoc.get('data') and type(pdoc['data']) is objectid.ObjectId:
-      await fs.unlink(pdoc['data'])
+      if await fs.unlink(pdoc['data']):
+        await blob.delete_manifest(pdoc['data'])
     await problem.set_data(self.domain_id, pid, file)
     self.json_or_redirect(self.url)
 
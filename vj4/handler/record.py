@@ -1,7 +1,5 @@
 import asyncio
-import calendar
 import datetime
-import struct
 import urllib.parse
 from bson import objectid
 
@@ -14,6 +12,7 @@ from vj4.model import document
 from vj4.model import domain
 from vj4.model import fs
 from vj4.model import record
+from vj4.model import recordstat
 from vj4.model import user
 from vj4.model.adaptor import contest
 from vj4.model.adaptor import problem
@@ -80,17 +79,9 @@ class RecordMainHandler(RecordMixin, base.Handler):
     # statistics
     statistics = None
     if self.has_priv(builtin.PRIV_VIEW_JUDGE_STATISTICS):
-      ts = calendar.timegm(datetime.datetime.utcnow().utctimetuple())
-      day_count, week_count, month_count, year_count, rcount = await asyncio.gather(
-          record.get_count(objectid.ObjectId(
-              struct.pack('>i', ts - 24 * 3600) + struct.pack('b', -1) * 8)),
-          record.get_count(objectid.ObjectId(
-              struct.pack('>i', ts - 7 * 24 * 3600) + struct.pack('b', -1) * 8)),
-          record.get_count(objectid.ObjectId(
-              struct.pack('>i', ts - 30 * 24 * 3600) + struct.pack('b', -1) * 8)),
-          record.get_count(objectid.ObjectId(
-              struct.pack('>i', ts - int(365.2425 * 24 * 3600)) + struct.pack('b', -1) * 8)),
-          record.get_count())
+      day_count, week_count, month_count, year_count, rcount = await recordstat.get_counts(
+          datetime.timedelta(days=1), datetime.timedelta(days=7), datetime.timedelta(days=30),
+          datetime.timedelta(days=365.2425), None)
       statistics = {'day': day_count, 'week': week_count, 'month': month_count,
                     'year': year_count, 'total': rcount}
     url_prefix = '/d/{}'.format(urllib.parse.quote(self.domain_id))
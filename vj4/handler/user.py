@@ -13,9 +13,9 @@ from vj4.model import user
 from vj4.model.adaptor import discussion
 from vj4.model.adaptor import problem
 from vj4.model.adaptor import setting
+from vj4.service import ranking
 from vj4.util import misc
 from vj4.util import options
-from vj4.util import pagination
 from vj4.util import validator
 from vj4.handler import base
 
@@ -186,8 +186,12 @@ class UserDetailHandler(base.Handler, UserSettingsMixin):
     udoc = await user.get_by_uid(uid)
     if not udoc:
       raise error.UserNotFoundError(uid)
-    dudoc, sdoc = await asyncio.gather(domain.get_user(self.domain_id, udoc['_id']),
-                                       token.get_most_recent_session_by_uid(udoc['_id']))
+    dudoc, sdoc, rank_index = await asyncio.gather(
+        domain.get_user(self.domain_id, udoc['_id']),
+        token.get_most_recent_session_by_uid(udoc['_id']),
+        ranking.get_index(self.domain_id))
+    if dudoc and udoc['_id'] in rank_index:
+      dudoc['rank'] = rank_index.rank_of(udoc['_id'])
 
     rdocs = record.get_multi(get_hidden=self.has_priv(builtin.PRIV_VIEW_HIDDEN_RECORD),
                              uid=uid).sort([('_id', -1)])
@@ -264,8 +268,17 @@ class RankHandler(base.Handler):
   @base.route_argument
   @base.sanitize
   async def get(self, *, page: int=1):
-    udocs, uucount, ucount = await pagination.paginate(domain.get_multi_user(domain_id=self.domain_id).sort([('rank', 1)]),
-                                                       page, self.USERS_PER_PAGE)
-    for udoc in udocs:
-      udoc['info'] = await user.get_by_uid(udoc['uid'])
+    if page <= 0:
+      raise error.ValidationError('page')
+    rank_index = await ranking.get_index(self.domain_id)
+    ucount = len(rank_index)
+    uucount = (ucount + self.USERS_PER_PAGE - 1) // self.USERS_PER_PAGE
+    ranked = rank_index.page(page, self.USERS_PER_PAGE)
+    uids = [uid for _, uid, _ in ranked]
+    udict, dudict = await asyncio.gather(user.get_dict(uids),
+                                         domain.get_dict_user_by_uid(self.domain_id, uids))
+    udocs = []
+    for rank, uid, rp in ranked:
+      udocs.append({**dudict.get(uid, {'uid': uid}),
+                    'rank': rank, 'rp': rp, 'info': udict.get(uid)})
     self.render('domain_ranking.html', page=page, uucount=uucount, ucount=ucount, udocs=udocs)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import array
 import asyncio
 import logging
 import math
@@ -9,16 +10,24 @@ from vj4.model import document
 from vj4.model.adaptor import problem
 from vj4.util import argmethod
 from vj4.util import domainjob
+from vj4.util import options
 
+options.define('difficulty_flush_delay_seconds', default=10.0,
+               help='Delay of batched problem difficulty updates, in seconds.')
 
 _logger = logging.getLogger(__name__)
 
 
-_CACHE_INFO = {
-  'last_s': 0.0,
-  'last_y': 0,
-  'values': [0.0]
-}
+_DX = 0.1
+_DT = 2
+
+# (domain_id, pid) of problems whose difficulty needs to be updated in the next flush.
+_dirty_pids = set()
+_flush_scheduled = False
+
+# _table[k] is the integral after k steps of _DX, each step covering _DT submissions. The sum
+# converges to its floating point limit within a few hundred steps, so the table stops there.
+_table = None
 
 
 @argmethod.wrap
@@ -27,47 +36,41 @@ def _LOGP(x: float):
   return math.exp(-1.0 * pow(math.log(x, math.e), 2) / 0.5) / x / 0.5 / sqrt_2_pi
 
 
-@argmethod.wrap
-def _integrate_ensure_cache(y: int):
-  last_y = _CACHE_INFO['last_y']
-  if y <= last_y:
-    return _CACHE_INFO
-  s = _CACHE_INFO['last_s']
-  dx = 0.1
-  dT = 2
-  x0 = last_y / dT * dx
-  while y > last_y:
-    x0 += dx
-    s += _LOGP(x0) * dx
-    for i in range(dT):
-      _CACHE_INFO['values'].append(s)
-    last_y += dT
-  _CACHE_INFO['last_y'] = last_y
-  _CACHE_INFO['last_s'] = s
-  return _CACHE_INFO
-
-
-_integrate_ensure_cache(1000000)
+def _ensure_table():
+  global _table
+  if _table is not None:
+    return _table
+  table = array.array('d', [0.0])
+  s = 0.0
+  x0 = 0.0
+  while True:
+    x0 += _DX
+    ds = _LOGP(x0) * _DX
+    # _LOGP is decreasing after its mode (below 1.0), so no later step can change the sum either.
+    if x0 > 1.0 and s + ds == s:
+      break
+    s += ds
+    table.append(s)
+  _table = table
+  return _table
 
 
 @argmethod.wrap
 def _integrate_direct(y: int):
   last_y = 0
   s = 0.0
-  dx = 0.1
-  dT = 2
-  x0 = last_y / dT * dx
+  x0 = 0.0
   while y > last_y:
-    x0 += dx
-    s += _LOGP(x0) * dx
-    last_y += dT
+    x0 += _DX
+    s += _LOGP(x0) * _DX
+    last_y += _DT
   return s
 
 
 @argmethod.wrap
 def _integrate(y: int):
-  _integrate_ensure_cache(y)
-  return _CACHE_INFO['values'][y]
+  table = _ensure_table()
+  return table[min((y + _DT - 1) // _DT, len(table) - 1)]
 
 
 @argmethod.wrap
@@ -98,13 +101,86 @@ def _get_difficulty(pdoc, calculated_difficulty):
     return calculated_difficulty
 
 
+def _get_update(pdoc):
+  """Returns the difficulty fields to set, or None if they are unchanged."""
+  difficulty_algo = difficulty_altorithm(pdoc['num_submit'], pdoc['num_accept'])
+  difficulty = _get_difficulty(pdoc, difficulty_algo)
+  if pdoc.get('difficulty') == difficulty and pdoc.get('difficulty_algo') == difficulty_algo:
+    return None
+  return {'difficulty': difficulty, 'difficulty_algo': difficulty_algo}
+
+
 @argmethod.wrap
 async def update_problem(domain_id: str, pid: document.convert_doc_id):
   pdoc = await problem.get(domain_id, pid)
-  difficulty_algo = difficulty_altorithm(pdoc['num_submit'], pdoc['num_accept'])
-  difficulty = _get_difficulty(pdoc, difficulty_algo)
-  return await problem.edit(domain_id, pdoc['doc_id'], difficulty=difficulty,
-                            difficulty_algo=difficulty_algo)
+  update = _get_update(pdoc)
+  if not update:
+    return pdoc
+  return await problem.edit(domain_id, pdoc['doc_id'], **update)
+
+
+def update_problem_later(domain_id, pid):
+  """Marks the difficulty of a problem to be updated in the next batched flush."""
+  _dirty_pids.add((domain_id, pid))
+  _schedule_flush()
+
+
+async def _flush_later():
+  global _flush_scheduled
+  await asyncio.sleep(options.difficulty_flush_delay_seconds)
+  _flush_scheduled = False
+  try:
+    await flush()
+  except Exception as e:
+    _logger.exception(e)
+    _schedule_flush()
+
+
+def _schedule_flush():
+  global _flush_scheduled
+  if not _flush_scheduled:
+    _flush_scheduled = True
+    asyncio.get_event_loop().create_task(_flush_later())
+
+
+async def flush():
+  """Update the difficulty of marked problems. They are marked again if the update fails."""
+  pdom_and_ids = list(_dirty_pids)
+  _dirty_pids.clear()
+  if not pdom_and_ids:
+    return
+  flushed = False
+  try:
+    await _update_multi(pdom_and_ids)
+    flushed = True
+  finally:
+    if not flushed:
+      _dirty_pids.update(pdom_and_ids)
+
+
+async def _update_multi(pdom_and_ids):
+  pdict = await problem.get_dict_multi_domain(pdom_and_ids,
+                                              fields={'_id': 1,
+                                                      'domain_id': 1,
+                                                      'doc_id': 1,
+                                                      'num_submit': 1,
+                                                      'num_accept': 1,
+                                                      'difficulty': 1,
+                                                      'difficulty_algo': 1,
+                                                      'difficulty_setting': 1,
+                                                      'difficulty_admin': 1})
+  # Counters of problems just judged are usually not folded yet.
+  await problem.fill_counts(pdict.values())
+  coll = db.coll('document')
+  bulk = coll.initialize_unordered_bulk_op()
+  execute = False
+  for pdoc in pdict.values():
+    update = _get_update(pdoc)
+    if update:
+      bulk.find({'_id': pdoc['_id']}).update_one({'$set': update})
+      execute = True
+  if execute:
+    await bulk.execute()
 
 
 @domainjob.wrap
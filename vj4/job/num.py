@@ -5,6 +5,7 @@ from vj4 import db
 from vj4.model import builtin
 from vj4.model import domain
 from vj4.model import document
+from vj4.model import shardcount
 from vj4.model.adaptor import discussion
 from vj4.util import argmethod
 from vj4.util import domainjob
@@ -59,6 +60,7 @@ async def contest(domain_id: str):
     }
   ]
   coll = db.coll('document')
+  await shardcount.delete_multi(domain_id, document.TYPE_CONTEST, ['attend'])
   await coll.update_many({'domain_id': domain_id, 'doc_type': document.TYPE_CONTEST},
                          {'$set': {'attend': 0}})
   bulk = coll.initialize_unordered_bulk_op()
@@ -9,6 +9,7 @@ from vj4.model import builtin
 from vj4.model import domain
 from vj4.model import document
 from vj4.model import record
+from vj4.model import shardcount
 from vj4.model import user
 from vj4.model.adaptor import problem
 from vj4.util import argmethod
@@ -61,6 +62,7 @@ async def run(domain_id: str):
     {'domain_id': domain_id, 'doc_type': document.TYPE_PROBLEM},
     {'$unset': {'journal': '', 'rev': '', 'status': '', 'rid': '',
                 'num_submit': '', 'num_accept': ''}})
+  await shardcount.delete_multi(domain_id, document.TYPE_PROBLEM, ['num_submit', 'num_accept'])
   pdocs = problem.get_multi(domain_id=domain_id, fields={'_id': 1, 'doc_id': 1}).sort('doc_id', 1)
   dudoc_factory = functools.partial(dict, num_submit=0, num_accept=0)
   dudoc_updates = collections.defaultdict(dudoc_factory)
@@ -4,6 +4,7 @@ from vj4 import db
 from vj4 import constant
 from vj4.model import document
 from vj4.model.adaptor import problem
+from vj4.service import ranking
 from vj4.util import argmethod
 from vj4.util import domainjob
 
@@ -96,6 +97,7 @@ async def update_problem(domain_id: str, pid: document.convert_doc_id):
   if execute:
     _logger.info('Committing')
     await user_bulk.execute()
+    await ranking.notify_rp_change(domain_id, dudoc_incs.keys())
 
 @domainjob.wrap
 async def recalc(domain_id: str):
@@ -138,6 +140,7 @@ async def recalc(domain_id: str):
   if execute:
     _logger.info('Committing')
     await user_bulk.execute()
+  await ranking.notify_rp_reset(domain_id)
 
 
 if __name__ == '__main__':
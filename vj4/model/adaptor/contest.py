@@ -11,9 +11,12 @@ from vj4 import constant
 from vj4 import error
 from vj4.model import builtin
 from vj4.model import document
+from vj4.model import record
+from vj4.model import shardcount
 from vj4.model import user
 from vj4.model import domain
 from vj4.model.adaptor import problem
+from vj4.service import countcache
 from vj4.util import argmethod
 from vj4.util import misc
 from vj4.util import rank
@@ -27,7 +30,12 @@ Rule = collections.namedtuple('Rule', ['show_record_func',
                                        'stat_func',
                                        'status_sort',
                                        'rank_func',
-                                       'scoreboard_func'])
+                                       'scoreboard_func',
+                                       'update_func'])
+# update_func(tdoc, tsdoc, journal, pid) returns the stats with those of the problem recomputed from
+# the journal, which is only valid if problems contribute independently. Without it, stats are
+# recomputed from the whole journal.
+Rule.__new__.__defaults__ = (None,)
 
 
 def _oi_stat(tdoc, journal):
@@ -85,6 +93,17 @@ def _assignment_stat(tdoc, journal):
           'detail': detail}
 
 
+def _update_problem_stat(stat_func, sum_keys, tdoc, tsdoc, journal, pid):
+  if pid not in tdoc['pids']:
+    return {key: tsdoc.get(key, 0) for key in sum_keys}
+  ptdoc = {**tdoc, 'pids': [pid]}
+  old = stat_func(ptdoc, [j for j in tsdoc.get('journal', []) if j['pid'] == pid])
+  new = stat_func(ptdoc, [j for j in journal if j['pid'] == pid])
+  stats = {key: tsdoc.get(key, 0) - old[key] + new[key] for key in sum_keys}
+  stats['detail'] = [d for d in tsdoc.get('detail', []) if d['pid'] != pid] + new['detail']
+  return stats
+
+
 def _oi_equ_func(a, b):
   return a.get('score', 0) == b.get('score', 0)
 
@@ -248,19 +267,24 @@ RULES = {
                                  _oi_stat,
                                  [('score', -1)],
                                  functools.partial(rank.ranked, equ_func=_oi_equ_func),
-                                 _oi_scoreboard),
+                                 _oi_scoreboard,
+                                 functools.partial(_update_problem_stat, _oi_stat, ['score'])),
   constant.contest.RULE_ACM: Rule(lambda tdoc, now: now >= tdoc['begin_at'],
                                   lambda tdoc, now: now >= tdoc['begin_at'],
                                   _acm_stat,
                                   [('accept', -1), ('time', 1)],
                                   functools.partial(enumerate, start=1),
-                                  _acm_scoreboard),
+                                  _acm_scoreboard,
+                                  functools.partial(_update_problem_stat, _acm_stat,
+                                                    ['accept', 'time'])),
   constant.contest.RULE_ASSIGNMENT: Rule(lambda tdoc, now: now >= tdoc['begin_at'],
                                          lambda tdoc, now: False,  # TODO: show scoreboard according to assignment preference
                                          _assignment_stat,
                                          [('penalty_score', -1), ('time', 1)],
                                          functools.partial(enumerate, start=1),
-                                         _assignment_scoreboard),
+                                         _assignment_scoreboard,
+                                         functools.partial(_update_problem_stat, _assignment_stat,
+                                                           ['score', 'penalty_score', 'time'])),
 }
 
 
@@ -306,7 +330,12 @@ async def get(domain_id: str, doc_type: int, tid: objectid.ObjectId):
   tdoc = await document.get(domain_id, doc_type, tid)
   if not tdoc:
     raise error.DocumentNotFoundError(domain_id, doc_type, tid)
-  return tdoc
+  return await shardcount.fill(tdoc, 'attend')
+
+
+async def fill_counts(tdocs):
+  """Add attendances not folded yet to the contest documents."""
+  return await shardcount.fill_multi(tdocs, 'attend')
 
 
 async def edit(domain_id: str, doc_type: int, tid: objectid.ObjectId, **kwargs):
@@ -334,6 +363,14 @@ async def edit(domain_id: str, doc_type: int, tid: objectid.ObjectId, **kwargs):
   return await document.set(domain_id, doc_type, tid, **kwargs)
 
 
+async def count(domain_id: str, doc_type: int, **kwargs):
+  if doc_type not in [document.TYPE_CONTEST, document.TYPE_HOMEWORK]:
+    raise error.InvalidArgumentError('doc_type')
+  return await countcache.count('document', {'domain_id': domain_id,
+                                             'doc_type': doc_type,
+                                             **kwargs})
+
+
 def get_multi(domain_id: str, doc_type: int, fields=None, **kwargs):
   # TODO(twd2): projection.
   if doc_type not in [document.TYPE_CONTEST, document.TYPE_HOMEWORK]:
@@ -358,7 +395,8 @@ async def attend(domain_id: str, doc_type: int, tid: objectid.ObjectId, uid: int
       raise error.ContestAlreadyAttendedError(domain_id, tid, uid) from None
     elif doc_type == document.TYPE_HOMEWORK:
       raise error.HomeworkAlreadyAttendedError(domain_id, tid, uid) from None
-  return await document.inc(domain_id, doc_type, tid, 'attend', 1)
+  await shardcount.inc(domain_id, doc_type, tid, 'attend', 1)
+  return await shardcount.fill(await document.get(domain_id, doc_type, tid), 'attend')
 
 
 @argmethod.wrap
@@ -404,36 +442,86 @@ async def get_and_list_status(domain_id: str, doc_type: int, tid: objectid.Objec
   return tdoc, tsdocs
 
 
-def _get_status_journal(tsdoc):
+def _get_status_journal(journal):
   # Sort and uniquify journal of the contest status document, by rid.
-  return [list(g)[-1] for _, g in itertools.groupby(sorted(tsdoc['journal'], key=journal_key_func),
+  return [list(g)[-1] for _, g in itertools.groupby(sorted(journal, key=journal_key_func),
                                                     key=journal_key_func)]
 
 
+def _compact_journal(journal):
+  """Drop journal entries which no rule needs, so that the journal does not grow with every
+  submission. Entries until the first accept and the last entry of each problem are kept. Entries of
+  the same problem must be in order of rid.
+  """
+  last_rids = {j['pid']: j['rid'] for j in journal}
+  accepted = set()
+  result = []
+  for j in journal:
+    if j['pid'] not in accepted or j['rid'] == last_rids[j['pid']]:
+      result.append(j)
+    if j['accept']:
+      accepted.add(j['pid'])
+  return result
+
+
+async def _get_record_journal(domain_id, tdoc, uid):
+  journal = []
+  async for rdoc in record.get_multi(get_hidden=True,
+                                     domain_id=domain_id,
+                                     tid=tdoc['doc_id'],
+                                     uid=uid,
+                                     type=constant.record.TYPE_SUBMISSION,
+                                     status={'$nin': [constant.record.STATUS_WAITING,
+                                                      constant.record.STATUS_FETCHED,
+                                                      constant.record.STATUS_JUDGING]},
+                                     fields={'_id': 1, 'pid': 1, 'status': 1, 'score': 1}) \
+                           .sort('_id', 1):
+    journal.append({'rid': rdoc['_id'], 'pid': rdoc['pid'],
+                    'accept': rdoc['status'] == constant.record.STATUS_ACCEPTED,
+                    'score': rdoc['score']})
+  return journal
+
+
 @argmethod.wrap
 async def update_status(domain_id: str, doc_type: int, tid: objectid.ObjectId, uid: int,
                         rid: objectid.ObjectId, pid: document.convert_doc_id,
-                        accept: bool, score: int):
-  """This method returns None when the modification has been superseded by a parallel operation."""
+                        accept: bool, score: int, rejudged: bool=False):
+  """Apply a record to the contest status of the user.
+
+  Only entries and stats of the problem are recomputed if the rule has update_func. The stats are
+  rebuilt from all records of the user when the record is rejudged, since the journal is compacted.
+  """
   if doc_type not in [document.TYPE_CONTEST, document.TYPE_HOMEWORK]:
     raise error.InvalidArgumentError('doc_type')
   tdoc = await document.get(domain_id, doc_type, tid)
-  tsdoc = await document.rev_push_status(
-    domain_id, tdoc['doc_type'], tdoc['doc_id'], uid,
-    'journal', {'rid': rid, 'pid': pid, 'accept': accept, 'score': score})
-  if 'attend' not in tsdoc or not tsdoc['attend']:
-    if tdoc['doc_type'] == document.TYPE_CONTEST:
-      raise error.ContestNotAttendedError(domain_id, tid, uid)
-    elif tdoc['doc_type'] == document.TYPE_HOMEWORK:
-      raise error.HomeworkNotAttendedError(domain_id, tid, uid)
+  rule = RULES[tdoc['rule']]
+  jdoc = {'rid': rid, 'pid': pid, 'accept': accept, 'score': score}
+  while True:
+    tsdoc = await document.get_status(domain_id, tdoc['doc_type'], tdoc['doc_id'], uid)
+    if not tsdoc or not tsdoc.get('attend'):
+      if tdoc['doc_type'] == document.TYPE_CONTEST:
+        raise error.ContestNotAttendedError(domain_id, tid, uid)
+      elif tdoc['doc_type'] == document.TYPE_HOMEWORK:
+        raise error.HomeworkNotAttendedError(domain_id, tid, uid)
+      else:
+        raise error.InvalidArgumentError('doc_type')
+
+    journal = tsdoc.get('journal', [])
+    if rejudged:
+      journal = _compact_journal(await _get_record_journal(domain_id, tdoc, uid))
+      stats = rule.stat_func(tdoc, journal)
+    elif rule.update_func:
+      journal = [j for j in journal if j['pid'] != pid] + _compact_journal(_get_status_journal(
+          [j for j in journal if j['pid'] == pid] + [jdoc]))
+      stats = rule.update_func(tdoc, tsdoc, journal, pid)
     else:
-      raise error.InvalidArgumentError('doc_type')
-
-  journal = _get_status_journal(tsdoc)
-  stats = RULES[tdoc['rule']].stat_func(tdoc, journal)
-  tsdoc = await document.rev_set_status(domain_id, tdoc['doc_type'], tid, uid, tsdoc['rev'],
-                                        journal=journal, **stats)
-  return tsdoc
+      journal = _compact_journal(_get_status_journal(journal + [jdoc]))
+      stats = rule.stat_func(tdoc, journal)
+    tsdoc = await document.rev_set_status(domain_id, tdoc['doc_type'], tid, uid, tsdoc.get('rev'),
+                                          journal=journal, **stats)
+    if tsdoc:
+      return tsdoc
+    # Superseded by a parallel update, so apply the record again.
 
 
 @argmethod.wrap
@@ -447,7 +535,7 @@ async def recalc_status(domain_id: str, doc_type: int, tid: objectid.ObjectId):
     async for tsdoc in tsdocs:
       if 'journal' not in tsdoc or not tsdoc['journal']:
         continue
-      journal = _get_status_journal(tsdoc)
+      journal = _compact_journal(_get_status_journal(tsdoc['journal']))
       stats = RULES[tdoc['rule']].stat_func(tdoc, journal)
       await document.rev_set_status(domain_id, doc_type, tid, tsdoc['uid'], tsdoc['rev'],
                                     return_doc=False, journal=journal, **stats)
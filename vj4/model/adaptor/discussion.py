@@ -7,7 +7,9 @@ from pymongo import errors
 from vj4 import error
 from vj4.model import builtin
 from vj4.model import document
+from vj4.service import countcache
 from vj4.service import smallcache
+from vj4.service import viewcount
 from vj4.util import argmethod
 from vj4.util import validator
 
@@ -167,16 +169,18 @@ async def delete(domain_id: str, did: document.convert_doc_id):
 
 @argmethod.wrap
 async def inc_views(domain_id: str, did: document.convert_doc_id):
-  doc = await document.inc(domain_id, document.TYPE_DISCUSSION, did, 'views', 1)
+  doc = await document.get(domain_id, document.TYPE_DISCUSSION, did)
   if not doc:
     raise error.DiscussionNotFoundError(domain_id, did)
+  doc['views'] += await viewcount.inc(domain_id, document.TYPE_DISCUSSION, doc['doc_id'])
   return doc
 
 
 @argmethod.wrap
 async def count(domain_id: str, **kwargs):
-  return await document.get_multi(domain_id=domain_id, doc_type=document.TYPE_DISCUSSION,
-                                  **kwargs).count()
+  return await countcache.count('document', {'domain_id': domain_id,
+                                             'doc_type': document.TYPE_DISCUSSION,
+                                             **kwargs})
 
 
 @argmethod.wrap
@@ -9,10 +9,13 @@ from vj4 import constant
 from vj4 import db
 from vj4 import error
 from vj4.model import builtin
+from vj4.model import datachange
 from vj4.model import document
 from vj4.model import domain
 from vj4.model import fs
+from vj4.model import shardcount
 from vj4.service import bus
+from vj4.service import countcache
 from vj4.util import argmethod
 from vj4.util import validator
 
@@ -27,6 +30,27 @@ SETTING_DIFFICULTY_RANGE = collections.OrderedDict([
   (SETTING_DIFFICULTY_AVERAGE, 'Use average of above')
 ])
 
+PROJECTION_LIST = {
+  'domain_id': 1,
+  'doc_id': 1,
+  'pname': 1,
+  'title': 1,
+  'num_submit': 1,
+  'num_accept': 1,
+  'difficulty': 1,
+  'category': 1,
+  'tag': 1,
+  'hidden': 1
+}
+
+PROJECTION_STATUS_LIST = {
+  'domain_id': 1,
+  'doc_id': 1,
+  'rid': 1,
+  'status': 1,
+  'star': 1
+}
+
 
 @argmethod.wrap
 def get_categories():
@@ -45,17 +69,21 @@ async def add(domain_id: str, title: str, content: str, owner_uid: int,
     pid = int(pid)
   except ValueError:
     pass
+  if data and type(data) is not dict:
+    await datachange.add(domain_id, pid)
   if pname == "":
     pname = None
   if pname:
     validator.check_string_pname(pname)
     pid = await document.add(domain_id, content, owner_uid, document.TYPE_PROBLEM,
                              pid, pname=pname, title=title, data=data, category=category, tag=tag,
-                             hidden=hidden, num_submit=0, num_accept=0)
+                             hidden=hidden, num_submit=0, num_accept=0,
+                             random=random.random())
   else:
     pid = await document.add(domain_id, content, owner_uid, document.TYPE_PROBLEM,
                              pid, title=title, data=data, category=category, tag=tag,
-                             hidden=hidden, num_submit=0, num_accept=0)
+                             hidden=hidden, num_submit=0, num_accept=0,
+                             random=random.random())
   await domain.inc_user(domain_id, owner_uid, num_problems=1)
   return pid
 
@@ -83,6 +111,7 @@ async def get(domain_id: str, pid: document.convert_doc_id, uid: int = None):
   pdoc = await document.get(domain_id, document.TYPE_PROBLEM, pid)
   if not pdoc:
     raise error.ProblemNotFoundError(domain_id, pid)
+  await fill_counts([pdoc])
   if uid is not None:
     pdoc['psdoc'] = await document.get_status(domain_id, document.TYPE_PROBLEM,
                                               doc_id=pid, uid=uid)
@@ -102,7 +131,10 @@ async def edit(domain_id: str, pid: document.convert_doc_id, pname: str=None, **
     pname = None
   if pname:
     validator.check_string_pname(pname)
+    old_pdoc = await document.get(domain_id, document.TYPE_PROBLEM, pid, fields={'pname': 1})
     pdoc = await document.set(domain_id, document.TYPE_PROBLEM, pid, pname=pname, **kwargs)
+    if old_pdoc and old_pdoc.get('pname') and old_pdoc['pname'] != pname:
+      await document.unset_pid_cache(domain_id, old_pdoc['pname'])
   else:
     pdoc = await document.set(domain_id, document.TYPE_PROBLEM, pid, **kwargs)
   if not pdoc:
@@ -112,8 +144,9 @@ async def edit(domain_id: str, pid: document.convert_doc_id, pname: str=None, **
 
 @argmethod.wrap
 async def count(domain_id: str, **kwargs):
-  return await document.get_multi(domain_id=domain_id, doc_type=document.TYPE_PROBLEM,
-                                  **kwargs).count()
+  return await countcache.count('document', {'domain_id': domain_id,
+                                             'doc_type': document.TYPE_PROBLEM,
+                                             **kwargs})
 
 
 def get_multi(*, fields=None, **kwargs):
@@ -122,10 +155,15 @@ def get_multi(*, fields=None, **kwargs):
 
 @argmethod.wrap
 async def get_random_id(domain_id: str, **kwargs):
-  pdocs = document.get_multi(domain_id=domain_id, doc_type=document.TYPE_PROBLEM, **kwargs)
-  pcount = await pdocs.count()
-  if pcount:
-    async for pdoc in pdocs.skip(random.randrange(pcount)).limit(1):
+  # Probe the first problem whose random key is not less than a random value, and wrap around to
+  # the first problem if there is no such problem.
+  value = random.random()
+  for random_query in [{'$gte': value}, {'$lt': value}]:
+    pdocs = document.get_multi(domain_id=domain_id, doc_type=document.TYPE_PROBLEM,
+                               random=random_query, fields={'doc_id': 1}, **kwargs) \
+                    .sort([('random', 1)]) \
+                    .limit(1)
+    async for pdoc in pdocs:
       return pdoc['doc_id']
 
 
@@ -135,9 +173,15 @@ async def get_dict(domain_id, pids, *, fields=None, **kwargs):
                               doc_id={'$in': list(set(pids))},
                               fields=fields, **kwargs):
     result[pdoc['doc_id']] = pdoc
+  await fill_counts(result.values())
   return result
 
 
+async def fill_counts(pdocs):
+  """Add submissions and accepts not folded yet to the problem documents."""
+  return await shardcount.fill_multi(pdocs, 'num_submit', 'num_accept')
+
+
 async def get_dict_multi_domain(pdom_and_ids, *, fields=None):
   query = {'$or': []}
   key_func = lambda e: e[0]
@@ -162,7 +206,7 @@ async def get_status(domain_id: str, pid: document.convert_doc_id, uid: int, fie
 @argmethod.wrap
 async def inc_status(domain_id: str, pid: document.convert_doc_id, uid: int,
                      key: str, value: int):
-  pid = await document.get_pid(domain_id, pid)
+  pid = await document.get_pid(domain_id, pid, check_exists=True)
   return await document.inc_status(domain_id, document.TYPE_PROBLEM, pid, uid, key, value)
 
 
@@ -182,7 +226,7 @@ async def get_dict_status(domain_id, uid, pids, *, fields=None):
 
 @argmethod.wrap
 async def set_star(domain_id: str, pid: document.convert_doc_id, uid: int, star: bool):
-  pid = await document.get_pid(domain_id, pid)
+  pid = await document.get_pid(domain_id, pid, check_exists=True)
   return await document.set_status(domain_id, document.TYPE_PROBLEM, pid, uid, star=star)
 
 
@@ -211,15 +255,24 @@ async def set_solution(domain_id: str, psid: document.convert_doc_id, content: s
   return psdoc
 
 
-def get_multi_solution(domain_id: str, pid: document.convert_doc_id, fields=None):
+def get_multi_solution(domain_id: str, pid: document.convert_doc_id, fields=None, **kwargs):
   return document.get_multi(domain_id=domain_id,
                             doc_type=document.TYPE_PROBLEM_SOLUTION,
                             parent_doc_type=document.TYPE_PROBLEM,
                             parent_doc_id=pid,
-                            fields=fields) \
+                            fields=fields,
+                            **kwargs) \
                  .sort([('vote', -1), ('doc_id', -1)])
 
 
+async def count_solution(domain_id: str, pid: document.convert_doc_id, **kwargs):
+  return await countcache.count('document', {'domain_id': domain_id,
+                                             'doc_type': document.TYPE_PROBLEM_SOLUTION,
+                                             'parent_doc_type': document.TYPE_PROBLEM,
+                                             'parent_doc_id': pid,
+                                             **kwargs})
+
+
 def get_multi_solution_by_uid(domain_id: str, uid: int, fields=None):
   return document.get_multi(domain_id=domain_id,
                             doc_type=document.TYPE_PROBLEM_SOLUTION,
@@ -323,6 +376,7 @@ async def set_data(domain_id: str, pid: document.convert_doc_id, data: objectid.
   pdoc = await document.set(domain_id, document.TYPE_PROBLEM, pid, data=data)
   if not pdoc:
     raise error.DocumentNotFoundError(domain_id, document.TYPE_PROBLEM, pid)
+  await datachange.add(domain_id, pid)
   await bus.publish('problem_data_change', {'domain_id': domain_id, 'pid': pid})
   return pdoc
 
@@ -338,33 +392,35 @@ async def set_hidden(domain_id: str, pid: document.convert_doc_id, hidden: bool)
 
 @argmethod.wrap
 async def get_data_list(last: int):
+  """Get (domain_id, pid) of problems whose data has changed since the timestamp.
+
+  Problems copied from a changed problem are included since they share its data.
+  """
   last_datetime = datetime.datetime.utcfromtimestamp(last)
-  # TODO(twd2): performance improve, more elegant
-  coll = db.coll('document')
-  pdocs = coll.find({'doc_type': document.TYPE_PROBLEM})
   pids = []  # with domain_id
-  async for pdoc in pdocs:
-    data = await get_data(pdoc)
-    if not data:
-      continue
-    date = data['uploadDate']
-    if not date:
-      continue
-    if last_datetime < date:
+  async for cdoc in datachange.get_multi(last_datetime, fields={'domain_id': 1, 'pid': 1}):
+    pids.append((cdoc['domain_id'], cdoc['pid']))
+  query = {'$or': []}
+  key_func = lambda e: e[0]
+  for domain_id, ptuples in itertools.groupby(sorted(set(pids), key=key_func), key=key_func):
+    query['$or'].append({'data.domain': domain_id, 'data.pid': {'$in': [e[1] for e in ptuples]}})
+  if query['$or']:
+    async for pdoc in document.get_multi(**query, doc_type=document.TYPE_PROBLEM,
+                                         fields={'domain_id': 1, 'doc_id': 1}):
       pids.append((pdoc['domain_id'], pdoc['doc_id']))
   return list(set(pids))
 
 
 @argmethod.wrap
 async def inc(domain_id: str, pid: document.convert_doc_id, key: str, value: int):
-  pid = await document.get_pid(domain_id, pid)
-  return await document.inc(domain_id, document.TYPE_PROBLEM, pid, key, value)
+  pid = await document.get_pid(domain_id, pid, check_exists=True)
+  await shardcount.inc(domain_id, document.TYPE_PROBLEM, pid, key, value)
 
 
 @argmethod.wrap
 async def update_status(domain_id: str, pid: document.convert_doc_id, uid: int,
                         rid: objectid.ObjectId, status: int):
-  pid = await document.get_pid(domain_id, pid)
+  pid = await document.get_pid(domain_id, pid, check_exists=True)
   try:
     return await document.set_if_not_status(domain_id, document.TYPE_PROBLEM, pid, uid,
                                             'status', status, constant.record.STATUS_ACCEPTED,
@@ -27,7 +27,7 @@ async def delete(ip: str):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('blacklist')
-  await coll.create_index('expire_at', expireAfterSeconds=0)
+  await coll.create_index('expire_at', expireAfterSeconds=0, background=True)
 
 
 if __name__ == '__main__':
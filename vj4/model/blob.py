@@ -0,0 +1,242 @@
+"""Content-addressed storage of problem data.
+
+Each file in a problem data ZIP is stored once as a blob keyed by its SHA-256 digest. The ZIP is
+described by a manifest of file names and digests, so judges only fetch blobs they do not have.
+
+A blob is written under a new ID with its digest in metadata.sha256. Its document in blob.files is
+inserted after all chunks, so a blob whose write did not complete is never found. Blobs referenced
+by no manifest and manifests of deleted files are removed by gc.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
+import tempfile
+import zipfile
+
+from bson import objectid
+from gridfs import errors as gridfs_errors
+
+from vj4 import db
+from vj4 import error
+from vj4.model import fs
+from vj4.util import argmethod
+from vj4.util import options
+
+options.define('blob_hash_threads', default=2,
+               help='Number of threads to hash and extract problem data.')
+options.define('blob_gc_grace_seconds', default=86400,
+               help='Minimum age of blobs removed by gc when no manifest references them, '
+                    'in seconds.')
+
+CHUNK_SIZE = 2 ** 20
+GC_BATCH_SIZE = 1000
+
+_executor = None
+
+
+def _get_executor():
+  global _executor
+  if not _executor:
+    _executor = concurrent.futures.ThreadPoolExecutor(options.blob_hash_threads)
+  return _executor
+
+
+def _run(func, *args):
+  return asyncio.get_event_loop().run_in_executor(_get_executor(), func, *args)
+
+
+def _hash_zip(zip_file):
+  files = []
+  for info in zip_file.infolist():
+    if info.filename.endswith('/'):
+      continue
+    sha256 = hashlib.sha256()
+    with zip_file.open(info) as file_object:
+      chunk = file_object.read(CHUNK_SIZE)
+      while chunk:
+        sha256.update(chunk)
+        chunk = file_object.read(CHUNK_SIZE)
+    files.append({'name': info.filename, 'sha256': sha256.hexdigest(),
+                  'size': info.file_size})
+  return files
+
+
+async def _add_blob(sha256, zip_file, name):
+  # Members are copied one chunk at a time, so that a large ZIP is never held in memory.
+  grid_in = await db.fs('blob').new_file(content_type='application/octet-stream',
+                                         metadata={'sha256': sha256,
+                                                   'touched_at': datetime.datetime.utcnow()})
+  try:
+    with zip_file.open(name) as file_object:
+      chunk = await _run(file_object.read, CHUNK_SIZE)
+      while chunk:
+        await grid_in.write(chunk)
+        chunk = await _run(file_object.read, CHUNK_SIZE)
+    await grid_in.close()
+  except gridfs_errors.FileExists:
+    # Another upload has stored the same blob, so drop the chunks written. aiomongo raises this
+    # when the document of the blob violates the unique index on metadata.sha256.
+    await db.coll('blob.chunks').delete_many({'files_id': grid_in._id})
+  except Exception:
+    await db.coll('blob.chunks').delete_many({'files_id': grid_in._id})
+    raise
+
+
+async def _touch(sha256s):
+  coll = db.coll('blob.files')
+  await coll.update_many({'metadata.sha256': {'$in': list(sha256s)}},
+                         {'$set': {'metadata.touched_at': datetime.datetime.utcnow()}})
+
+
+async def get_multi_exist(sha256s):
+  """Get the set of digests whose blobs are stored."""
+  coll = db.coll('blob.files')
+  result = set()
+  async for doc in coll.find({'metadata.sha256': {'$in': list(sha256s)}},
+                             projection={'metadata.sha256': 1}):
+    result.add(doc['metadata']['sha256'])
+  return result
+
+
+async def get(sha256):
+  """Get a blob. Returns MotorGridOut."""
+  coll = db.coll('blob.files')
+  doc = await coll.find_one({'metadata.sha256': sha256}, projection={'_id': 1})
+  if not doc:
+    raise error.NotFoundError(sha256)
+  return await db.fs('blob').get(doc['_id'])
+
+
+async def _spool(file_id, file_object):
+  grid_out = await fs.get(file_id)
+  chunk = await grid_out.readchunk()
+  while chunk:
+    await _run(file_object.write, chunk)
+    chunk = await grid_out.readchunk()
+  return grid_out
+
+
+@argmethod.wrap
+async def add_manifest(file_id: objectid.ObjectId):
+  """Build the manifest of a ZIP file and store its new files as blobs.
+
+  The ZIP is spooled to a temporary file, and hashing and extracting run in a thread pool. Returns
+  the manifest.
+  """
+  with tempfile.TemporaryFile() as file_object:
+    grid_out = await _spool(file_id, file_object)
+    try:
+      with (await _run(zipfile.ZipFile, file_object)) as zip_file:
+        files = await _run(_hash_zip, zip_file)
+        names = {}
+        for file in files:
+          names.setdefault(file['sha256'], file['name'])
+        # Touch blobs before checking them, so that gc does not remove blobs found here.
+        await _touch(names.keys())
+        exist = await get_multi_exist(names.keys())
+        for sha256, name in names.items():
+          if sha256 not in exist:
+            await _add_blob(sha256, zip_file, name)
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError):
+      raise error.ValidationError('file')
+  coll = db.coll('problem.data_manifest')
+  mdoc = {'_id': file_id, 'md5': grid_out.md5, 'files': files}
+  await coll.replace_one({'_id': file_id}, mdoc, upsert=True)
+  return mdoc
+
+
+async def get_manifest(file_id):
+  """Get the manifest of a ZIP file, building it if the file was uploaded before manifests."""
+  coll = db.coll('problem.data_manifest')
+  mdoc = await coll.find_one({'_id': file_id})
+  if not mdoc:
+    mdoc = await add_manifest(file_id)
+  return mdoc
+
+
+async def delete_manifest(file_id):
+  """Delete the manifest of a ZIP file. Its blobs are removed by gc."""
+  coll = db.coll('problem.data_manifest')
+  await coll.delete_one({'_id': file_id})
+
+
+async def _delete_manifests_of_deleted_files():
+  coll = db.coll('problem.data_manifest')
+  file_ids = []
+  async for mdoc in coll.find({}, projection={'_id': 1}):
+    file_ids.append(mdoc['_id'])
+  for i in range(0, len(file_ids), GC_BATCH_SIZE):
+    batch = set(file_ids[i:i + GC_BATCH_SIZE])
+    async for fdoc in db.coll('fs.files').find({'_id': {'$in': list(batch)}},
+                                               projection={'_id': 1}):
+      batch.discard(fdoc['_id'])
+    if batch:
+      await coll.delete_many({'_id': {'$in': list(batch)}})
+
+
+async def _get_referenced():
+  pipeline = [
+    {'$unwind': '$files'},
+    {'$group': {'_id': '$files.sha256'}}
+  ]
+  result = set()
+  async for adoc in await db.coll('problem.data_manifest').aggregate(pipeline):
+    result.add(adoc['_id'])
+  return result
+
+
+async def _delete_orphan_chunks(cutoff):
+  # Chunks of writes that never completed, whose IDs were generated before the cutoff.
+  pipeline = [
+    {'$match': {'files_id': {'$lt': objectid.ObjectId.from_datetime(cutoff)}}},
+    {'$group': {'_id': '$files_id'}}
+  ]
+  files_ids = []
+  async for adoc in await db.coll('blob.chunks').aggregate(pipeline):
+    files_ids.append(adoc['_id'])
+  for i in range(0, len(files_ids), GC_BATCH_SIZE):
+    batch = set(files_ids[i:i + GC_BATCH_SIZE])
+    async for doc in db.coll('blob.files').find({'_id': {'$in': list(batch)}},
+                                                projection={'_id': 1}):
+      batch.discard(doc['_id'])
+    if batch:
+      await db.coll('blob.chunks').delete_many({'files_id': {'$in': list(batch)}})
+
+
+@argmethod.wrap
+async def gc():
+  """Remove manifests of deleted files, blobs referenced by no manifest and chunks of incomplete
+  writes. Blobs touched within blob_gc_grace_seconds are kept, since an upload may be about to
+  reference them.
+
+  Returns:
+    The number of blobs removed.
+  """
+  cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=options.blob_gc_grace_seconds)
+  await _delete_manifests_of_deleted_files()
+  referenced = await _get_referenced()
+  coll = db.coll('blob.files')
+  num_removed = 0
+  async for doc in coll.find({'metadata.touched_at': {'$lt': cutoff}},
+                             projection={'metadata.sha256': 1}):
+    if doc['metadata']['sha256'] in referenced:
+      continue
+    # Checks the time again, in case the blob is touched by an upload since it was found.
+    result = await coll.delete_one({'_id': doc['_id'], 'metadata.touched_at': {'$lt': cutoff}})
+    if result.deleted_count:
+      await db.coll('blob.chunks').delete_many({'files_id': doc['_id']})
+      num_removed += 1
+  await _delete_orphan_chunks(cutoff)
+  return num_removed
+
+
+@argmethod.wrap
+async def ensure_indexes():
+  coll = db.coll('blob.files')
+  await coll.create_index('metadata.sha256', unique=True, sparse=True, background=True)
+  await coll.create_index('metadata.touched_at', background=True)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -0,0 +1,41 @@
+"""Log of problem data changes, which judges poll to invalidate their cached data.
+
+Only the latest change of each problem is kept.
+"""
+import datetime
+
+from pymongo import errors
+
+from vj4 import db
+from vj4.model import document
+from vj4.util import argmethod
+
+
+@argmethod.wrap
+async def add(domain_id: str, pid: document.convert_doc_id, change_at: datetime.datetime=None):
+  if change_at is None:
+    change_at = datetime.datetime.utcnow()
+  coll = db.coll('problem.data_change')
+  query = {'domain_id': domain_id, 'pid': pid}
+  try:
+    await coll.update_one(query, {'$max': {'change_at': change_at}}, upsert=True)
+  except errors.DuplicateKeyError:
+    # Lost the race of creating the change, which exists now.
+    await coll.update_one(query, {'$max': {'change_at': change_at}})
+
+
+def get_multi(since: datetime.datetime, *, fields=None):
+  coll = db.coll('problem.data_change')
+  return coll.find({'change_at': {'$gt': since}}, projection=fields)
+
+
+@argmethod.wrap
+async def ensure_indexes():
+  coll = db.coll('problem.data_change')
+  await coll.create_index([('domain_id', 1),
+                           ('pid', 1)], unique=True, background=True)
+  await coll.create_index('change_at', background=True)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -4,6 +4,9 @@ from pymongo import ReturnDocument
 
 from vj4 import db
 from vj4 import error
+from vj4.service import countcache
+from vj4.service import pagecache
+from vj4.service import smallcache
 from vj4.util import argmethod
 
 TYPE_PROBLEM = 10
@@ -40,20 +43,47 @@ def convert_doc_id(doc_id):
     return str(doc_id)
 
 
+def _pname_cache_key(domain_id, pname):
+  return smallcache.PREFIX_PNAME + domain_id + '/' + pname
+
+
+def _pid_cache_key(domain_id, pid):
+  return smallcache.PREFIX_PID + domain_id + '/' + str(pid)
+
+
 @argmethod.wrap
-async def get_pid(domain_id, key):
-  if objectid.ObjectId.is_valid(key):
-    pdoc = await get(domain_id, TYPE_PROBLEM, objectid.ObjectId(key))
-  try:
-    key = int(key)
-    pdoc = await get(domain_id, TYPE_PROBLEM, key)
-  except ValueError:
-    pdoc = await get_by_pname(domain_id, TYPE_PROBLEM, key)
+async def get_pid(domain_id, key, check_exists: bool=False):
+  """Resolve a problem key, which is either a doc_id or a pname, to the doc_id.
+
+  Keys which are already doc_ids are returned without looking up the problem, unless check_exists
+  is set, e.g. on write paths which may create documents of the problem. Existence of the problem
+  is always checked for pnames. Problems found are cached.
+  """
+  if isinstance(key, str):
+    key = convert_doc_id(key)
+  if not isinstance(key, str):
+    if check_exists:
+      cache_key = _pid_cache_key(domain_id, key)
+      if not smallcache.get_direct(cache_key):
+        if not await get(domain_id, TYPE_PROBLEM, key, fields={'_id': 1}):
+          raise error.ProblemNotFoundError(domain_id, key)
+        smallcache.set_local_direct(cache_key, True)
+    return key
+  cache_key = _pname_cache_key(domain_id, key)
+  pid = smallcache.get_direct(cache_key)
+  if pid is not None:
+    return pid
+  pdoc = await get_by_pname(domain_id, TYPE_PROBLEM, key, fields={'doc_id': 1})
   if not pdoc:
     raise error.ProblemNotFoundError(domain_id, key)
+  smallcache.set_local_direct(cache_key, pdoc['doc_id'])
   return pdoc['doc_id']
 
 
+async def unset_pid_cache(domain_id, pname):
+  await smallcache.unset_global(_pname_cache_key(domain_id, pname))
+
+
 @argmethod.wrap
 async def add(domain_id: str, content: str, owner_uid: int,
               doc_type: int, doc_id: convert_doc_id = None,
@@ -72,6 +102,8 @@ async def add(domain_id: str, content: str, owner_uid: int,
     assert parent_doc_type and parent_doc_id
     doc['parent_doc_type'], doc['parent_doc_id'] = parent_doc_type, parent_doc_id
   await coll.insert_one(doc)
+  await countcache.inc('document', {k: v for k, v in doc.items() if k != 'content'}, 1)
+  await pagecache.invalidate(domain_id)
   return doc.get('pname', doc['doc_id'])
 
 
@@ -98,23 +130,39 @@ async def set(domain_id: str, doc_type: int, doc_id: convert_doc_id, **kwargs):
                                                'doc_id': doc_id},
                                        update={'$set': kwargs},
                                        return_document=ReturnDocument.AFTER)
+  await countcache.invalidate('document', {'domain_id': domain_id, 'doc_type': doc_type},
+                              kwargs.keys())
+  await pagecache.invalidate(domain_id)
   return doc
 
 
 async def delete(domain_id: str, doc_type: int, doc_id: convert_doc_id):
   # TODO(twd2): delete status?
   coll = db.coll('document')
-  return await coll.delete_one({'domain_id': domain_id,
-                                'doc_type': doc_type,
-                                'doc_id': doc_id})
+  doc = await coll.find_one({'domain_id': domain_id,
+                             'doc_type': doc_type,
+                             'doc_id': doc_id}, projection={'content': 0})
+  result = await coll.delete_one({'domain_id': domain_id,
+                                  'doc_type': doc_type,
+                                  'doc_id': doc_id})
+  if doc and result.deleted_count:
+    await countcache.inc('document', doc, -1)
+  await pagecache.invalidate(domain_id)
+  return result
 
 
 async def delete_multi(domain_id: str, doc_type: int, **kwargs):
   # TODO(twd2): delete status?
   coll = db.coll('document')
-  return await coll.delete_many({'domain_id': domain_id,
-                                 'doc_type': doc_type,
-                                 **kwargs})
+  result = await coll.delete_many({'domain_id': domain_id,
+                                   'doc_type': doc_type,
+                                   **kwargs})
+  if result.deleted_count:
+    await countcache.invalidate('document', {'domain_id': domain_id,
+                                             'doc_type': doc_type,
+                                             **kwargs})
+  await pagecache.invalidate(domain_id)
+  return result
 
 
 def get_multi(*, fields=None, **kwargs):
@@ -159,6 +207,7 @@ async def inc_and_set(domain_id: str, doc_type: int, doc_id: convert_doc_id,
                                        update={'$inc': {inc_key: inc_value},
                                                '$set': {set_key: set_value}},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc
 
 
@@ -175,6 +224,7 @@ async def push(domain_id: str, doc_type: int, doc_id: convert_doc_id, key: str,
                                                                'owner_uid': owner_uid,
                                                                '_id': obj_id}}},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc, obj_id
 
 
@@ -187,6 +237,7 @@ async def delete_sub(domain_id: str, doc_type: int, doc_id: convert_doc_id, key:
                                                'doc_id': doc_id},
                                        update={'$pull': {key: {'_id': sub_id}}},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc
 
 
@@ -217,6 +268,7 @@ async def set_sub(domain_id: str, doc_type: int, doc_id: convert_doc_id, key: st
                                                key: {'$elemMatch': {'_id': sub_id}}},
                                        update={'$set': mod},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc
 
 
@@ -229,6 +281,7 @@ async def add_to_set(domain_id: str, doc_type: int, doc_id: convert_doc_id, set_
                                                'doc_id': doc_id},
                                        update={'$addToSet': {set_key: content}},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc
 
 
@@ -241,6 +294,7 @@ async def pull(domain_id: str, doc_type: int, doc_id: convert_doc_id, set_key: s
                                                'doc_id': doc_id},
                                        update={'$pull': {set_key: {'$in': contents}}},
                                        return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
   return doc
 
 
@@ -372,97 +426,115 @@ async def ensure_indexes():
   coll = db.coll('document')
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
-                           ('doc_id', 1)], unique=True)
+                           ('doc_id', 1)], unique=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('owner_uid', 1),
-                           ('doc_id', -1)])
+                           ('doc_id', -1)], background=True)
   # for problem
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('category', 1),
-                           ('doc_id', 1)], sparse=True)
+                           ('doc_id', 1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('hidden', 1),
                            ('category', 1),
-                           ('doc_id', 1)], sparse=True)
+                           ('doc_id', 1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('tag', 1),
-                           ('doc_id', 1)], sparse=True)
+                           ('doc_id', 1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('hidden', 1),
                            ('tag', 1),
-                           ('doc_id', 1)], sparse=True)
+                           ('doc_id', 1)], sparse=True, background=True)
   # for problem solution
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('parent_doc_type', 1),
                            ('parent_doc_id', 1),
                            ('vote', -1),
-                           ('doc_id', -1)], sparse=True)
+                           ('doc_id', -1)], sparse=True, background=True)
   # for discussion
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('update_at', -1),
-                           ('doc_id', -1)], sparse=True)
+                           ('doc_id', -1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('parent_doc_type', 1),
                            ('parent_doc_id', 1),
                            ('update_at', -1),
-                           ('doc_id', -1)], sparse=True)
+                           ('doc_id', -1)], sparse=True, background=True)
   # hidden doc
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('hidden', 1),
-                           ('doc_id', -1)], sparse=True)
+                           ('doc_id', -1)], sparse=True, background=True)
+  # for copied problem data
+  await coll.create_index([('data.domain', 1),
+                           ('data.pid', 1)], sparse=True, background=True)
+  # for random problem
+  await coll.create_index([('domain_id', 1),
+                           ('doc_type', 1),
+                           ('hidden', 1),
+                           ('random', 1)], sparse=True, background=True)
+  await coll.create_index([('domain_id', 1),
+                           ('doc_type', 1),
+                           ('category', 1),
+                           ('hidden', 1),
+                           ('random', 1)], sparse=True, background=True)
+  await coll.create_index([('domain_id', 1),
+                           ('doc_type', 1),
+                           ('tag', 1),
+                           ('hidden', 1),
+                           ('random', 1)], sparse=True, background=True)
   # for contest
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
-                           ('pids', 1)], sparse=True)
+                           ('pids', 1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
                            ('rule', 1),
-                           ('doc_id', -1)], sparse=True)
+                           ('doc_id', -1)], sparse=True, background=True)
   # for training
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
-                           ('dag.pids', 1)], sparse=True)
+                           ('dag.pids', 1)], sparse=True, background=True)
   await coll.create_index([('domain_id', 1),
                            ('doc_type', 1),
-                           ('pname', 1)], sparse=True)
+                           ('pname', 1)], sparse=True, background=True)
   status_coll = db.coll('document.status')
   await status_coll.create_index([('domain_id', 1),
                                   ('doc_type', 1),
                                   ('uid', 1),
-                                  ('doc_id', 1)], unique=True)
+                                  ('doc_id', 1)], unique=True, background=True)
   # for rp system
   await status_coll.create_index([('domain_id', 1),
                                   ('doc_type', 1),
                                   ('doc_id', 1),
                                   ('status', 1),
                                   ('rid', 1),
-                                  ('rp', 1)], sparse=True)
+                                  ('rp', 1)], sparse=True, background=True)
   # for contest rule OI
   await status_coll.create_index([('domain_id', 1),
                                   ('doc_type', 1),
                                   ('doc_id', 1),
-                                  ('score', -1)], sparse=True)
+                                  ('score', -1)], sparse=True, background=True)
   # for contest rule ACM
   await status_coll.create_index([('domain_id', 1),
                                   ('doc_type', 1),
                                   ('doc_id', 1),
                                   ('accept', -1),
-                                  ('time', 1)], sparse=True)
+                                  ('time', 1)], sparse=True, background=True)
   # for training
   await status_coll.create_index([('domain_id', 1),
                                   ('doc_type', 1),
                                   ('uid', 1),
                                   ('enroll', 1),
-                                  ('doc_id', 1)], sparse=True)
+                                  ('doc_id', 1)], sparse=True, background=True)
 
 
 if __name__ == '__main__':
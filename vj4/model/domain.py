@@ -8,6 +8,7 @@ from vj4 import db
 from vj4 import error
 from vj4.model import builtin
 from vj4.model import system
+from vj4.service import pagecache
 from vj4.util import argmethod
 from vj4.util import validator
 
@@ -98,17 +99,21 @@ async def edit(domain_id: str, **kwargs):
   if 'name' in kwargs:
     validator.check_name(kwargs['name'])
   # TODO(twd2): check kwargs
-  return await coll.find_one_and_update(filter={'_id': domain_id},
+  ddoc = await coll.find_one_and_update(filter={'_id': domain_id},
                                         update={'$set': {**kwargs}},
                                         return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
+  return ddoc
 
 
 async def unset(domain_id, fields):
   # TODO(twd2): check fields
   coll = db.coll('domain')
-  return await coll.find_one_and_update(filter={'_id': domain_id},
+  ddoc = await coll.find_one_and_update(filter={'_id': domain_id},
                                         update={'$unset': dict((f, '') for f in set(fields))},
                                         return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
+  return ddoc
 
 
 @argmethod.wrap
@@ -148,9 +153,11 @@ async def set_roles(domain_id: str, roles):
     if domain['_id'] == domain_id:
       raise error.BuiltinDomainError(domain_id)
   coll = db.coll('domain')
-  return await coll.find_one_and_update(filter={'_id': domain_id},
+  ddoc = await coll.find_one_and_update(filter={'_id': domain_id},
                                         update={'$set': update},
                                         return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
+  return ddoc
 
 
 @argmethod.wrap
@@ -171,10 +178,12 @@ async def delete_roles(domain_id: str, roles):
   await user_coll.update_many({'domain_id': domain_id, 'role': {'$in': list(roles)}},
                               {'$unset': {'role': ''}})
   coll = db.coll('domain')
-  return await coll.find_one_and_update(filter={'_id': domain_id},
+  ddoc = await coll.find_one_and_update(filter={'_id': domain_id},
                                         update={'$unset': dict(('roles.{0}'.format(role), '')
                                                                for role in roles)},
                                         return_document=ReturnDocument.AFTER)
+  await pagecache.invalidate(domain_id)
+  return ddoc
 
 
 @argmethod.wrap
@@ -343,18 +352,18 @@ async def get_prefix_search(prefix: str, fields={}, limit: int=50):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('domain')
-  await coll.create_index('owner_uid')
-  await coll.create_index('name')
+  await coll.create_index('owner_uid', background=True)
+  await coll.create_index('name', background=True)
   user_coll = db.coll('domain.user')
-  await user_coll.create_index('uid')
+  await user_coll.create_index('uid', background=True)
   await user_coll.create_index([('domain_id', 1),
-                                ('uid', 1)], unique=True)
+                                ('uid', 1)], unique=True, background=True)
   await user_coll.create_index([('domain_id', 1),
-                                ('role', 1)], sparse=True)
+                                ('role', 1)], sparse=True, background=True)
   await user_coll.create_index([('domain_id', 1),
-                                ('rp', -1)])
+                                ('rp', -1)], background=True)
   await user_coll.create_index([('domain_id', 1),
-                                ('rank', 1)])
+                                ('rank', 1)], background=True)
 
 
 if __name__ == '__main__':
@@ -1,3 +1,7 @@
+import asyncio
+import datetime
+import hashlib
+import logging
 import sys
 import mimetypes
 
@@ -6,16 +10,112 @@ from pymongo import ReturnDocument
 
 from vj4 import db
 from vj4 import error
+from vj4.service import blobstore
 from vj4.util import argmethod
+from vj4.util import options
 from vj4.util import pwhash
 
-
-async def add(content_type):
-  """Add a file. Returns MotorGridIn."""
-  fs = db.fs('fs')
-  secret = pwhash.gen_secret()
-  return await fs.new_file(content_type=content_type,
-                           metadata={'link': 1, 'secret': secret})
+_logger = logging.getLogger(__name__)
+
+
+class _FileIn(object):
+  """Writes a file to a storage backend other than GridFS. Mimics MotorGridIn."""
+
+  def __init__(self, doc, writer):
+    self._id = doc['_id']
+    self._doc = doc
+    self._writer = writer
+    self._md5 = hashlib.md5()
+    self._length = 0
+    self.md5 = None
+
+  async def write(self, data):
+    if hasattr(data, 'read'):
+      chunk = data.read(blobstore.CHUNK_SIZE)
+      while chunk:
+        await self.write(chunk)
+        chunk = data.read(blobstore.CHUNK_SIZE)
+      return
+    self._md5.update(data)
+    self._length += len(data)
+    await self._writer.write(data)
+
+  async def close(self):
+    await self._writer.close()
+    self.md5 = self._md5.hexdigest()
+    now = datetime.datetime.utcnow()
+    self._doc.update({'length': self._length, 'md5': self.md5, 'chunkSize': blobstore.CHUNK_SIZE,
+                      'uploadDate': now.replace(microsecond=now.microsecond // 1000 * 1000)})
+    await db.coll('fs.files').insert_one(self._doc)
+
+  async def abort(self):
+    await self._writer.abort()
+
+
+class _FileOut(object):
+  """Reads a file from a storage backend other than GridFS. Mimics MotorGridOut."""
+
+  def __init__(self, doc, store):
+    self._id = doc['_id']
+    self.content_type = doc.get('contentType')
+    self.length = doc['length']
+    self.upload_date = doc['uploadDate']
+    self.md5 = doc['md5']
+    self.metadata = doc['metadata']
+    self._store = store
+    self._position = 0
+    self._reader = None
+
+  def seek(self, pos):
+    if self._reader:
+      asyncio.get_event_loop().create_task(self._reader.close())
+      self._reader = None
+    self._position = pos
+
+  async def readchunk(self):
+    if self._position >= self.length:
+      return b''
+    if not self._reader:
+      self._reader = await self._store.open_read(str(self._id), self._position)
+    chunk = await self._reader.readchunk()
+    chunk = chunk[:self.length - self._position]
+    self._position += len(chunk)
+    return chunk
+
+  async def read(self, size=-1):
+    chunks = []
+    remaining = self.length - self._position if size < 0 else size
+    while remaining > 0:
+      chunk = await self.readchunk()
+      if not chunk:
+        break
+      if len(chunk) > remaining:
+        self.seek(self._position - len(chunk) + remaining)
+        chunk = chunk[:remaining]
+      chunks.append(chunk)
+      remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _get_storage(doc):
+  return doc['metadata'].get('storage', blobstore.STORAGE_GRIDFS)
+
+
+async def add(content_type, sha256=None):
+  """Add a file to the storage backend of new files. Returns MotorGridIn or an equivalent.
+
+  The SHA-256 checksum, if known, is recorded for deduplication.
+  """
+  metadata = {'link': 1, 'secret': pwhash.gen_secret()}
+  if sha256:
+    metadata['sha256'] = sha256
+  if options.fs_storage == blobstore.STORAGE_GRIDFS:
+    fs = db.fs('fs')
+    return await fs.new_file(content_type=content_type, metadata=metadata)
+  store = blobstore.get(options.fs_storage)
+  metadata['storage'] = options.fs_storage
+  doc = {'_id': objectid.ObjectId(), 'contentType': content_type, 'metadata': metadata}
+  return _FileIn(doc, await store.open_write(str(doc['_id'])))
 
 
 @argmethod.wrap
@@ -35,17 +135,20 @@ async def add_data(content_type, data):
   return grid_in._id
 
 
-async def add_file_object(content_type, file_object):
-  grid_in = await add(content_type)
+async def add_file_object(content_type, file_object, sha256=None):
+  grid_in = await add(content_type, sha256)
   await grid_in.write(file_object)
   await grid_in.close()
   return grid_in._id
 
 
 async def get(file_id):
-  """Get a file. Returns MotorGridOut."""
-  fs = db.fs('fs')
-  return await fs.get(file_id)
+  """Get a file. Returns MotorGridOut or an equivalent."""
+  doc = await db.coll('fs.files').find_one(file_id)
+  if not doc or _get_storage(doc) == blobstore.STORAGE_GRIDFS:
+    fs = db.fs('fs')
+    return await fs.get(file_id)
+  return _FileOut(doc, blobstore.get(_get_storage(doc)))
 
 
 async def get_by_secret(secret):
@@ -135,23 +238,101 @@ async def link_by_md5(file_md5: str, except_id: objectid.ObjectId=None):
     return doc['_id']
 
 
+@argmethod.wrap
+async def link_by_sha256(file_sha256: str, file_md5: str=None):
+  """Link a file by SHA-256 if exists.
+
+  Files added before SHA-256 was recorded are linked by MD5 if given, which also records the
+  SHA-256 of the file.
+  """
+  coll = db.coll('fs.files')
+  doc = await coll.find_one_and_update(filter={'metadata.sha256': file_sha256},
+                                       update={'$inc': {'metadata.link': 1}})
+  if not doc and file_md5:
+    doc = await coll.find_one_and_update(filter={'md5': file_md5,
+                                                 'metadata.sha256': {'$exists': False}},
+                                         update={'$inc': {'metadata.link': 1},
+                                                 '$set': {'metadata.sha256': file_sha256}})
+  if doc:
+    return doc['_id']
+
+
 @argmethod.wrap
 async def unlink(file_id: objectid.ObjectId):
-  """Unlink a file."""
+  """Unlink a file. Returns whether the file is deleted."""
   coll = db.coll('fs.files')
   doc = await coll.find_one_and_update(filter={'_id': file_id},
                                        update={'$inc': {'metadata.link': -1}},
                                        return_document=ReturnDocument.AFTER)
   if doc and not doc['metadata']['link']:
-    fs = db.fs('fs')
-    await fs.delete(file_id)
+    if _get_storage(doc) == blobstore.STORAGE_GRIDFS:
+      fs = db.fs('fs')
+      await fs.delete(file_id)
+    else:
+      await db.coll('fs.files').delete_one({'_id': file_id})
+      await blobstore.get(_get_storage(doc)).delete(str(file_id))
+    return True
+  return False
+
+
+async def _copy(file_id, storage):
+  grid_out = await get(file_id)
+  writer = await blobstore.get(storage).open_write(str(file_id))
+  try:
+    chunk = await grid_out.readchunk()
+    while chunk:
+      _, chunk = await asyncio.gather(writer.write(chunk), grid_out.readchunk())
+    await writer.close()
+  except:
+    await writer.abort()
+    raise
+
+
+async def _delete_contents(file_id, storage):
+  if storage == blobstore.STORAGE_GRIDFS:
+    # Keep the document in fs.files, which now describes the file in the new backend.
+    await db.coll('fs.chunks').delete_many({'files_id': file_id})
+  else:
+    await blobstore.get(storage).delete(str(file_id))
+
+
+@argmethod.wrap
+async def migrate(storage: str, grace_seconds: int=60):
+  """Move contents of files to a storage backend while serving.
+
+  The documents in fs.files, hence the secrets, stay the same. Old contents are deleted after the
+  grace period, when readers which opened the files before migration are likely done.
+  """
+  if storage == blobstore.STORAGE_GRIDFS:
+    raise error.InvalidArgumentError('storage')
+  coll = db.coll('fs.files')
+  migrated = []
+  async for doc in coll.find({'metadata.storage': {'$ne': storage}}):
+    old_storage = _get_storage(doc)
+    try:
+      await _copy(doc['_id'], storage)
+    except Exception as e:
+      _logger.error('Failed to migrate %s: %s', doc['_id'], repr(e))
+      continue
+    query = {'_id': doc['_id'], 'metadata.storage': doc['metadata'].get('storage')}
+    if not await coll.find_one_and_update(filter=query,
+                                          update={'$set': {'metadata.storage': storage}}):
+      # Unlinked or migrated by others during copy.
+      await blobstore.get(storage).delete(str(doc['_id']))
+      continue
+    migrated.append((doc['_id'], old_storage))
+    _logger.info('Migrated %s from %s to %s', doc['_id'], old_storage, storage)
+  await asyncio.sleep(grace_seconds)
+  for file_id, old_storage in migrated:
+    await _delete_contents(file_id, old_storage)
 
 
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('fs.files')
-  await coll.create_index('metadata.secret', unique=True)
-  await coll.create_index('md5')
+  await coll.create_index('metadata.secret', unique=True, background=True)
+  await coll.create_index('md5', background=True)
+  await coll.create_index('metadata.sha256', sparse=True, background=True)
 
 
 if __name__ == '__main__':
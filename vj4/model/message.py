@@ -63,8 +63,8 @@ async def delete(message_id: objectid.ObjectId, uid: int=None):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('message')
-  await coll.create_index([('sender_uid', 1), ('_id', -1)])
-  await coll.create_index([('sendee_uid', 1), ('_id', -1)])
+  await coll.create_index([('sender_uid', 1), ('_id', -1)], background=True)
+  await coll.create_index([('sendee_uid', 1), ('_id', -1)], background=True)
 
 
 if __name__ == '__main__':
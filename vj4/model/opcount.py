@@ -33,8 +33,8 @@ async def ensure_indexes():
   coll = db.coll('opcount')
   await coll.create_index([('ident', 1),
                            ('begin_at', 1),
-                           ('expire_at', 1)], unique=True)
-  await coll.create_index('expire_at', expireAfterSeconds=0)
+                           ('expire_at', 1)], unique=True, background=True)
+  await coll.create_index('expire_at', expireAfterSeconds=0, background=True)
 
 
 if __name__ == '__main__':
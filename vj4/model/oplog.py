@@ -24,11 +24,11 @@ async def add(uid: int, type: int, **kwargs):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('oplog')
-  await coll.create_index('uid')
+  await coll.create_index('uid', background=True)
   # type delete document
   await coll.create_index([('doc.domain_id', 1),
                            ('doc.doc_type', 1),
-                           ('doc.doc_id', 1)], sparse=True)
+                           ('doc.doc_id', 1)], sparse=True, background=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+import datetime
+
+from pymongo import ReturnDocument
+
+from vj4 import db
+from vj4.util import argmethod
+
+
+@argmethod.wrap
+async def add(to: str, subject: str, content: str):
+  """Add a mail to the outbox, which is due immediately.
+
+  Returns:
+    The mail ID.
+  """
+  coll = db.coll('mail.outbox')
+  now = datetime.datetime.utcnow()
+  result = await coll.insert_one({'to': to,
+                                  'subject': subject,
+                                  'content': content,
+                                  'enqueue_at': now,
+                                  'due_at': now,
+                                  'attempts': 0})
+  return result.inserted_id
+
+
+async def claim(lease_seconds: int):
+  """Claim a due mail to send. The mail is due again after the lease, in case the sender dies.
+
+  Returns:
+    The mail document with attempts incremented, or None if no mail is due.
+  """
+  coll = db.coll('mail.outbox')
+  now = datetime.datetime.utcnow()
+  return await coll.find_one_and_update(
+      filter={'due_at': {'$lte': now}},
+      update={'$set': {'due_at': now + datetime.timedelta(seconds=lease_seconds)},
+              '$inc': {'attempts': 1}},
+      sort=[('due_at', 1)],
+      return_document=ReturnDocument.AFTER)
+
+
+async def delete(mail_id):
+  coll = db.coll('mail.outbox')
+  await coll.delete_one({'_id': mail_id})
+
+
+async def retry(mail_id, delay_seconds: int, reason: str):
+  coll = db.coll('mail.outbox')
+  due_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay_seconds)
+  await coll.update_one({'_id': mail_id},
+                        {'$set': {'due_at': due_at, 'reason': reason}})
+
+
+@argmethod.wrap
+async def ensure_indexes():
+  coll = db.coll('mail.outbox')
+  await coll.create_index('due_at', background=True)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -7,6 +7,7 @@ from vj4 import constant
 from vj4 import db
 from vj4.model import document
 from vj4.model import domain
+from vj4.model import recordstat
 from vj4.model.adaptor import problem
 from vj4.service import bus
 from vj4.service import queue
@@ -39,7 +40,8 @@ async def add(domain_id: str, pid: document.convert_doc_id, type: int, uid: int,
          'type': type}
   rid = (await coll.insert_one(doc)).inserted_id
   bus.publish_throttle('record_change', doc, rid)
-  post_coros = [queue.publish('judge', rid=rid)]
+  post_coros = [queue.publish('judge', rid=rid),
+                recordstat.inc(int(rid.generation_time.timestamp()))]
   if type == constant.record.TYPE_SUBMISSION:
     post_coros.extend([problem.inc_status(domain_id, pid, uid, 'num_submit', 1),
                        problem.inc(domain_id, pid, 'num_submit', 1),
@@ -179,31 +181,31 @@ async def end_judge(record_id: objectid.ObjectId, judge_uid: int, judge_token: s
 async def ensure_indexes():
   coll = db.coll('record')
   await coll.create_index([('hidden', 1),
-                           ('_id', -1)])
+                           ('_id', -1)], background=True)
   await coll.create_index([('hidden', 1),
                            ('uid', 1),
-                           ('_id', -1)])
+                           ('_id', -1)], background=True)
   await coll.create_index([('hidden', 1),
                            ('domain_id', 1),
                            ('pid', 1),
                            ('uid', 1),
-                           ('_id', -1)])
+                           ('_id', -1)], background=True)
   await coll.create_index([('hidden', 1),
                            ('domain_id', 1),
                            ('tid', 1),
                            ('pid', 1),
                            ('uid', 1),
-                           ('_id', -1)], sparse=True)
+                           ('_id', -1)], sparse=True, background=True)
   # for job record
   await coll.create_index([('domain_id', 1),
                            ('pid', 1),
                            ('type', 1),
-                           ('_id', 1)])
+                           ('_id', 1)], background=True)
   await coll.create_index([('domain_id', 1),
                            ('pid', 1),
                            ('uid', 1),
                            ('type', 1),
-                           ('_id', 1)])
+                           ('_id', 1)], background=True)
   # TODO(iceboy): Add more indexes.
 
 
@@ -0,0 +1,165 @@
+"""Time-bucketed counters of records.
+
+Each record is counted in exactly one bucket. New records go to minute buckets, which are rolled
+up into hour buckets and then day buckets as they get old. A window count is the sum of buckets
+beginning within the window, so its boundary is as precise as the buckets there.
+"""
+import asyncio
+import collections
+import datetime
+import logging
+import time
+
+from pymongo import errors
+
+from vj4 import db
+from vj4.model import system
+from vj4.util import argmethod
+
+PERIOD_MINUTE = 60
+PERIOD_HOUR = 3600
+PERIOD_DAY = 86400
+
+# (period, coarser period, age in seconds after which buckets are rolled up into the coarser one)
+ROLLUPS = [(PERIOD_MINUTE, PERIOD_HOUR, 2 * PERIOD_DAY),
+           (PERIOD_HOUR, PERIOD_DAY, 62 * PERIOD_DAY)]
+
+ROLLUP_INTERVAL_SECONDS = PERIOD_HOUR
+ROLLUP_LEASE_SECONDS = 600
+
+_logger = logging.getLogger(__name__)
+_last_rollup_at = 0
+
+
+def _begin_at(ts, period):
+  return datetime.datetime.utcfromtimestamp(ts - ts % period)
+
+
+def _period_for_age(age):
+  period = PERIOD_MINUTE
+  for from_period, to_period, rollup_age in ROLLUPS:
+    if period == from_period and age >= rollup_age:
+      period = to_period
+  return period
+
+
+async def inc(ts: int=None, value: int=1):
+  if ts is None:
+    ts = int(time.time())
+  coll = db.coll('record.stat')
+  query = {'period': PERIOD_MINUTE, 'begin_at': _begin_at(ts, PERIOD_MINUTE)}
+  try:
+    await coll.update_one(query, {'$inc': {'count': value}}, upsert=True)
+  except errors.DuplicateKeyError:
+    # Lost the race of creating the bucket, which exists now.
+    await coll.update_one(query, {'$inc': {'count': value}})
+
+
+async def get_counts(*durations):
+  """Get the number of records in the last durations. A duration of None means all records.
+
+  Args:
+    durations: datetime.timedelta or None.
+
+  Returns:
+    A list of counts for each duration.
+  """
+  _schedule_rollup()
+  now = datetime.datetime.utcnow()
+  since_list = [now - duration if duration is not None else None for duration in durations]
+  counts = [0] * len(durations)
+  coll = db.coll('record.stat')
+  async for doc in coll.find({}, projection={'_id': 0, 'begin_at': 1, 'count': 1}):
+    for i, since in enumerate(since_list):
+      if since is None or doc['begin_at'] >= since:
+        counts[i] += doc['count']
+  return counts
+
+
+async def _rollup_period(from_period, to_period, age):
+  coll = db.coll('record.stat')
+  until = _begin_at(int(time.time()) - age, to_period)
+  docs = await coll.find({'period': from_period, 'begin_at': {'$lt': until}},
+                         projection={'_id': 1}).to_list()
+  incs = collections.Counter()
+  # Take buckets out before adding them to the coarser ones, so that a failure in between loses
+  # counts rather than counting them twice.
+  for doc in docs:
+    doc = await coll.find_one_and_delete({'_id': doc['_id']})
+    if not doc:
+      continue
+    ts = int((doc['begin_at'] - datetime.datetime(1970, 1, 1)).total_seconds())
+    incs[_begin_at(ts, to_period)] += doc['count']
+  if not incs:
+    return
+  bulk = coll.initialize_unordered_bulk_op()
+  for begin_at, count in incs.items():
+    bulk.find({'period': to_period, 'begin_at': begin_at}).upsert().update_one(
+        {'$inc': {'count': count}})
+  await bulk.execute()
+
+
+@argmethod.wrap
+async def rollup():
+  lease = await system.acquire_lease('recordstat', ROLLUP_LEASE_SECONDS)
+  if not lease:
+    return
+  try:
+    for from_period, to_period, age in ROLLUPS:
+      await _rollup_period(from_period, to_period, age)
+  finally:
+    await system.release_lease('recordstat', lease)
+
+
+async def _rollup_and_log():
+  global _last_rollup_at
+  try:
+    await rollup()
+  except Exception as e:
+    _logger.exception(e)
+    # Retry on the next call of get_counts.
+    _last_rollup_at = 0
+
+
+def _schedule_rollup():
+  global _last_rollup_at
+  now = time.time()
+  if now - _last_rollup_at >= ROLLUP_INTERVAL_SECONDS:
+    _last_rollup_at = now
+    asyncio.get_event_loop().create_task(_rollup_and_log())
+
+
+@argmethod.wrap
+async def rebuild():
+  """Rebuild all buckets from the record collection."""
+  lease = await system.acquire_lease('recordstat', ROLLUP_LEASE_SECONDS)
+  if not lease:
+    return
+  try:
+    now = int(time.time())
+    incs = collections.Counter()
+    async for rdoc in db.coll('record').find({}, projection={'_id': 1}):
+      ts = int(rdoc['_id'].generation_time.timestamp())
+      period = _period_for_age(now - ts)
+      incs[(period, _begin_at(ts, period))] += 1
+    if not await system.renew_lease('recordstat', lease, ROLLUP_LEASE_SECONDS):
+      _logger.warning('Lease of rebuilding record stats is lost.')
+      return
+    coll = db.coll('record.stat')
+    await coll.delete_many({})
+    if incs:
+      await coll.insert_many([{'period': period, 'begin_at': begin_at, 'count': count}
+                              for (period, begin_at), count in incs.items()])
+  finally:
+    await system.release_lease('recordstat', lease)
+
+
+@argmethod.wrap
+async def ensure_indexes():
+  coll = db.coll('record.stat')
+  await coll.create_index([('period', 1),
+                           ('begin_at', 1)], unique=True, background=True)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -0,0 +1,152 @@
+"""Sharded counters of documents.
+
+An increment of a hot counter, e.g. num_submit of a problem during a contest, goes to one of
+SHARDS sub-documents chosen at random instead of the document itself, so that concurrent
+increments do not serialize on the document. Shards are folded into the document shortly after,
+and the value of a counter is the value in the document plus the pending shards.
+"""
+import asyncio
+import collections
+import itertools
+import logging
+import random
+
+from pymongo import errors
+from pymongo import ReturnDocument
+
+from vj4 import db
+from vj4.util import argmethod
+from vj4.util import options
+
+options.define('shardcount_fold_delay_seconds', default=5,
+               help='Delay before folding sharded counters into documents, in seconds.')
+
+SHARDS = 16
+
+_logger = logging.getLogger(__name__)
+_fold_scheduled = False
+
+
+async def inc(domain_id: str, doc_type: int, doc_id, key: str, value: int):
+  coll = db.coll('document.shard')
+  query = {'domain_id': domain_id, 'doc_type': doc_type, 'doc_id': doc_id, 'key': key,
+           'shard': random.randrange(SHARDS)}
+  try:
+    await coll.update_one(query, {'$inc': {'value': value}}, upsert=True)
+  except errors.DuplicateKeyError:
+    # Lost the race of creating the shard, which exists now.
+    await coll.update_one(query, {'$inc': {'value': value}})
+  _schedule_fold()
+
+
+async def get_pending(domain_id: str, doc_type: int, doc_id, key: str):
+  """Get the sum of shards not folded into the document yet."""
+  coll = db.coll('document.shard')
+  pending = 0
+  async for sdoc in coll.find({'domain_id': domain_id, 'doc_type': doc_type,
+                               'doc_id': doc_id, 'key': key},
+                              projection={'_id': 0, 'value': 1}):
+    pending += sdoc['value']
+  return pending
+
+
+async def fill_multi(docs, *keys):
+  """Add pending shards to counters in the documents, with one query. Returns the documents."""
+  docs = list(docs)
+  query = {'$or': []}
+  key_func = lambda doc: (doc['domain_id'], doc['doc_type'])
+  for (domain_id, doc_type), group in itertools.groupby(sorted(docs, key=key_func),
+                                                        key=key_func):
+    query['$or'].append({'domain_id': domain_id, 'doc_type': doc_type,
+                         'doc_id': {'$in': list(set(doc['doc_id'] for doc in group))}})
+  if not query['$or']:
+    return docs
+  query['key'] = {'$in': list(keys)}
+  pending = collections.Counter()
+  async for sdoc in db.coll('document.shard').find(query, projection={'_id': 0}):
+    pending[(sdoc['domain_id'], sdoc['doc_type'], sdoc['doc_id'], sdoc['key'])] += sdoc['value']
+  for doc in docs:
+    for key in keys:
+      doc[key] = doc.get(key, 0) + pending[(doc['domain_id'], doc['doc_type'], doc['doc_id'], key)]
+  return docs
+
+
+async def fill(doc, *keys):
+  """Add pending shards to counters in the document. Returns the document."""
+  if doc:
+    await fill_multi([doc], *keys)
+  return doc
+
+
+async def delete_multi(domain_id: str, doc_type: int, keys):
+  """Drop pending shards, e.g. before counters are recalculated from scratch."""
+  coll = db.coll('document.shard')
+  await coll.delete_many({'domain_id': domain_id, 'doc_type': doc_type, 'key': {'$in': keys}})
+
+
+@argmethod.wrap
+async def fold():
+  """Fold shards into documents. Processes may fold concurrently, since each shard is taken by
+  setting it to zero atomically.
+
+  Returns:
+    The number of shards folded.
+  """
+  coll = db.coll('document.shard')
+  sdocs = await coll.find({'value': {'$ne': 0}}, projection={'_id': 1}).to_list()
+  incs = collections.Counter()
+  num_folded = 0
+  # Take values out of shards before adding them to documents, so that a failure in between loses
+  # increments rather than counting them twice.
+  for sdoc in sdocs:
+    sdoc = await coll.find_one_and_update(filter={'_id': sdoc['_id'], 'value': {'$ne': 0}},
+                                          update={'$set': {'value': 0}},
+                                          return_document=ReturnDocument.BEFORE)
+    if not sdoc:
+      # Taken by another process.
+      continue
+    incs[(sdoc['domain_id'], sdoc['doc_type'], sdoc['doc_id'], sdoc['key'])] += sdoc['value']
+    num_folded += 1
+  if not incs:
+    return num_folded
+  doc_bulk = db.coll('document').initialize_unordered_bulk_op()
+  for (domain_id, doc_type, doc_id, key), value in incs.items():
+    doc_bulk.find({'domain_id': domain_id, 'doc_type': doc_type, 'doc_id': doc_id}) \
+        .update_one({'$inc': {key: value}})
+  await doc_bulk.execute()
+  # A shard incremented concurrently is not zero, and a shard deleted is upserted again.
+  await coll.delete_many({'value': 0})
+  return num_folded
+
+
+async def _fold_later():
+  global _fold_scheduled
+  await asyncio.sleep(options.shardcount_fold_delay_seconds)
+  _fold_scheduled = False
+  try:
+    await fold()
+  except Exception as e:
+    _logger.exception(e)
+    _schedule_fold()
+
+
+def _schedule_fold():
+  global _fold_scheduled
+  if not _fold_scheduled:
+    _fold_scheduled = True
+    asyncio.get_event_loop().create_task(_fold_later())
+
+
+@argmethod.wrap
+async def ensure_indexes():
+  coll = db.coll('document.shard')
+  await coll.create_index([('domain_id', 1),
+                           ('doc_type', 1),
+                           ('doc_id', 1),
+                           ('key', 1),
+                           ('shard', 1)], unique=True, background=True)
+  await coll.create_index('value', background=True)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -1,3 +1,4 @@
+import datetime
 import random
 
 from pymongo import errors
@@ -8,7 +9,7 @@ from vj4 import error
 from vj4.util import argmethod
 
 
-EXPECTED_DB_VERSION = 1
+EXPECTED_DB_VERSION = 2
 
 
 @argmethod.wrap
@@ -69,6 +70,45 @@ async def release_lock_anyway(lock_name: str):
   return True
 
 
+async def acquire_lease(lease_name: str, lease_seconds: int):
+  """Acquire a lock which expires after the lease, so that it is not held forever when the holder
+  dies. Returns the lease value, or None if the lease is held by another process.
+  """
+  lease_value = random.randint(1, 0xFFFFFFFF)
+  now = datetime.datetime.utcnow()
+  coll = db.coll('system')
+  try:
+    await coll.update_one(filter={'_id': 'lease_' + lease_name,
+                                  '$or': [{'value': 0}, {'expire_at': {'$lt': now}}]},
+                          update={'$set': {'value': lease_value,
+                                           'expire_at': now + datetime.timedelta(
+                                               seconds=lease_seconds)}},
+                          upsert=True)
+  except errors.DuplicateKeyError:
+    return None
+  return lease_value
+
+
+async def renew_lease(lease_name: str, lease_value: int, lease_seconds: int):
+  """Renew a lease. Returns None if the lease has been lost."""
+  coll = db.coll('system')
+  expire_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=lease_seconds)
+  result = await coll.update_one(filter={'_id': 'lease_' + lease_name, 'value': lease_value},
+                                 update={'$set': {'expire_at': expire_at}})
+  if result.matched_count == 0:
+    return None
+  return True
+
+
+async def release_lease(lease_name: str, lease_value: int):
+  coll = db.coll('system')
+  result = await coll.update_one(filter={'_id': 'lease_' + lease_name, 'value': lease_value},
+                                 update={'$set': {'value': 0}})
+  if result.matched_count == 0:
+    return None
+  return True
+
+
 async def acquire_upgrade_lock():
   lock = await acquire_lock('upgrade')
   if not lock:
@@ -88,6 +128,31 @@ async def release_upgrade_lock_anyway():
   return await release_lock_anyway('upgrade')
 
 
+@argmethod.wrap
+async def release_index_lease_anyway():
+  coll = db.coll('system')
+  await coll.update_one(filter={'_id': 'lease_index'}, update={'$set': {'value': 0}})
+  return True
+
+
+@argmethod.wrap
+async def get_index_hashes():
+  """Get hashes of index specs which have been ensured, keyed by model name."""
+  coll = db.coll('system')
+  doc = await coll.find_one({'_id': 'index_hashes'})
+  if doc is None:
+    return {}
+  else:
+    return doc['value']
+
+
+async def set_index_hash(name: str, index_hash: str):
+  coll = db.coll('system')
+  await coll.update_one(filter={'_id': 'index_hashes'},
+                        update={'$set': {'value.' + name: index_hash}},
+                        upsert=True)
+
+
 @argmethod.wrap
 async def get_db_version():
   coll = db.coll('system')
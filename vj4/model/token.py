@@ -141,8 +141,9 @@ async def delete_by_uid(uid: int):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('token')
-  await coll.create_index([('uid', 1), ('token_type', 1), ('update_at', -1)], sparse=True)
-  await coll.create_index('expire_at', expireAfterSeconds=0)
+  await coll.create_index([('uid', 1), ('token_type', 1), ('update_at', -1)],
+                          sparse=True, background=True)
+  await coll.create_index('expire_at', expireAfterSeconds=0, background=True)
 
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@ from pymongo import ReturnDocument
 from vj4 import db
 from vj4 import error
 from vj4.model import builtin
+from vj4.service import pwhashpool
 from vj4.util import argmethod
 from vj4.util import pwhash
 from vj4.util import validator
@@ -42,7 +43,7 @@ async def add(uid: int, uname: str, password: str, mail: str, regip: str=''):
                            'mail': mail,
                            'mail_lower': mail_lower,
                            'salt': salt,
-                           'hash': pwhash.hash_vj4(password, salt),
+                           'hash': await pwhashpool.hash_vj4(password, salt),
                            'regat': datetime.datetime.utcnow(),
                            'regip': regip,
                            'priv': builtin.DEFAULT_PRIV,
@@ -107,7 +108,7 @@ async def get_dict(uids, *, fields=PROJECTION_VIEW):
 async def check_password_by_uid(uid: int, password: str):
   """Check password. Returns doc or None."""
   doc = await get_by_uid(uid, PROJECTION_ALL)
-  if doc and pwhash.check(password, doc['salt'], doc['hash']):
+  if doc and await pwhashpool.check(password, doc['salt'], doc['hash']):
     return doc
 
 
@@ -117,7 +118,7 @@ async def check_password_by_uname(uname: str, password: str, auto_upgrade: bool=
   doc = await get_by_uname(uname, PROJECTION_ALL)
   if not doc:
     raise error.UserNotFoundError(uname)
-  if pwhash.check(password, doc['salt'], doc['hash']):
+  if await pwhashpool.check(password, doc['salt'], doc['hash']):
     if auto_upgrade and pwhash.need_upgrade(doc['hash']) \
         and validator.is_password(password):
       await set_password(doc['_id'], password)
@@ -129,10 +130,10 @@ async def set_password(uid: int, password: str):
   """Set password. Returns doc or None."""
   validator.check_password(password)
   salt = pwhash.gen_salt()
+  hash = await pwhashpool.hash_vj4(password, salt)
   coll = db.coll('user')
   doc = await coll.find_one_and_update(filter={'_id': uid},
-                                       update={'$set': {'salt': salt,
-                                                        'hash': pwhash.hash_vj4(password, salt)}},
+                                       update={'$set': {'salt': salt, 'hash': hash}},
                                        return_document=ReturnDocument.AFTER)
   return doc
 
@@ -152,12 +153,12 @@ async def change_password(uid: int, current_password: str, password: str):
     return None
   validator.check_password(password)
   salt = pwhash.gen_salt()
+  hash = await pwhashpool.hash_vj4(password, salt)
   coll = db.coll('user')
   doc = await coll.find_one_and_update(filter={'_id': doc['_id'],
                                                'salt': doc['salt'],
                                                'hash': doc['hash']},
-                                       update={'$set': {'salt': salt,
-                                                        'hash': pwhash.hash_vj4(password, salt)}},
+                                       update={'$set': {'salt': salt, 'hash': hash}},
                                        return_document=ReturnDocument.AFTER)
   return doc
 
@@ -215,8 +216,8 @@ async def count(**kwargs):
 @argmethod.wrap
 async def ensure_indexes():
   coll = db.coll('user')
-  await coll.create_index('uname_lower', unique=True)
-  await coll.create_index('mail_lower', sparse=True)
+  await coll.create_index('uname_lower', unique=True, background=True)
+  await coll.create_index('mail_lower', sparse=True, background=True)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
+import asyncio
 import atexit
 import coloredlogs
+import gc
 import logging
 import os
 import shutil
@@ -15,6 +17,8 @@ from vj4.util import options
 
 options.define('listen', default='http://127.0.0.1:8888', help='Server listening address.')
 options.define('prefork', default=1, help='Number of prefork workers.')
+options.define('preload', default=False,
+               help='Initialize the application before forking workers, to share its memory.')
 options.define('syslog', default=False, help='Use syslog instead of stderr for logging.')
 options.define('listen_owner', default='', help='Owner of the unix socket which is server listening to.')
 options.define('listen_group', default='', help='Group of the unix socket which is server listening to.')
@@ -55,13 +59,22 @@ def main():
   else:
     _logger.error('Invalid listening scheme %s', url.scheme)
     return 1
+  if options.preload:
+    application = app.Application()
+    if hasattr(gc, 'freeze'):
+      # Keep objects of the application out of collections, which would copy their pages.
+      gc.freeze()
   for i in range(1, options.prefork):
     pid = os.fork()
     if not pid:
       break
     else:
       atexit.register(lambda: os.kill(pid, signal.SIGTERM))
-  web.run_app(app.Application(), sock=sock, access_log=None, shutdown_timeout=0)
+  if options.preload:
+    asyncio.set_event_loop(asyncio.new_event_loop())
+  else:
+    application = app.Application()
+  web.run_app(application, sock=sock, access_log=None, shutdown_timeout=0)
 
 if __name__ == '__main__':
   sys.exit(main())
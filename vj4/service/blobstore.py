@@ -0,0 +1,282 @@
+"""Storage backends of fs file contents other than GridFS.
+
+Metadata of all fs files stays in the fs.files collection, and metadata.storage of a file names the
+backend holding its contents. Files without metadata.storage are stored in GridFS. Objects are
+written once under a key and never modified.
+"""
+import asyncio
+import datetime
+import hashlib
+import hmac
+import os
+import tempfile
+from urllib import parse
+
+import aiohttp
+
+from vj4 import error
+from vj4.util import options
+
+options.define('fs_storage', default='gridfs',
+               help='Storage backend of new fs files: gridfs, local or s3.')
+options.define('fs_local_dir', default='', help='Directory of the local storage backend.')
+options.define('s3_endpoint', default='http://localhost:9000',
+               help='Endpoint URL of the S3 compatible storage backend.')
+options.define('s3_region', default='us-east-1', help='Region of the S3 storage backend.')
+options.define('s3_bucket', default='vj4', help='Bucket of the S3 storage backend.')
+options.define('s3_access_key', default='', help='Access key of the S3 storage backend.')
+options.define('s3_secret_key', default='', help='Secret key of the S3 storage backend.')
+
+STORAGE_GRIDFS = 'gridfs'
+STORAGE_LOCAL = 'local'
+STORAGE_S3 = 's3'
+
+CHUNK_SIZE = 255 * 1024  # same as GridFS
+S3_SPOOL_SIZE = 2 ** 22
+
+_stores = {}
+
+
+class BlobStore(object):
+  """Interface of a storage backend."""
+
+  async def open_write(self, key):
+    """Open an object for writing. Returns a writer with coroutines write, close and abort.
+
+    The object becomes visible after close.
+    """
+    raise NotImplementedError()
+
+  async def open_read(self, key, start=0):
+    """Open an object for reading from the offset. Returns a reader with coroutines readchunk and
+    close. readchunk returns an empty bytes at the end.
+    """
+    raise NotImplementedError()
+
+  async def delete(self, key):
+    raise NotImplementedError()
+
+  async def close(self):
+    """Release resources held by the backend, e.g. connections."""
+    pass
+
+
+def _run(func, *args):
+  return asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+class _LocalWriter(object):
+  def __init__(self, path, file_object, tmp_path):
+    self._path = path
+    self._file_object = file_object
+    self._tmp_path = tmp_path
+
+  async def write(self, data):
+    await _run(self._file_object.write, data)
+
+  async def close(self):
+    await _run(self._file_object.close)
+    os.replace(self._tmp_path, self._path)
+
+  async def abort(self):
+    await _run(self._file_object.close)
+    os.remove(self._tmp_path)
+
+
+class _LocalReader(object):
+  def __init__(self, file_object):
+    self._file_object = file_object
+
+  async def readchunk(self):
+    return await _run(self._file_object.read, CHUNK_SIZE)
+
+  async def close(self):
+    self._file_object.close()
+
+
+class LocalBlobStore(BlobStore):
+  """Stores objects as files in a local directory, which may be a network file system."""
+
+  def __init__(self, root_dir):
+    if not root_dir:
+      raise error.InvalidArgumentError('fs_local_dir')
+    self._root_dir = root_dir
+
+  def _path(self, key):
+    return os.path.join(self._root_dir, key[-2:], key)
+
+  async def open_write(self, key):
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_object = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=key + '.',
+                                              suffix='.tmp', delete=False)
+    return _LocalWriter(path, file_object, file_object.name)
+
+  async def open_read(self, key, start=0):
+    try:
+      file_object = open(self._path(key), 'rb')
+    except FileNotFoundError:
+      raise error.NotFoundError(key)
+    file_object.seek(start)
+    return _LocalReader(file_object)
+
+  async def delete(self, key):
+    try:
+      os.remove(self._path(key))
+    except FileNotFoundError:
+      pass
+
+
+def _hmac(key, msg):
+  return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+def sign_s3(method, url, headers, payload_hash, access_key, secret_key, region, now):
+  """Sign a request with AWS Signature Version 4. Adds headers needed to the dict of headers."""
+  url = parse.urlsplit(url)
+  amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+  scope = '{}/{}/s3/aws4_request'.format(now.strftime('%Y%m%d'), region)
+  headers['Host'] = url.netloc
+  headers['x-amz-date'] = amz_date
+  headers['x-amz-content-sha256'] = payload_hash
+  canonical_headers = sorted((name.lower(), ' '.join(str(value).split()))
+                             for name, value in headers.items())
+  signed_headers = ';'.join(name for name, _ in canonical_headers)
+  canonical_query = '&'.join(
+      '{}={}'.format(parse.quote(name, safe='-_.~'), parse.quote(value, safe='-_.~'))
+      for name, value in sorted(parse.parse_qsl(url.query, keep_blank_values=True)))
+  canonical_request = '\n'.join([method, parse.quote(url.path or '/', safe='/-_.~'),
+                                 canonical_query,
+                                 ''.join('{}:{}\n'.format(name, value)
+                                         for name, value in canonical_headers),
+                                 signed_headers, payload_hash])
+  string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                              hashlib.sha256(canonical_request.encode()).hexdigest()])
+  key = _hmac(('AWS4' + secret_key).encode(), now.strftime('%Y%m%d'))
+  for part in [region, 's3', 'aws4_request']:
+    key = _hmac(key, part)
+  signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+  headers['Authorization'] = \
+    'AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}'.format(
+        access_key, scope, signed_headers, signature)
+  return headers
+
+
+class _S3Writer(object):
+  def __init__(self, store, key):
+    self._store = store
+    self._key = key
+    # Small objects are buffered in memory, larger ones spooled to a temporary file.
+    self._buffer = bytearray()
+    self._file_object = None
+    self._length = 0
+    self._sha256 = hashlib.sha256()
+
+  async def write(self, data):
+    self._sha256.update(data)
+    self._length += len(data)
+    if not self._file_object and len(self._buffer) + len(data) <= S3_SPOOL_SIZE:
+      self._buffer.extend(data)
+      return
+    if not self._file_object:
+      self._file_object = tempfile.TemporaryFile()
+      await _run(self._file_object.write, bytes(self._buffer))
+      self._buffer = bytearray()
+    await _run(self._file_object.write, data)
+
+  async def close(self):
+    try:
+      if self._file_object:
+        self._file_object.seek(0)
+        data = self._file_object
+      else:
+        data = bytes(self._buffer)
+      # S3 rejects a PUT without Content-Length, so the body must not be chunked.
+      response = await self._store._request('PUT', self._key,
+                                            payload_hash=self._sha256.hexdigest(),
+                                            headers={'Content-Length': str(self._length)},
+                                            data=data)
+      response.release()
+    finally:
+      await self.abort()
+
+  async def abort(self):
+    if self._file_object:
+      self._file_object.close()
+    self._buffer = bytearray()
+
+
+class _S3Reader(object):
+  def __init__(self, response):
+    self._response = response
+
+  async def readchunk(self):
+    chunk = await self._response.content.read(CHUNK_SIZE)
+    if not chunk:
+      self._response.release()
+    return chunk
+
+  async def close(self):
+    self._response.release()
+
+
+class S3BlobStore(BlobStore):
+  """Stores objects in a bucket of an S3 compatible service, such as MinIO, with path-style URLs."""
+
+  def __init__(self, endpoint, region, bucket, access_key, secret_key):
+    self._endpoint = endpoint.rstrip('/')
+    self._region = region
+    self._bucket = bucket
+    self._access_key = access_key
+    self._secret_key = secret_key
+    self._session = None
+
+  async def _request(self, method, key, *, payload_hash=hashlib.sha256(b'').hexdigest(),
+                     headers=None, data=None, ok_statuses=(200, 204, 206)):
+    if not self._session:
+      self._session = aiohttp.ClientSession()
+    url = '{}/{}/{}'.format(self._endpoint, self._bucket, key)
+    headers = sign_s3(method, url, dict(headers or {}), payload_hash, self._access_key,
+                      self._secret_key, self._region, datetime.datetime.utcnow())
+    response = await self._session.request(method, url, headers=headers, data=data)
+    if response.status not in ok_statuses:
+      response.release()
+      if response.status == 404:
+        raise error.NotFoundError(key)
+      raise error.Error('S3 {} {} failed with status {}'.format(method, key, response.status))
+    return response
+
+  async def open_write(self, key):
+    return _S3Writer(self, key)
+
+  async def open_read(self, key, start=0):
+    headers = {'Range': 'bytes={}-'.format(start)} if start else {}
+    return _S3Reader(await self._request('GET', key, headers=headers))
+
+  async def delete(self, key):
+    (await self._request('DELETE', key, ok_statuses=(200, 204, 404))).release()
+
+  async def close(self):
+    if self._session:
+      await self._session.close()
+      self._session = None
+
+
+def get(storage):
+  """Get the backend by name, which is not GridFS."""
+  if storage not in _stores:
+    if storage == STORAGE_LOCAL:
+      _stores[storage] = LocalBlobStore(options.fs_local_dir)
+    elif storage == STORAGE_S3:
+      _stores[storage] = S3BlobStore(options.s3_endpoint, options.s3_region, options.s3_bucket,
+                                     options.s3_access_key, options.s3_secret_key)
+    else:
+      raise error.InvalidArgumentError('storage')
+  return _stores[storage]
+
+
+async def uninit():
+  stores = list(_stores.values())
+  _stores.clear()
+  for store in stores:
+    await store.close()
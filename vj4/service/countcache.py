@@ -0,0 +1,154 @@
+"""Cache of collection counts which is maintained incrementally.
+
+Counts are keyed by collection and normalized query. Insertions and deletions broadcast over the
+bus adjust the cached counts of simple equality queries which match the document, and drop the
+others. Every count is recounted from database after countcache_ttl_seconds for reconciliation.
+
+Only counts of queries on COUNTED_FIELDS are cached, so that modifying other fields, e.g. the
+content of a document, broadcasts nothing. Other queries are counted from database every time.
+"""
+import collections
+import time
+
+from vj4 import db
+from vj4.service import bus
+from vj4.util import options
+
+options.define('countcache_ttl_seconds', default=600,
+               help='Time to live of cached counts before they are recounted, in seconds.')
+options.define('countcache_max_entries', default=4096,
+               help='Maximum number of entries in countcache.')
+
+# Fields which queries of cached counts may use, for each collection. It is the same in all
+# processes, so modifying other fields is known to affect no cached count in any process.
+COUNTED_FIELDS = {
+    'document': frozenset(['domain_id', 'doc_type', 'hidden', 'category', 'tag', 'rule',
+                           'parent_doc_type', 'parent_doc_id']),
+}
+
+_cache = collections.OrderedDict()
+_initialized = False
+
+
+def _normalize(value):
+  if isinstance(value, dict):
+    return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+  if isinstance(value, (list, tuple)):
+    return tuple(_normalize(v) for v in value)
+  return value
+
+
+def _is_operator_value(value):
+  return isinstance(value, dict) and any(k.startswith('$') for k in value)
+
+
+def _is_simple(query):
+  """Whether the query only consists of equality conditions on fields."""
+  return all(not k.startswith('$') and not _is_operator_value(v) for k, v in query.items())
+
+
+def _match(query, doc):
+  for key, value in query.items():
+    doc_value = doc.get(key)
+    if doc_value != value and not (isinstance(doc_value, list) and value in doc_value):
+      return False
+  return True
+
+
+def _fields(query):
+  result = set()
+  for key, value in query.items():
+    if key.startswith('$'):
+      if isinstance(value, list):
+        for sub_query in value:
+          result.update(_fields(sub_query))
+    else:
+      result.add(key.split('.')[0])
+  return result
+
+
+def _may_overlap(query, other):
+  for key, value in query.items():
+    if key in other and not _is_operator_value(value) and not _is_operator_value(other[key]) \
+       and not isinstance(value, list) and not isinstance(other[key], list) \
+       and value != other[key]:
+      return False
+  return True
+
+
+async def _on_inc(e):
+  coll_name, doc, value = e['value']['coll'], e['value']['doc'], e['value']['inc']
+  for key, entry in list(_cache.items()):
+    if key[0] != coll_name:
+      continue
+    query = entry[0]
+    if not _is_simple(query):
+      if _may_overlap(query, doc):
+        del _cache[key]
+    elif _match(query, doc):
+      entry[1] += value
+
+
+async def _on_invalidate(e):
+  coll_name, query, fields = e['value']['coll'], e['value']['query'], e['value']['fields']
+  if fields is not None:
+    fields = set(fields)
+  for key, entry in list(_cache.items()):
+    if key[0] != coll_name or not _may_overlap(entry[0], query):
+      continue
+    if fields is None or not fields.isdisjoint(_fields(entry[0])):
+      del _cache[key]
+
+
+def init():
+  global _initialized
+  bus.subscribe(_on_inc, ['countcache-inc'])
+  bus.subscribe(_on_invalidate, ['countcache-invalidate'])
+  _initialized = True
+
+
+async def count(coll_name, query):
+  """Count documents in the collection which match the query, from cache if possible."""
+  if not _initialized or not _fields(query) <= COUNTED_FIELDS.get(coll_name, frozenset()):
+    return await db.coll(coll_name).find(query).count()
+  key = (coll_name, _normalize(query))
+  now = time.time()
+  entry = _cache.get(key)
+  if entry and entry[2] > now:
+    _cache.move_to_end(key)
+    return entry[1]
+  value = await db.coll(coll_name).find(query).count()
+  _cache[key] = [query, value, now + options.countcache_ttl_seconds]
+  _cache.move_to_end(key)
+  if len(_cache) > options.countcache_max_entries:
+    _cache.popitem(False)
+  return value
+
+
+async def inc(coll_name, doc, value):
+  """Broadcast that a document has been inserted (value=1) or deleted (value=-1)."""
+  if not _initialized:
+    return
+  await bus.publish('countcache-inc', {'coll': coll_name, 'doc': doc, 'inc': value})
+
+
+async def invalidate(coll_name, query, fields=None):
+  """Drop counts which may be affected by modifying the fields of documents matching the query.
+
+  If fields is None, the documents may be inserted or deleted.
+  """
+  if not _initialized:
+    return
+  if fields is not None and COUNTED_FIELDS.get(coll_name, frozenset()).isdisjoint(fields):
+    return
+  await bus.publish('countcache-invalidate',
+                    {'coll': coll_name, 'query': query,
+                     'fields': list(fields) if fields is not None else None})
+
+
+def uninit():
+  global _initialized
+  bus.unsubscribe(_on_inc)
+  bus.unsubscribe(_on_invalidate)
+  _initialized = False
+  _cache.clear()
@@ -0,0 +1,146 @@
+"""On-disk LRU cache of fs files keyed by MD5, shared by processes on the same host.
+
+A file is filled by writing a temporary file and renaming it into place, so readers never see a
+partial file. The modification time of a cached file is the upload date of the fs file, and the
+access time is set on every hit. When the total size exceeds fscache_max_bytes, the least
+recently accessed files are evicted.
+"""
+import asyncio
+import calendar
+import hashlib
+import logging
+import os
+import time
+
+from vj4.model import fs
+from vj4.util import options
+
+options.define('fscache_dir', default='',
+               help='Directory of the local cache of fs files. Empty to disable the cache.')
+options.define('fscache_max_bytes', default=2 ** 30,
+               help='Maximum total size of the local cache of fs files, in bytes.')
+options.define('fscache_max_file_bytes', default=2 ** 27,
+               help='Maximum size of a file to put in the local cache of fs files, in bytes.')
+
+TMP_SUFFIX = '.tmp'
+STALE_TMP_SECONDS = 600
+EVICT_RATIO = 0.9
+
+_logger = logging.getLogger(__name__)
+_filling = set()
+_size = None  # total size in the last scan, None if not scanned yet
+_unscanned = 0  # bytes filled by this process since the last scan
+
+
+def _path(md5):
+  return os.path.join(options.fscache_dir, md5[:2], md5)
+
+
+def get_path(md5):
+  """Get the path of a cached file and mark it as recently used. Returns None on miss."""
+  if not options.fscache_dir:
+    return None
+  path = _path(md5)
+  try:
+    os.utime(path, (time.time(), os.stat(path).st_mtime))
+  except FileNotFoundError:
+    return None
+  return path
+
+
+def _write(file_object, md5, chunk):
+  md5.update(chunk)
+  file_object.write(chunk)
+
+
+def _evict(cache_dir, max_bytes):
+  entries = []
+  total = 0
+  for sub_dir in os.scandir(cache_dir):
+    if not sub_dir.is_dir():
+      continue
+    for entry in os.scandir(sub_dir.path):
+      if entry.name.endswith(TMP_SUFFIX):
+        continue
+      try:
+        stat = entry.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_atime, stat.st_size, entry.path))
+      total += stat.st_size
+  if total <= max_bytes:
+    return total
+  entries.sort()
+  for _, size, path in entries:
+    if total <= max_bytes * EVICT_RATIO:
+      break
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+    total -= size
+  return total
+
+
+async def _maybe_evict(length):
+  global _size, _unscanned
+  _unscanned += length
+  # Other processes fill the cache too, so rescan after filling a fraction of the limit.
+  if (_size is not None and _size + _unscanned <= options.fscache_max_bytes
+      and _unscanned < options.fscache_max_bytes // 8):
+    return
+  _unscanned = 0
+  _size = await asyncio.get_event_loop().run_in_executor(
+      None, _evict, options.fscache_dir, options.fscache_max_bytes)
+
+
+async def _fill(file_id, md5, upload_date):
+  path = _path(md5)
+  tmp_path = path + TMP_SUFFIX
+  loop = asyncio.get_event_loop()
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  try:
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+  except FileExistsError:
+    # Being filled by another process, unless it died while filling.
+    if time.time() - os.stat(tmp_path).st_mtime > STALE_TMP_SECONDS:
+      os.remove(tmp_path)
+    return
+  replaced = False
+  try:
+    file_md5 = hashlib.md5()
+    with os.fdopen(fd, 'wb') as file_object:
+      grid_out = await fs.get(file_id)
+      chunk = await grid_out.readchunk()
+      while chunk:
+        await loop.run_in_executor(None, _write, file_object, file_md5, chunk)
+        chunk = await grid_out.readchunk()
+    if file_md5.hexdigest() != md5:
+      return
+    os.utime(tmp_path, (time.time(), calendar.timegm(upload_date.utctimetuple())))
+    os.replace(tmp_path, path)
+    replaced = True
+  finally:
+    # Also on cancellation, which is not an Exception since Python 3.8.
+    if not replaced:
+      os.remove(tmp_path)
+  await _maybe_evict(grid_out.length)
+
+
+async def _fill_and_log(file_id, md5, upload_date):
+  try:
+    await _fill(file_id, md5, upload_date)
+  except Exception as e:
+    _logger.exception(e)
+  finally:
+    _filling.discard(md5)
+
+
+def fill_later(grid_out):
+  """Put an fs file in the cache in background."""
+  if (not options.fscache_dir or grid_out.length > options.fscache_max_file_bytes
+      or grid_out.md5 in _filling):
+    return
+  _filling.add(grid_out.md5)
+  asyncio.get_event_loop().create_task(
+      _fill_and_log(grid_out._id, grid_out.md5, grid_out.upload_date))
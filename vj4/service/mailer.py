@@ -1,9 +1,17 @@
+"""Mail delivery.
+
+Mails are put in the outbox collection and sent by background senders in every server process,
+each of which keeps an authenticated SMTP connection while there are mails due. Failed mails are
+retried with exponential backoff.
+"""
 import aiosmtplib
 import aiosmtplib.errors
+import asyncio
 import logging
 from email.mime import text
 
 from vj4 import error
+from vj4.model import outbox
 from vj4.util import argmethod
 from vj4.util import options
 
@@ -12,25 +20,131 @@ options.define('smtp_port', default=465, help='SMTP server')
 options.define('smtp_user', default='', help='SMTP username')
 options.define('smtp_password', default='', help='SMTP password')
 options.define('mail_from', default='', help='Mail from')
+options.define('mail_senders', default=2,
+               help='Number of SMTP connections sending mails in each process.')
+options.define('mail_poll_interval_seconds', default=10,
+               help='Interval to check for mails queued by other processes, in seconds.')
+options.define('mail_max_attempts', default=8, help='Maximum attempts to send a mail.')
+
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
 
 _logger = logging.getLogger(__name__)
+_wakeup = None
+_sender_tasks = []
 
 
-@argmethod.wrap
-async def send_mail(to: str, subject: str, content: str):
+def _build_message(to, subject, content):
   msg = text.MIMEText(content, _subtype='html', _charset='UTF-8')
   msg['Subject'] = subject
   msg['From'] = options.mail_from
   msg['To'] = to
+  return msg.as_string()
+
+
+async def _connect():
+  server = aiosmtplib.SMTP_SSL(hostname=options.smtp_host, port=options.smtp_port)
+  await server.connect()
+  await server.ehlo()
+  await server.login(options.smtp_user, options.smtp_password)
+  return server
 
+
+@argmethod.wrap
+async def send_mail(to: str, subject: str, content: str):
+  """Send a mail immediately, bypassing the outbox."""
   try:
     async with aiosmtplib.SMTP_SSL(hostname=options.smtp_host, port=options.smtp_port) as server:
       await server.ehlo()
       await server.login(options.smtp_user, options.smtp_password)
-      await server.sendmail(options.mail_from, to, msg.as_string())
+      await server.sendmail(options.mail_from, to, _build_message(to, subject, content))
   except aiosmtplib.errors.SMTPException as e:
     _logger.exception(e)
     raise error.SendMailError(to)
 
+
+@argmethod.wrap
+async def queue_mail(to: str, subject: str, content: str):
+  """Put a mail in the outbox to be sent in background."""
+  mail_id = await outbox.add(to, subject, content)
+  if _wakeup:
+    _wakeup.set()
+  return mail_id
+
+
+def _get_retry_delay(attempts):
+  return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+async def _send_all():
+  """Send due mails over one connection until none is due."""
+  server = None
+  try:
+    while True:
+      mdoc = await outbox.claim(LEASE_SECONDS)
+      if not mdoc:
+        break
+      try:
+        if not server:
+          server = await _connect()
+        await server.sendmail(options.mail_from, mdoc['to'],
+                              _build_message(mdoc['to'], mdoc['subject'], mdoc['content']))
+      except Exception as e:
+        # Any failure, e.g. of building the message, counts as an attempt, so that a mail which
+        # never succeeds is dropped eventually.
+        is_connection_error = isinstance(e, (aiosmtplib.errors.SMTPException, OSError))
+        if server and is_connection_error:
+          server.close()
+          server = None
+        if mdoc['attempts'] >= options.mail_max_attempts:
+          _logger.error('Dropping mail to %s after %d attempts: %s',
+                        mdoc['to'], mdoc['attempts'], e)
+          await outbox.delete(mdoc['_id'])
+        else:
+          _logger.warning('Failed to send mail to %s: %s', mdoc['to'], e)
+          await outbox.retry(mdoc['_id'], _get_retry_delay(mdoc['attempts']), str(e))
+          if is_connection_error:
+            # Back off the connection too, the server is likely unavailable.
+            break
+      else:
+        await outbox.delete(mdoc['_id'])
+  finally:
+    if server:
+      try:
+        await server.quit()
+      except (aiosmtplib.errors.SMTPException, OSError):
+        server.close()
+
+
+async def _sender():
+  while True:
+    try:
+      await asyncio.wait_for(_wakeup.wait(), options.mail_poll_interval_seconds)
+    except asyncio.TimeoutError:
+      pass
+    _wakeup.clear()
+    try:
+      await _send_all()
+    except Exception as e:
+      _logger.exception(e)
+
+
+def init():
+  global _wakeup
+  loop = asyncio.get_event_loop()
+  _wakeup = asyncio.Event()
+  for i in range(options.mail_senders):
+    _sender_tasks.append(loop.create_task(_sender()))
+
+
+def uninit():
+  global _wakeup
+  for task in _sender_tasks:
+    task.cancel()
+  _sender_tasks.clear()
+  _wakeup = None
+
+
 if __name__ == '__main__':
   argmethod.invoke_by_args()
@@ -0,0 +1,78 @@
+"""Cache of pages rendered for guests.
+
+Pages are keyed by path with query, domain, locale and whether JSON is preferred. All pages of a
+domain are dropped when a document in the domain or the domain itself is modified, which is
+broadcast over the bus. Counters incremented in place, e.g. views, are refreshed by TTL only.
+
+Every modification publishes its own message, so a request modifying several documents, e.g. a
+discussion reply which adds the reply and updates the discussion, publishes several. Messages are
+not merged, since a page rendered between two modifications would be stale after the second.
+"""
+import collections
+import hashlib
+import time
+
+from vj4.service import bus
+from vj4.util import options
+
+options.define('pagecache_ttl_seconds', default=60,
+               help='Time to live of pages cached for guests, in seconds.')
+options.define('pagecache_max_entries', default=1024,
+               help='Maximum number of pages cached for guests.')
+options.define('pagecache_max_age_seconds', default=30,
+               help='max-age in Cache-Control of pages cached for guests, for front end caches.')
+
+Entry = collections.namedtuple('Entry', ['body', 'content_type', 'etag', 'expire_at'])
+
+_cache = collections.OrderedDict()
+_initialized = False
+
+
+async def _on_invalidate(e):
+  domain_id = e['value']['domain_id']
+  for key in [key for key in _cache if key[1] == domain_id]:
+    del _cache[key]
+
+
+def init():
+  global _initialized
+  bus.subscribe(_on_invalidate, ['pagecache-invalidate'])
+  _initialized = True
+
+
+def get(key):
+  """Get the entry of a page. key is a tuple whose second element is the domain ID."""
+  entry = _cache.get(key)
+  if not entry:
+    return None
+  if entry.expire_at <= time.time():
+    del _cache[key]
+    return None
+  _cache.move_to_end(key)
+  return entry
+
+
+def set(key, body, content_type):
+  """Cache a page. Returns the entry."""
+  entry = Entry(body, content_type, '"{}"'.format(hashlib.sha1(body).hexdigest()),
+                time.time() + options.pagecache_ttl_seconds)
+  if _initialized:
+    _cache[key] = entry
+    _cache.move_to_end(key)
+    if len(_cache) > options.pagecache_max_entries:
+      _cache.popitem(False)
+  return entry
+
+
+async def invalidate(domain_id):
+  """Drop cached pages of the domain in all processes. Costs one bus message per call."""
+  if not _initialized:
+    return
+  await bus.publish('pagecache-invalidate', {'domain_id': domain_id})
+
+
+def uninit():
+  global _initialized
+  bus.unsubscribe(_on_invalidate)
+  _initialized = False
+  _cache.clear()
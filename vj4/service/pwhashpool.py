@@ -0,0 +1,69 @@
+"""Bounded process pool to hash passwords without blocking the event loop.
+
+Each server process owns a small pool created on first use, which is after forking. Hashing tasks
+beyond pwhash_max_pending are rejected with ServiceUnavailableError instead of queueing up behind
+a login storm.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import time
+
+from vj4 import error
+from vj4.util import options
+from vj4.util import pwhash
+
+options.define('pwhash_processes', default=1,
+               help='Number of processes to hash passwords in each server process.')
+options.define('pwhash_max_pending', default=32,
+               help='Maximum number of pending password hashing tasks in each server process.')
+
+_logger = logging.getLogger(__name__)
+_executor = None
+_pending = 0
+_stats = collections.Counter()
+
+
+async def _run(func, *args):
+  global _executor, _pending
+  if _pending >= options.pwhash_max_pending:
+    _stats['rejected'] += 1
+    _logger.warning('Password hashing rejected with %d pending tasks', _pending)
+    raise error.ServiceUnavailableError()
+  if not _executor:
+    _executor = concurrent.futures.ProcessPoolExecutor(options.pwhash_processes)
+  _pending += 1
+  _stats['max_pending'] = max(_stats['max_pending'], _pending)
+  start = time.time()
+  try:
+    return await asyncio.get_event_loop().run_in_executor(_executor, func, *args)
+  finally:
+    _pending -= 1
+    _stats['completed'] += 1
+    _stats['total_seconds'] += time.time() - start
+
+
+async def hash_vj4(password, salt):
+  return await _run(pwhash.hash_vj4, password, salt)
+
+
+async def check(password, salt, hash):
+  return await _run(pwhash.check, password, salt, hash)
+
+
+def get_stats():
+  """Get queue metrics: pending, max_pending, completed, rejected and total_seconds."""
+  return {'pending': _pending, 'max_pending': _stats['max_pending'],
+          'completed': _stats['completed'], 'rejected': _stats['rejected'],
+          'total_seconds': _stats['total_seconds']}
+
+
+def uninit():
+  """Shut down the pool, logging the queue metrics of the process."""
+  global _executor
+  if _executor:
+    _logger.info('Password hashing: %s', get_stats())
+    _executor.shutdown()
+    _executor = None
+  _stats.clear()
@@ -0,0 +1,203 @@
+"""In-memory order-statistics index of domain users by rp.
+
+Each process materializes the ranking of a domain on first use and keeps it fresh through the
+'rp_change' and 'rp_reset' bus events, so rank queries no longer depend on the last run of
+vj4.job.rank. Ranks are periodically written back to the 'rank' field of domain.user.
+"""
+import asyncio
+import logging
+
+from vj4 import db
+from vj4.model import domain
+from vj4.model import system
+from vj4.service import bus
+from vj4.util import argmethod
+from vj4.util import options
+from vj4.util import skiplist
+
+options.define('ranking_snapshot_interval_seconds', default=300,
+               help='Interval of writing materialized ranks back to database, in seconds.')
+
+_logger = logging.getLogger(__name__)
+_indexes = {}
+_index_futures = {}
+_dirty_domain_ids = set()
+_snapshot_task = None
+
+
+class RankIndex(object):
+  """Ranks users by rp in descending order. Users with the same rp share the same rank.
+
+  Only users with positive rp are ranked.
+  """
+  def __init__(self, rps=()):
+    self._rps = {}
+    self._list = skiplist.IndexableSkipList()
+    for uid, rp in rps:
+      self.update(uid, rp)
+
+  def __len__(self):
+    return len(self._list)
+
+  def __contains__(self, uid):
+    return uid in self._rps
+
+  def update(self, uid, rp):
+    if uid in self._rps:
+      self._list.remove((-self._rps.pop(uid), uid))
+    if rp and rp > 0:
+      self._rps[uid] = rp
+      self._list.insert((-rp, uid))
+
+  def get_rp(self, uid):
+    return self._rps.get(uid)
+
+  def rank_of(self, uid):
+    if uid not in self._rps:
+      return None
+    return self._list.bisect_left((-self._rps[uid],)) + 1
+
+  def _ranked_slice(self, start, stop):
+    start = max(start, 0)
+    result = []
+    rank, last_rp = None, None
+    for index, (neg_rp, uid) in enumerate(self._list.islice(start, stop), start):
+      rp = -neg_rp
+      if rank is None:
+        rank = self._list.bisect_left((neg_rp,)) + 1
+      elif rp != last_rp:
+        rank = index + 1
+      last_rp = rp
+      result.append((rank, uid, rp))
+    return result
+
+  def page(self, page, page_size):
+    """Returns a list of (rank, uid, rp) on the page, which starts from 1."""
+    return self._ranked_slice((page - 1) * page_size, page * page_size)
+
+  def neighbors(self, uid, radius):
+    """Returns a list of (rank, uid, rp) around the user, including the user."""
+    if uid not in self._rps:
+      return []
+    index = self._list.bisect_left((-self._rps[uid], uid))
+    return self._ranked_slice(index - radius, index + radius + 1)
+
+  def iter_ranked(self):
+    return iter(self._ranked_slice(0, len(self._list)))
+
+
+async def _load(domain_id):
+  dudocs = domain.get_multi_user(domain_id=domain_id, rp={'$gt': 0.0},
+                                 fields={'_id': 0, 'uid': 1, 'rp': 1})
+  rps = []
+  async for dudoc in dudocs:
+    rps.append((dudoc['uid'], dudoc['rp']))
+  return RankIndex(rps)
+
+
+async def get_index(domain_id):
+  """Get the materialized rank index of a domain, loading it on first use."""
+  if domain_id in _indexes:
+    return _indexes[domain_id]
+  if domain_id in _index_futures:
+    return await _index_futures[domain_id]
+  future = asyncio.Future()
+  _index_futures[domain_id] = future
+  try:
+    index = await _load(domain_id)
+    _indexes[domain_id] = index
+    future.set_result(index)
+    return index
+  except Exception as e:
+    future.set_exception(e)
+    raise
+  finally:
+    del _index_futures[domain_id]
+
+
+async def _on_rp_change(e):
+  domain_id = e['value']['domain_id']
+  index = _indexes.get(domain_id)
+  if index is None:
+    return
+  for uid, rp in e['value']['rps']:
+    index.update(uid, rp)
+  _dirty_domain_ids.add(domain_id)
+
+
+async def _on_rp_reset(e):
+  _indexes.pop(e['value']['domain_id'], None)
+
+
+async def notify_rp_change(domain_id, uids):
+  """Broadcast the current rp of users after it has been modified in database."""
+  uids = list(set(uids))
+  if not uids:
+    return
+  rps = []
+  async for dudoc in domain.get_multi_user(domain_id=domain_id, uid={'$in': uids},
+                                           fields={'_id': 0, 'uid': 1, 'rp': 1}):
+    rps.append([dudoc['uid'], dudoc.get('rp', 0.0)])
+  await bus.publish('rp_change', {'domain_id': domain_id, 'rps': rps})
+
+
+async def notify_rp_reset(domain_id):
+  await bus.publish('rp_reset', {'domain_id': domain_id})
+
+
+@argmethod.wrap
+async def snapshot(domain_id: str):
+  """Write ranks of the materialized index back to database where they differ."""
+  lock = await system.acquire_lock('ranking_' + domain_id)
+  if not lock:
+    return
+  try:
+    index = await get_index(domain_id)
+    stored = {}
+    async for dudoc in domain.get_multi_user(domain_id=domain_id, rp={'$gt': 0.0},
+                                             fields={'_id': 0, 'uid': 1, 'rank': 1}):
+      stored[dudoc['uid']] = dudoc.get('rank')
+    user_bulk = db.coll('domain.user').initialize_unordered_bulk_op()
+    execute = False
+    for rank, uid, _ in index.iter_ranked():
+      if stored.get(uid) != rank:
+        user_bulk.find({'domain_id': domain_id, 'uid': uid}).update_one({'$set': {'rank': rank}})
+        execute = True
+    if execute:
+      await user_bulk.execute()
+  finally:
+    await system.release_lock('ranking_' + domain_id, lock)
+
+
+async def _snapshot_worker():
+  while True:
+    await asyncio.sleep(options.ranking_snapshot_interval_seconds)
+    domain_ids = list(_dirty_domain_ids)
+    _dirty_domain_ids.clear()
+    for domain_id in domain_ids:
+      try:
+        await snapshot(domain_id)
+      except Exception as e:
+        _logger.exception(e)
+
+
+def init():
+  global _snapshot_task
+  bus.subscribe(_on_rp_change, ['rp_change'])
+  bus.subscribe(_on_rp_reset, ['rp_reset'])
+  _snapshot_task = asyncio.get_event_loop().create_task(_snapshot_worker())
+
+
+def uninit():
+  global _snapshot_task
+  bus.unsubscribe(_on_rp_change)
+  bus.unsubscribe(_on_rp_reset)
+  if _snapshot_task:
+    _snapshot_task.cancel()
+    _snapshot_task = None
+  _indexes.clear()
+  _dirty_domain_ids.clear()
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
@@ -5,16 +5,29 @@ from vj4.service import bus
 from vj4.util import options
 
 PREFIX_DISCUSSION_NODES = 'discussion-nodes-'
+PREFIX_PNAME = 'pname-'
+PREFIX_PID = 'pid-'
 
 options.define('smallcache_max_entries', default=64,
                help='Maximum number of entries in smallcache.')
+options.define('smallcache_max_problem_entries', default=4096,
+               help='Maximum number of problem IDs in smallcache, kept apart from other entries.')
 
 _cache = collections.OrderedDict()
+# Problem IDs are many and small, so they do not evict other entries.
+_problem_cache = collections.OrderedDict()
+
+
+def _get_cache(key):
+  if key.startswith((PREFIX_PNAME, PREFIX_PID)):
+    return _problem_cache, options.smallcache_max_problem_entries
+  return _cache, options.smallcache_max_entries
 
 
 async def _on_unset(e):
-  if e['value'] in _cache:
-    del _cache[e['value']]
+  cache, _ = _get_cache(e['value'])
+  if e['value'] in cache:
+    del cache[e['value']]
 
 
 def init():
@@ -22,10 +35,11 @@ def init():
 
 
 def get_direct(key, default=None):
-  if key not in _cache:
+  cache, _ = _get_cache(key)
+  if key not in cache:
     return default
-  _cache.move_to_end(key)
-  return _cache[key]
+  cache.move_to_end(key)
+  return cache[key]
 
 
 def get(key, default=None):
@@ -33,11 +47,12 @@ def get(key, default=None):
 
 
 def set_local_direct(key, value):
-  if key in _cache:
-    del _cache[key]
-  _cache[key] = value
-  if len(_cache) > options.smallcache_max_entries:
-    _cache.popitem(False)
+  cache, max_entries = _get_cache(key)
+  if key in cache:
+    del cache[key]
+  cache[key] = value
+  if len(cache) > max_entries:
+    cache.popitem(False)
 
 
 def set_local(key, value):
@@ -51,3 +66,4 @@ async def unset_global(key):
 def uninit():
   bus.unsubscribe(_on_unset)
   _cache.clear()
+  _problem_cache.clear()
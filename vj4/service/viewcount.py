@@ -0,0 +1,83 @@
+"""Write-behind buffer of view counters of documents.
+
+Views are accumulated in process and written periodically with one bulk, so that a hot document
+does not cost a write per view. Buffered views are lost if the process is killed.
+"""
+import asyncio
+import collections
+import logging
+
+from pymongo import errors
+
+from vj4 import db
+from vj4.util import options
+
+options.define('viewcount_flush_interval_seconds', default=5,
+               help='Interval to write buffered view counters, in seconds.')
+
+_logger = logging.getLogger(__name__)
+_pending = collections.Counter()
+_flush_task = None
+
+
+async def inc(domain_id: str, doc_type: int, doc_id):
+  """Count a view of the document.
+
+  Returns:
+    The number of views not written to the document yet, including this one.
+  """
+  key = (domain_id, doc_type, doc_id)
+  if not _flush_task:
+    # Not initialized, e.g. in command line tools, so write through.
+    await db.coll('document').update_one({'domain_id': domain_id,
+                                          'doc_type': doc_type,
+                                          'doc_id': doc_id},
+                                         {'$inc': {'views': 1}})
+    return 1
+  _pending[key] += 1
+  return _pending[key]
+
+
+async def flush():
+  """Write buffered views. Views of failed updates are retried in the next flush, and views are
+  dropped if the outcome of the bulk is unknown, e.g. on network errors.
+  """
+  global _pending
+  if not _pending:
+    return
+  pending, _pending = list(_pending.items()), collections.Counter()
+  bulk = db.coll('document').initialize_unordered_bulk_op()
+  for (domain_id, doc_type, doc_id), views in pending:
+    bulk.find({'domain_id': domain_id, 'doc_type': doc_type, 'doc_id': doc_id}) \
+        .update_one({'$inc': {'views': views}})
+  try:
+    await bulk.execute()
+  except errors.BulkWriteError as e:
+    # The bulk is unordered, so updates other than the failed ones have been applied.
+    for write_error in e.details.get('writeErrors', []):
+      key, views = pending[write_error['index']]
+      _pending[key] += views
+    raise
+
+
+async def _flush_worker():
+  while True:
+    await asyncio.sleep(options.viewcount_flush_interval_seconds)
+    try:
+      await flush()
+    except Exception as e:
+      _logger.exception(e)
+
+
+def init():
+  global _flush_task
+  _flush_task = asyncio.get_event_loop().create_task(_flush_worker())
+
+
+async def uninit():
+  """Stop flushing periodically and flush the remaining views."""
+  global _flush_task
+  if _flush_task:
+    _flush_task.cancel()
+    _flush_task = None
+  await flush()
@@ -1,3 +1,5 @@
+import logging
+import os
 from os import path
 
 import jinja2
@@ -8,10 +10,19 @@ import vj4
 import vj4.constant
 import vj4.job
 from vj4.service import staticmanifest
+from vj4.util import argmethod
 from vj4.util import json
 from vj4.util import misc
 from vj4.util import options
 
+options.define('template_cache_dir', default='',
+               help='Directory of compiled templates shared by processes. Empty to disable.')
+
+TEMPLATE_EXTENSIONS = ['html']
+
+_logger = logging.getLogger(__name__)
+_env = None
+
 
 class Undefined(jinja2.runtime.Undefined):
   def __getitem__(self, _):
@@ -21,16 +32,24 @@ class Undefined(jinja2.runtime.Undefined):
     __str__ = jinja2.runtime.Undefined.__call__
 
 
+def _get_bytecode_cache():
+  if not options.template_cache_dir:
+    return None
+  os.makedirs(options.template_cache_dir, exist_ok=True)
+  return jinja2.FileSystemBytecodeCache(options.template_cache_dir)
+
+
 class Environment(jinja2.Environment):
   def __init__(self):
     super(Environment, self).__init__(
         loader=jinja2.FileSystemLoader(path.join(path.dirname(__file__), 'ui/templates')),
         extensions=[jinja2.ext.with_],
         auto_reload=options.debug,
+        cache_size=-1,  # keep all templates loaded
+        bytecode_cache=_get_bytecode_cache(),
         autoescape=True,
         trim_blocks=True,
         undefined=Undefined)
-    globals()[self.__class__.__name__] = lambda: self  # singleton
 
     self.globals['vj4'] = vj4
     self.globals['static_url'] = lambda s: options.cdn_prefix + staticmanifest.get(s)
@@ -43,3 +62,31 @@ class Environment(jinja2.Environment):
     self.filters['format_size'] = misc.format_size
     self.filters['format_seconds'] = misc.format_seconds
     self.filters['base64_encode'] = misc.base64_encode
+
+  def warm_up(self):
+    """Load all templates, compiling those not in the bytecode cache. Returns the count."""
+    names = self.list_templates(extensions=TEMPLATE_EXTENSIONS)
+    for name in names:
+      self.get_template(name)
+    return len(names)
+
+
+def get_env():
+  """Get the environment shared by all renders of the process, so that loaded templates are kept."""
+  global _env
+  if not _env:
+    _env = Environment()
+  return _env
+
+
+@argmethod.wrap
+def precompile():
+  """Compile all templates into the bytecode cache, e.g. at build time. Needs no database."""
+  if not options.template_cache_dir:
+    _logger.warning('--template-cache-dir is not set, templates are compiled in memory only.')
+  return get_env().warm_up()
+
+
+if __name__ == '__main__':
+  # Templates are compiled at build time, where no database may be available.
+  argmethod.invoke_by_args(init_db=False)
@@ -7,7 +7,9 @@ import pymongo
 
 from vj4 import db
 from vj4.service import bus
+from vj4.service import countcache
 from vj4.service import event
+from vj4.service import pagecache
 from vj4.service import queue
 from vj4.service import smallcache
 from vj4.util import options
@@ -76,6 +78,26 @@ class SmallcacheTestCase(BusTestCase):
     super(SmallcacheTestCase, self).tearDown()
 
 
+class CountcacheTestCase(BusTestCase):
+  def setUp(self):
+    super(CountcacheTestCase, self).setUp()
+    countcache.init()
+
+  def tearDown(self):
+    countcache.uninit()
+    super(CountcacheTestCase, self).tearDown()
+
+
+class PagecacheTestCase(BusTestCase):
+  def setUp(self):
+    super(PagecacheTestCase, self).setUp()
+    pagecache.init()
+
+  def tearDown(self):
+    pagecache.uninit()
+    super(PagecacheTestCase, self).tearDown()
+
+
 def wrap_coro(coro):
   @functools.wraps(coro)
   def wrapped(*args, **kwargs):
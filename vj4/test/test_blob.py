@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+import hashlib
+import io
+import unittest
+import zipfile
+
+from bson import objectid
+
+from vj4 import db
+from vj4 import error
+from vj4.model import blob
+from vj4.model import fs
+from vj4.test import base
+from vj4.util import options
+
+CONFIG = b'1\ninput0.txt|output0.txt|1|10|262144\n'
+INPUT = b'1 2\n'
+OUTPUT = b'3\n'
+OUTPUT2 = b'4\n'
+
+
+def make_zip(files):
+  output_buffer = io.BytesIO()
+  with zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+    zip_file.writestr('Input/', b'')
+    for name, content in files:
+      zip_file.writestr(name, content)
+  return output_buffer.getvalue()
+
+
+class BlobTest(base.DatabaseTestCase):
+  @base.wrap_coro
+  async def test_manifest(self):
+    file_id = await fs.add_data('application/zip', make_zip(
+        [('Config.ini', CONFIG), ('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT)]))
+    mdoc = await blob.add_manifest(file_id)
+    self.assertEqual(mdoc['md5'], await fs.get_md5(file_id))
+    self.assertListEqual([(file['name'], file['size']) for file in mdoc['files']],
+                         [('Config.ini', len(CONFIG)), ('Input/input0.txt', len(INPUT)),
+                          ('Output/output0.txt', len(OUTPUT))])
+    sha256 = hashlib.sha256(INPUT).hexdigest()
+    self.assertEqual(mdoc['files'][1]['sha256'], sha256)
+    grid_out = await blob.get(sha256)
+    self.assertEqual(await grid_out.read(), INPUT)
+    self.assertEqual(await blob.get_manifest(file_id), mdoc)
+
+  @base.wrap_coro
+  async def test_shared_blob(self):
+    file_id = await fs.add_data('application/zip', make_zip(
+        [('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT)]))
+    file_id2 = await fs.add_data('application/zip', make_zip(
+        [('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT2)]))
+    await blob.add_manifest(file_id)
+    mdoc = await blob.get_manifest(file_id2)
+    self.assertEqual(mdoc['files'][0]['sha256'], hashlib.sha256(INPUT).hexdigest())
+    sha256s = {hashlib.sha256(content).hexdigest() for content in [INPUT, OUTPUT, OUTPUT2]}
+    self.assertSetEqual(await blob.get_multi_exist(sha256s), sha256s)
+    with self.assertRaises(error.NotFoundError):
+      await blob.get(hashlib.sha256(CONFIG).hexdigest())
+
+  @base.wrap_coro
+  async def test_bad_zip(self):
+    file_id = await fs.add_data('application/zip', b'not a zip')
+    with self.assertRaises(error.ValidationError):
+      await blob.add_manifest(file_id)
+
+  @base.wrap_coro
+  async def test_add_blob_twice(self):
+    sha256 = hashlib.sha256(INPUT).hexdigest()
+    with zipfile.ZipFile(io.BytesIO(make_zip([('Input/input0.txt', INPUT)]))) as zip_file:
+      await asyncio.gather(blob._add_blob(sha256, zip_file, 'Input/input0.txt'),
+                           blob._add_blob(sha256, zip_file, 'Input/input0.txt'))
+      await blob._add_blob(sha256, zip_file, 'Input/input0.txt')
+    bdocs = await db.coll('blob.files').find({'metadata.sha256': sha256}).to_list()
+    self.assertEqual(len(bdocs), 1)
+    cdocs = await db.coll('blob.chunks').find({}).to_list()
+    self.assertSetEqual({cdoc['files_id'] for cdoc in cdocs}, {bdocs[0]['_id']})
+    grid_out = await blob.get(sha256)
+    self.assertEqual(await grid_out.read(), INPUT)
+
+  @base.wrap_coro
+  async def test_concurrent_manifest(self):
+    data = make_zip([('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT)])
+    file_id = await fs.add_data('application/zip', data)
+    file_id2 = await fs.add_data('application/zip', data)
+    mdoc, mdoc2 = await asyncio.gather(blob.add_manifest(file_id), blob.add_manifest(file_id2))
+    self.assertEqual(mdoc['files'], mdoc2['files'])
+    for file in mdoc['files']:
+      self.assertEqual(len(await db.coll('blob.files').find(
+          {'metadata.sha256': file['sha256']}).to_list()), 1)
+
+  @base.wrap_coro
+  async def test_gc(self):
+    file_id = await fs.add_data('application/zip', make_zip(
+        [('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT)]))
+    file_id2 = await fs.add_data('application/zip', make_zip(
+        [('Input/input0.txt', INPUT), ('Output/output0.txt', OUTPUT2)]))
+    await blob.add_manifest(file_id)
+    await blob.add_manifest(file_id2)
+    await fs.unlink(file_id2)
+    stale_id = objectid.ObjectId.from_datetime(datetime.datetime(2000, 1, 1))
+    await db.coll('blob.chunks').insert_one({'files_id': stale_id, 'n': 0, 'data': b''})
+    old_grace_seconds = options.blob_gc_grace_seconds
+    options.blob_gc_grace_seconds = 0
+    try:
+      self.assertEqual(await blob.gc(), 1)
+    finally:
+      options.blob_gc_grace_seconds = old_grace_seconds
+    self.assertIsNone(await db.coll('problem.data_manifest').find_one({'_id': file_id2}))
+    self.assertIsNone(await db.coll('blob.chunks').find_one({'files_id': stale_id}))
+    with self.assertRaises(error.NotFoundError):
+      await blob.get(hashlib.sha256(OUTPUT2).hexdigest())
+    grid_out = await blob.get(hashlib.sha256(INPUT).hexdigest())
+    self.assertEqual(await grid_out.read(), INPUT)
+
+
+if __name__ == '__main__':
+  unittest.main()
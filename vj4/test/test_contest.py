@@ -227,6 +227,34 @@ class AssignmentRuleTest(unittest.TestCase):
     self.assertEqual(stats['detail'], [])
 
 
+class JournalTest(unittest.TestCase):
+  def test_compact(self):
+    journal = [SUBMIT_777_AC, SUBMIT_777_NAC, SUBMIT_778_AC, SUBMIT_777_AC_LATE,
+               SUBMIT_778_AC_LATE, SUBMIT_777_NAC_LATE]
+    self.assertEqual(contest._compact_journal(journal),
+                     [SUBMIT_777_AC, SUBMIT_778_AC, SUBMIT_778_AC_LATE, SUBMIT_777_NAC_LATE])
+
+  def test_compact_nac(self):
+    journal = [SUBMIT_777_NAC, SUBMIT_777_NAC_LATE]
+    self.assertEqual(contest._compact_journal(journal), journal)
+
+  def test_update_problem_stat(self):
+    journal = [SUBMIT_777_NAC, SUBMIT_778_AC]
+    tsdoc = {'journal': journal, **contest._acm_stat(TDOC, journal)}
+    journal = [SUBMIT_778_AC, SUBMIT_777_NAC, SUBMIT_777_AC_LATE]
+    stats = contest.RULES[constant.contest.RULE_ACM].update_func(TDOC, tsdoc, journal, 777)
+    expected = contest._acm_stat(TDOC, contest._get_status_journal(journal))
+    self.assertEqual(stats['accept'], expected['accept'])
+    self.assertEqual(stats['time'], expected['time'])
+    self.assertCountEqual(stats['detail'], expected['detail'])
+
+  def test_update_problem_stat_inject(self):
+    tsdoc = {'journal': [SUBMIT_777_AC], **contest._oi_stat(TDOC, [SUBMIT_777_AC])}
+    stats = contest.RULES[constant.contest.RULE_OI].update_func(
+        TDOC, tsdoc, [SUBMIT_777_AC, SUBMIT_780_AC], 780)
+    self.assertEqual(stats['score'], 22)
+
+
 class OuterTest(base.DatabaseTestCase):
   @base.wrap_coro
   async def test_add_get(self):
@@ -0,0 +1,71 @@
+import unittest
+
+from vj4.model import document
+from vj4.model.adaptor import problem
+from vj4.service import bus
+from vj4.service import countcache
+from vj4.test import base
+
+DOMAIN_ID = 'dummy_domain'
+TITLE = 'dummy_title'
+CONTENT = 'dummy_content'
+UID = 22
+
+
+class CountcacheTest(base.CountcacheTestCase):
+  @base.wrap_coro
+  async def test_add(self):
+    self.assertEqual(await problem.count(DOMAIN_ID), 0)
+    self.assertEqual(await problem.count(DOMAIN_ID, hidden=False), 0)
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, 1)
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, 2, hidden=True)
+    self.assertEqual(len(countcache._cache), 2)
+    self.assertEqual(await problem.count(DOMAIN_ID), 2)
+    self.assertEqual(await problem.count(DOMAIN_ID, hidden=False), 1)
+
+  @base.wrap_coro
+  async def test_set(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, 1)
+    self.assertEqual(await problem.count(DOMAIN_ID), 1)
+    self.assertEqual(await problem.count(DOMAIN_ID, hidden=False), 1)
+    await problem.set_hidden(DOMAIN_ID, 1, True)
+    self.assertEqual(len(countcache._cache), 1)
+    self.assertEqual(await problem.count(DOMAIN_ID), 1)
+    self.assertEqual(await problem.count(DOMAIN_ID, hidden=False), 0)
+
+  @base.wrap_coro
+  async def test_delete(self):
+    psid = await problem.add_solution(DOMAIN_ID, 1, UID, CONTENT)
+    await problem.add_solution(DOMAIN_ID, 2, UID, CONTENT)
+    self.assertEqual(await problem.count_solution(DOMAIN_ID, 1), 1)
+    self.assertEqual(await problem.count_solution(DOMAIN_ID, 2), 1)
+    await document.delete(DOMAIN_ID, document.TYPE_PROBLEM_SOLUTION, psid)
+    self.assertEqual(len(countcache._cache), 2)
+    self.assertEqual(await problem.count_solution(DOMAIN_ID, 1), 0)
+    self.assertEqual(await problem.count_solution(DOMAIN_ID, 2), 1)
+    await document.delete_multi(DOMAIN_ID, document.TYPE_PROBLEM_SOLUTION)
+    self.assertEqual(await problem.count_solution(DOMAIN_ID, 2), 0)
+
+  @base.wrap_coro
+  async def test_uncounted_fields(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, 1)
+    self.assertEqual(await problem.count(DOMAIN_ID, owner_uid=UID), 1)
+    self.assertEqual(len(countcache._cache), 0)
+    keys = []
+    old_publish = bus.publish
+
+    async def publish(key, value):
+      keys.append(key)
+      await old_publish(key, value)
+
+    bus.publish = publish
+    try:
+      await problem.edit(DOMAIN_ID, 1, title=TITLE + '2')
+      await problem.set_hidden(DOMAIN_ID, 1, True)
+    finally:
+      bus.publish = old_publish
+    self.assertEqual(keys.count('countcache-invalidate'), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -4,6 +4,7 @@ from bson import objectid
 from vj4 import error
 from vj4.model import document
 from vj4.model.adaptor import discussion
+from vj4.service import viewcount
 from vj4.test import base
 
 DOMAIN_ID_DUMMY = 'dummy'
@@ -117,6 +118,23 @@ class DiscussionTest(base.SmallcacheTestCase):
     self.assertEqual(ddocs[0]['title'], TITLE)
     self.assertFalse('content' in ddocs[0])
 
+  @base.wrap_coro
+  async def test_inc_views(self):
+    await discussion.add_category(DOMAIN_ID_DUMMY, 'cat')
+    await discussion.add_node(DOMAIN_ID_DUMMY, 'cat', 'meow')
+    did = await discussion.add(DOMAIN_ID_DUMMY, 'meow', OWNER_UID, TITLE, CONTENT)
+    self.assertEqual((await discussion.inc_views(DOMAIN_ID_DUMMY, did))['views'], 1)
+    viewcount.init()
+    try:
+      await discussion.inc_views(DOMAIN_ID_DUMMY, did)
+      self.assertEqual((await discussion.inc_views(DOMAIN_ID_DUMMY, did))['views'], 3)
+      self.assertEqual((await discussion.get(DOMAIN_ID_DUMMY, did))['views'], 1)
+    finally:
+      await viewcount.uninit()
+    self.assertEqual((await discussion.get(DOMAIN_ID_DUMMY, did))['views'], 3)
+    with self.assertRaises(error.DiscussionNotFoundError):
+      await discussion.inc_views(DOMAIN_ID_DUMMY, objectid.ObjectId())
+
   @base.wrap_coro
   async def test_reply_add_get_del(self):
     await discussion.add_category(DOMAIN_ID_DUMMY, 'cat')
@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from vj4.service import fscache
+from vj4.util import options
+
+MD5S = ['0' * 32, '1' * 32, '2' * 32]
+
+
+class FscacheTest(unittest.TestCase):
+  def setUp(self):
+    self.old_dir = options.fscache_dir
+    options.fscache_dir = tempfile.mkdtemp()
+    for i, md5 in enumerate(MD5S):
+      path = fscache._path(md5)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'wb') as file_object:
+        file_object.write(b'x' * 100)
+      os.utime(path, (1000 + i, 0))
+
+  def tearDown(self):
+    shutil.rmtree(options.fscache_dir)
+    options.fscache_dir = self.old_dir
+
+  def test_get_path(self):
+    self.assertEqual(fscache.get_path(MD5S[0]), fscache._path(MD5S[0]))
+    self.assertIsNone(fscache.get_path('f' * 32))
+
+  def test_evict(self):
+    self.assertEqual(fscache._evict(options.fscache_dir, 300), 300)
+    fscache.get_path(MD5S[0])
+    self.assertEqual(fscache._evict(options.fscache_dir, 250), 200)
+    self.assertIsNotNone(fscache.get_path(MD5S[0]))
+    self.assertIsNone(fscache.get_path(MD5S[1]))
+    self.assertIsNotNone(fscache.get_path(MD5S[2]))
+
+  def test_fill_cancelled(self):
+    class CancelledFs(object):
+      async def get(self, file_id):
+        raise asyncio.CancelledError()
+
+    old_fs, fscache.fs = fscache.fs, CancelledFs()
+    try:
+      with self.assertRaises(asyncio.CancelledError):
+        asyncio.get_event_loop().run_until_complete(
+            fscache._fill(None, 'f' * 32, datetime.datetime.utcnow()))
+    finally:
+      fscache.fs = old_fs
+    self.assertFalse(os.path.exists(fscache._path('f' * 32) + fscache.TMP_SUFFIX))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from vj4.util import httprange
+
+
+class Test(unittest.TestCase):
+  def test_single(self):
+    self.assertListEqual(httprange.parse('bytes=0-99', 1000), [(0, 100)])
+    self.assertListEqual(httprange.parse('bytes=900-', 1000), [(900, 1000)])
+    self.assertListEqual(httprange.parse('bytes=-100', 1000), [(900, 1000)])
+    self.assertListEqual(httprange.parse('bytes=900-2000', 1000), [(900, 1000)])
+    self.assertListEqual(httprange.parse('bytes=-2000', 1000), [(0, 1000)])
+
+  def test_multiple(self):
+    self.assertListEqual(httprange.parse('bytes=500-599, 0-99', 1000), [(0, 100), (500, 600)])
+    self.assertListEqual(httprange.parse('bytes=0-99,50-149,150-199', 1000), [(0, 200)])
+    self.assertListEqual(httprange.parse('bytes=0-99,2000-', 1000), [(0, 100)])
+
+  def test_unsatisfiable(self):
+    self.assertListEqual(httprange.parse('bytes=1000-', 1000), [])
+    self.assertListEqual(httprange.parse('bytes=-0', 1000), [])
+
+  def test_ignored(self):
+    self.assertIsNone(httprange.parse(None, 1000))
+    self.assertIsNone(httprange.parse('items=0-99', 1000))
+    self.assertIsNone(httprange.parse('bytes=99-0', 1000))
+    self.assertIsNone(httprange.parse('bytes=-', 1000))
+    self.assertIsNone(httprange.parse('bytes=a-b', 1000))
+    self.assertIsNone(httprange.parse(
+        'bytes=' + ','.join('{0}-{0}'.format(i * 2) for i in range(17)), 1000))
+
+
+if __name__ == '__main__':
+  unittest.main()
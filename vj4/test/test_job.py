@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 
 from vj4 import constant
@@ -248,3 +249,22 @@ class DifficultyTest(unittest.TestCase):
   def test_integrate(self):
     for x in range(1000):
       self.assertEqual(job.difficulty._integrate(x), job.difficulty._integrate_direct(x))
+
+  def test_integrate_converged(self):
+    for x in [10 ** 4, 10 ** 5 + 1, 10 ** 6]:
+      self.assertEqual(job.difficulty._integrate(x), job.difficulty._integrate_direct(x))
+
+  def test_flush_failed(self):
+    async def get_dict_multi_domain(*args, **kwargs):
+      raise RuntimeError()
+
+    job.difficulty._dirty_pids.add((DOMAIN_ID, 1))
+    old_get_dict_multi_domain = problem.get_dict_multi_domain
+    problem.get_dict_multi_domain = get_dict_multi_domain
+    try:
+      with self.assertRaises(RuntimeError):
+        asyncio.get_event_loop().run_until_complete(job.difficulty.flush())
+    finally:
+      problem.get_dict_multi_domain = old_get_dict_multi_domain
+    self.assertIn((DOMAIN_ID, 1), job.difficulty._dirty_pids)
+    job.difficulty._dirty_pids.clear()
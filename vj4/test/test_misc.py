@@ -1,6 +1,7 @@
 import unittest
 
 from vj4.util import misc
+from vj4.util import options
 
 
 class Test(unittest.TestCase):
@@ -11,6 +12,31 @@ class Test(unittest.TestCase):
     self.assertListEqual(misc.dedupe(['b','a','b','c','b']),['b','a','c'])
     self.assertListEqual(misc.dedupe([0]),[0])
 
+  def test_markdown_cache(self):
+    text = '**bold** (vijos://fs/' + '0' * 40 + ')'
+    options.cdn_prefix = '/'
+    try:
+      markup = misc.markdown(text)
+      self.assertIn('<strong>bold</strong>', markup)
+      self.assertIs(misc.markdown(text), markup)
+      options.cdn_prefix = 'https://cdn.example.com/'
+      self.assertIn('https://cdn.example.com/fs/' + '0' * 40, misc.markdown(text))
+    finally:
+      del options.cdn_prefix
+
+  def test_markdown_cache_length(self):
+    options.cdn_prefix = '/'
+    options.markdown_cache_max_length = 100
+    try:
+      markup = misc.markdown('a' * 60)
+      self.assertIs(misc.markdown('a' * 60), markup)
+      misc.markdown('b' * 60)
+      self.assertIsNot(misc.markdown('a' * 60), markup)
+      self.assertLessEqual(misc._markdown_cache_length, 100)
+    finally:
+      del options.markdown_cache_max_length
+      del options.cdn_prefix
+
 
 if __name__ == '__main__':
   unittest.main()
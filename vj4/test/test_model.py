@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import hashlib
 import time
@@ -10,13 +11,17 @@ from pymongo import errors as pymongo_errors
 from vj4 import db
 from vj4 import error
 from vj4.model import builtin
+from vj4.model import datachange
 from vj4.model import document
 from vj4.model import domain
 from vj4.model import fs
 from vj4.model import opcount
+from vj4.model import outbox
+from vj4.model import shardcount
 from vj4.model import system
 from vj4.model import user
 from vj4.test import base
+from vj4.util import tools
 
 CONTENT = 'dummy_content'
 CONTENT2 = 'dummy_dummy'
@@ -45,6 +50,29 @@ class SystemTest(base.DatabaseTestCase):
     self.assertEqual(await system.inc_user_counter(), 2)
     self.assertEqual(await system.inc_user_counter(), 3)
 
+  @base.wrap_coro
+  async def test_index_hashes(self):
+    index_hashes = await system.get_index_hashes()
+    self.assertIn('document', index_hashes)
+    self.assertIn('user', index_hashes)
+    await system.set_index_hash('user', 'stale')
+    await tools.ensure_all_indexes()
+    self.assertEqual(await system.get_index_hashes(), index_hashes)
+
+  @base.wrap_coro
+  async def test_lease(self):
+    lease = await system.acquire_lease('dummy', 60)
+    self.assertTrue(lease)
+    self.assertIsNone(await system.acquire_lease('dummy', 60))
+    self.assertTrue(await system.renew_lease('dummy', lease, -1))
+    # The lease expired, so it can be taken over.
+    lease2 = await system.acquire_lease('dummy', 60)
+    self.assertTrue(lease2)
+    self.assertIsNone(await system.renew_lease('dummy', lease, 60))
+    self.assertIsNone(await system.release_lease('dummy', lease))
+    self.assertTrue(await system.release_lease('dummy', lease2))
+    self.assertTrue(await system.acquire_lease('dummy', 60))
+
 
 class UserTest(base.DatabaseTestCase):
   @base.wrap_coro
@@ -390,5 +418,62 @@ class OpcountTest(base.DatabaseTestCase):
     await opcount.inc(OP2, IDENT, 1, 2)
 
 
+class DatachangeTest(base.DatabaseTestCase):
+  @base.wrap_coro
+  async def test_add_concurrent(self):
+    change_at = datetime.datetime(2017, 1, 1)
+    await asyncio.gather(*[datachange.add(DOMAIN_ID, 1, change_at + datetime.timedelta(seconds=i))
+                           for i in range(4)])
+    docs = await datachange.get_multi(datetime.datetime(2016, 1, 1)).to_list()
+    self.assertEqual(len(docs), 1)
+    self.assertEqual(docs[0]['change_at'], change_at + datetime.timedelta(seconds=3))
+
+
+class ShardcountTest(base.DatabaseTestCase):
+  @base.wrap_coro
+  async def test_inc_fold(self):
+    doc_id = await document.add(DOMAIN_ID, CONTENT, OWNER_UID, DOC_TYPE, num_submit=1)
+    for i in range(3):
+      await shardcount.inc(DOMAIN_ID, DOC_TYPE, doc_id, 'num_submit', 1)
+    self.assertEqual(await shardcount.get_pending(DOMAIN_ID, DOC_TYPE, doc_id, 'num_submit'), 3)
+    doc = await document.get(DOMAIN_ID, DOC_TYPE, doc_id)
+    self.assertEqual(doc['num_submit'], 1)
+    self.assertEqual((await shardcount.fill(doc, 'num_submit'))['num_submit'], 4)
+    self.assertTrue(await shardcount.fold())
+    self.assertEqual(await shardcount.get_pending(DOMAIN_ID, DOC_TYPE, doc_id, 'num_submit'), 0)
+    doc = await document.get(DOMAIN_ID, DOC_TYPE, doc_id)
+    self.assertEqual(doc['num_submit'], 4)
+
+  @base.wrap_coro
+  async def test_fill_multi(self):
+    doc_id_1 = await document.add(DOMAIN_ID, CONTENT, OWNER_UID, DOC_TYPE, num_submit=1)
+    doc_id_2 = await document.add(DOMAIN_ID, CONTENT, OWNER_UID, DOC_TYPE)
+    await shardcount.inc(DOMAIN_ID, DOC_TYPE, doc_id_1, 'num_submit', 2)
+    await shardcount.inc(DOMAIN_ID, DOC_TYPE, doc_id_2, 'num_accept', 1)
+    docs = await shardcount.fill_multi([await document.get(DOMAIN_ID, DOC_TYPE, doc_id_1),
+                                        await document.get(DOMAIN_ID, DOC_TYPE, doc_id_2)],
+                                       'num_submit', 'num_accept')
+    self.assertEqual([(doc['num_submit'], doc['num_accept']) for doc in docs], [(3, 0), (0, 1)])
+    self.assertEqual(await shardcount.fold(), 2)
+    self.assertEqual(await shardcount.fold(), 0)
+
+
+class OutboxTest(base.DatabaseTestCase):
+  @base.wrap_coro
+  async def test_claim_retry(self):
+    mail_id = await outbox.add('a@example.org', 'subject', 'content')
+    mdoc = await outbox.claim(60)
+    self.assertEqual(mdoc['_id'], mail_id)
+    self.assertEqual(mdoc['attempts'], 1)
+    self.assertIsNone(await outbox.claim(60))
+    await outbox.retry(mail_id, -1, 'error')
+    mdoc = await outbox.claim(60)
+    self.assertEqual(mdoc['attempts'], 2)
+    self.assertEqual(mdoc['reason'], 'error')
+    await outbox.delete(mail_id)
+    await outbox.retry(mail_id, -1, 'error')
+    self.assertIsNone(await outbox.claim(60))
+
+
 if __name__ == '__main__':
   unittest.main()
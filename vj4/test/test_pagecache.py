@@ -0,0 +1,138 @@
+import collections
+import unittest
+
+from aiohttp import web
+
+from vj4.handler import base as handler_base
+from vj4.model import domain
+from vj4.model.adaptor import problem
+from vj4.service import pagecache
+from vj4.test import base
+from vj4.util import options
+
+DOMAIN_ID = 'dummy_domain'
+DOMAIN_ID2 = 'dummy_domain2'
+TITLE = 'dummy_title'
+CONTENT = 'dummy_content'
+UID = 22
+BODY = b'<html></html>'
+CONTENT_TYPE = 'text/html'
+
+DummyRequest = collections.namedtuple('DummyRequest', ['path_qs', 'headers'])
+
+
+class PagecacheTest(base.PagecacheTestCase):
+  def setUp(self):
+    super(PagecacheTest, self).setUp()
+    self.key = ('/p/1', DOMAIN_ID, 'zh_CN', False)
+    self.key2 = ('/p/1', DOMAIN_ID2, 'zh_CN', False)
+    self.entry = pagecache.set(self.key, BODY, CONTENT_TYPE)
+    pagecache.set(self.key2, BODY, CONTENT_TYPE)
+
+  def test_get(self):
+    self.assertEqual(pagecache.get(self.key), self.entry)
+    self.assertEqual(self.entry.body, BODY)
+    self.assertEqual(self.entry.content_type, CONTENT_TYPE)
+    self.assertIsNone(pagecache.get(('/p/2', DOMAIN_ID, 'zh_CN', False)))
+
+  @base.wrap_coro
+  async def test_invalidate_by_document(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, 1)
+    self.assertIsNone(pagecache.get(self.key))
+    self.assertIsNotNone(pagecache.get(self.key2))
+    pagecache.set(self.key, BODY, CONTENT_TYPE)
+    await problem.inc(DOMAIN_ID, 1, 'num_submit', 1)
+    self.assertIsNotNone(pagecache.get(self.key))
+    await problem.edit(DOMAIN_ID, 1, title=TITLE + '2')
+    self.assertIsNone(pagecache.get(self.key))
+
+  @base.wrap_coro
+  async def test_invalidate_by_domain(self):
+    await domain.add(DOMAIN_ID2, UID, name='dummy_name')
+    pagecache.set(self.key2, BODY, CONTENT_TYPE)
+    await domain.edit(DOMAIN_ID2, name='dummy_name2')
+    self.assertIsNotNone(pagecache.get(self.key))
+    self.assertIsNone(pagecache.get(self.key2))
+
+
+class DummyHandler(object):
+  def __init__(self, session=None, headers=None):
+    self.session = session
+    self.request = DummyRequest('/d/1', headers or {})
+    self.domain_id = DOMAIN_ID
+    self.view_lang = 'zh_CN'
+    self.prefer_json = False
+    self.response = web.Response()
+    self.num_rendered = 0
+
+  @handler_base.guest_cache
+  async def get(self, *, status=200, cookie=False, stream=False):
+    self.num_rendered += 1
+    if stream:
+      self.response = web.StreamResponse()
+      return
+    self.response.set_status(status)
+    self.response.content_type = CONTENT_TYPE
+    self.response.body = BODY
+    if cookie:
+      self.response.set_cookie('sid', 'dummy_sid')
+
+
+class GuestCacheTest(base.PagecacheTestCase):
+  def setUp(self):
+    super(GuestCacheTest, self).setUp()
+    self.key = ('/d/1', DOMAIN_ID, 'zh_CN', False)
+
+  @base.wrap_coro
+  async def test_miss_and_hit(self):
+    handler = DummyHandler()
+    await handler.get()
+    self.assertEqual(handler.num_rendered, 1)
+    self.assertEqual(handler.response.headers['X-Cache'], 'MISS')
+    self.assertEqual(handler.response.headers['Cache-Control'],
+                     'public, max-age={}'.format(options.pagecache_max_age_seconds))
+    self.assertEqual(handler.response.headers['Vary'], 'Accept, Cookie')
+    self.assertEqual(handler.response.headers['Etag'], pagecache.get(self.key).etag)
+    handler = DummyHandler()
+    await handler.get()
+    self.assertEqual(handler.num_rendered, 0)
+    self.assertEqual(handler.response.headers['X-Cache'], 'HIT')
+    self.assertEqual(handler.response.status, 200)
+    self.assertEqual(handler.response.body, BODY)
+    self.assertEqual(handler.response.content_type, CONTENT_TYPE)
+
+  @base.wrap_coro
+  async def test_not_modified(self):
+    handler = DummyHandler()
+    await handler.get()
+    etag = handler.response.headers['Etag']
+    handler = DummyHandler(headers={'If-None-Match': etag})
+    await handler.get()
+    self.assertEqual(handler.response.status, 304)
+    self.assertIsNone(handler.response.body)
+    handler = DummyHandler(headers={'If-None-Match': '"dummy_etag"'})
+    await handler.get()
+    self.assertEqual(handler.response.status, 200)
+    self.assertEqual(handler.response.body, BODY)
+
+  @base.wrap_coro
+  async def test_session(self):
+    handler = DummyHandler(session={'uid': UID})
+    await handler.get()
+    self.assertEqual(handler.num_rendered, 1)
+    self.assertNotIn('X-Cache', handler.response.headers)
+    self.assertIsNone(pagecache.get(self.key))
+
+  @base.wrap_coro
+  async def test_bypass(self):
+    for kwargs in [{'status': 404}, {'cookie': True}, {'stream': True}]:
+      handler = DummyHandler()
+      await handler.get(**kwargs)
+      self.assertEqual(handler.num_rendered, 1)
+      self.assertNotIn('X-Cache', handler.response.headers)
+      self.assertNotIn('Etag', handler.response.headers)
+      self.assertIsNone(pagecache.get(self.key))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,71 @@
+import base64
+import unittest
+
+import bson
+
+from vj4 import error
+from vj4.model.adaptor import problem
+from vj4.test import base
+from vj4.util import pagination
+
+DOMAIN_ID = 'dummy_domain'
+TITLE = 'dummy_title'
+CONTENT = 'dummy_content'
+UID = 22
+PAGE_SIZE = 3
+SORT = [('pname', 1), ('doc_id', 1)]
+
+
+class PaginateByKeyTest(base.DatabaseTestCase):
+  def setUp(self):
+    super(PaginateByKeyTest, self).setUp()
+    for pid in range(1, 6):
+      base.wait(problem.add(DOMAIN_ID, TITLE, CONTENT, UID, pid))
+    for pid, pname in [(6, 'B'), (7, 'A'), (8, 'C')]:
+      base.wait(problem.add(DOMAIN_ID, TITLE, CONTENT, UID, pid, pname))
+    self.expected = [1, 2, 3, 4, 5, 7, 6, 8]
+
+  @base.wrap_coro
+  async def test_next_previous(self):
+    pids, cursor, cursors = [], None, {}
+    for page in range(1, 4):
+      pdocs, num_pages, count, previous_cursor, next_cursor = await pagination.paginate_by_key(
+          problem.get_multi, problem.count, SORT, page, PAGE_SIZE, cursor, domain_id=DOMAIN_ID)
+      self.assertEqual(num_pages, 3)
+      self.assertEqual(count, 8)
+      pids.extend(pdoc['doc_id'] for pdoc in pdocs)
+      cursors[page - 1] = previous_cursor
+      cursor = next_cursor
+    self.assertListEqual(pids, self.expected)
+    pdocs, _, _, _, _ = await pagination.paginate_by_key(
+        problem.get_multi, problem.count, SORT, 2, PAGE_SIZE, cursors[2], domain_id=DOMAIN_ID)
+    self.assertListEqual([pdoc['doc_id'] for pdoc in pdocs], self.expected[3:6])
+
+  @base.wrap_coro
+  async def test_skip(self):
+    pdocs, num_pages, count, _, _ = await pagination.paginate_by_key(
+        problem.get_multi, problem.count, SORT, 3, PAGE_SIZE, domain_id=DOMAIN_ID)
+    self.assertListEqual([pdoc['doc_id'] for pdoc in pdocs], self.expected[6:])
+    with self.assertRaises(error.ValidationError):
+      await pagination.paginate_by_key(problem.get_multi, problem.count, SORT, 0, PAGE_SIZE,
+                                       domain_id=DOMAIN_ID)
+
+  @base.wrap_coro
+  async def test_invalid_cursor(self):
+    _, _, _, _, next_cursor = await pagination.paginate_by_key(
+        problem.get_multi, problem.count, SORT, 1, PAGE_SIZE, domain_id=DOMAIN_ID)
+    with self.assertRaises(error.ValidationError):
+      await pagination.paginate_by_key(problem.get_multi, problem.count, SORT, 3, PAGE_SIZE,
+                                       next_cursor, domain_id=DOMAIN_ID)
+    with self.assertRaises(error.ValidationError):
+      await pagination.paginate_by_key(problem.get_multi, problem.count, SORT, 2, PAGE_SIZE, '!',
+                                       domain_id=DOMAIN_ID)
+    cursor = base64.urlsafe_b64encode(bson.BSON.encode(
+        {'p': 2, 'd': 1, 'k': [{'$ne': None}, {'$ne': None}]})).decode()
+    with self.assertRaises(error.ValidationError):
+      await pagination.paginate_by_key(problem.get_multi, problem.count, SORT, 2, PAGE_SIZE,
+                                       cursor, domain_id=DOMAIN_ID)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,14 +1,19 @@
+import time
 import unittest
+from bson import objectid
 
 from vj4 import error
 from vj4.model.adaptor import problem
 from vj4.test import base
 
 DOMAIN_ID = 'dummy_domain'
+DOMAIN_ID2 = 'dummy_domain2'
 TITLE = 'dummy_title'
 CONTENT = 'dummy_content'
 UID = 22
 PID = 777
+PNAME = 'dummyPname'
+PNAME2 = 'dummyPname2'
 CONTENT2 = 'dummy_content2'
 UID2 = 222
 
@@ -44,6 +49,62 @@ class ProblemTest(base.DatabaseTestCase):
     psdoc = await problem.get_status(DOMAIN_ID, PID, UID)
     self.assertTrue(psdoc['star'])
 
+  @base.wrap_coro
+  async def test_random(self):
+    self.assertIsNone(await problem.get_random_id(DOMAIN_ID))
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID)
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID + 1)
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID + 2, hidden=True)
+    pids = set()
+    for _ in range(50):
+      pids.add(await problem.get_random_id(DOMAIN_ID, hidden=False))
+    self.assertSetEqual(pids, {PID, PID + 1})
+
+
+class ProblemPnameTest(base.SmallcacheTestCase):
+  @base.wrap_coro
+  async def test_get_by_pname(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID, PNAME)
+    pdoc = await problem.get(DOMAIN_ID, PNAME)
+    self.assertEqual(pdoc['doc_id'], PID)
+    pdoc = await problem.get(DOMAIN_ID, PNAME)
+    self.assertEqual(pdoc['doc_id'], PID)
+    with self.assertRaises(error.ProblemNotFoundError):
+      await problem.get(DOMAIN_ID, PNAME2)
+
+  @base.wrap_coro
+  async def test_edit_pname(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID, PNAME)
+    pdoc = await problem.get(DOMAIN_ID, PNAME)
+    self.assertEqual(pdoc['doc_id'], PID)
+    await problem.edit(DOMAIN_ID, PID, PNAME2)
+    pdoc = await problem.get(DOMAIN_ID, PNAME2)
+    self.assertEqual(pdoc['doc_id'], PID)
+    with self.assertRaises(error.ProblemNotFoundError):
+      await problem.get(DOMAIN_ID, PNAME)
+
+  @base.wrap_coro
+  async def test_check_exists(self):
+    with self.assertRaises(error.ProblemNotFoundError):
+      await problem.set_star(DOMAIN_ID, PID, UID, True)
+    self.assertIsNone(await problem.get_status(DOMAIN_ID, PID, UID))
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID)
+    psdoc = await problem.set_star(DOMAIN_ID, PID, UID, True)
+    self.assertTrue(psdoc['star'])
+
+
+class ProblemDataTest(base.BusTestCase):
+  @base.wrap_coro
+  async def test_get_data_list(self):
+    await problem.add(DOMAIN_ID, TITLE, CONTENT, UID, PID)
+    pdoc = await problem.get(DOMAIN_ID, PID)
+    pid2 = await problem.copy(pdoc, DOMAIN_ID2, UID, PID + 1)
+    self.assertListEqual(await problem.get_data_list(0), [])
+    await problem.set_data(DOMAIN_ID, PID, objectid.ObjectId())
+    self.assertSetEqual(set(await problem.get_data_list(0)),
+                        {(DOMAIN_ID, PID), (DOMAIN_ID2, pid2)})
+    self.assertListEqual(await problem.get_data_list(int(time.time()) + 1), [])
+
 
 class ProblemSolutionTest(base.DatabaseTestCase):
   def setUp(self):
@@ -1,5 +1,9 @@
 import unittest
 
+from vj4 import error
+from vj4.service import pwhashpool
+from vj4.test import base
+from vj4.util import options
 from vj4.util import pwhash
 
 
@@ -33,5 +37,31 @@ class Test(unittest.TestCase):
     self.assertFalse(pwhash.check(password2, salt1, hash1))
 
 
+class PoolTest(unittest.TestCase):
+  def tearDown(self):
+    pwhashpool.uninit()
+
+  @base.wrap_coro
+  async def test_hash_check(self):
+    salt = pwhash.gen_salt()
+    hash = await pwhashpool.hash_vj4('password1', salt)
+    self.assertEqual(hash, pwhash.hash_vj4('password1', salt))
+    self.assertTrue(await pwhashpool.check('password1', salt, hash))
+    self.assertFalse(await pwhashpool.check('password2', salt, hash))
+    self.assertEqual(pwhashpool.get_stats()['completed'], 3)
+    self.assertEqual(pwhashpool.get_stats()['pending'], 0)
+
+  @base.wrap_coro
+  async def test_reject(self):
+    old_max_pending = options.pwhash_max_pending
+    options.pwhash_max_pending = 0
+    try:
+      with self.assertRaises(error.ServiceUnavailableError):
+        await pwhashpool.hash_vj4('password1', pwhash.gen_salt())
+    finally:
+      options.pwhash_max_pending = old_max_pending
+    self.assertEqual(pwhashpool.get_stats()['rejected'], 1)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,73 @@
+import random
+import unittest
+
+from vj4.service import ranking
+from vj4.util import skiplist
+
+
+class SkipListTest(unittest.TestCase):
+  def test_sorted(self):
+    keys = list(range(200))
+    random.shuffle(keys)
+    sl = skiplist.IndexableSkipList(keys)
+    self.assertEqual(len(sl), 200)
+    self.assertListEqual(list(sl), sorted(keys))
+    for i in range(200):
+      self.assertEqual(sl[i], i)
+      self.assertEqual(sl.bisect_left(i), i)
+    self.assertEqual(sl[-1], 199)
+    with self.assertRaises(IndexError):
+      sl[200]
+
+  def test_remove(self):
+    sl = skiplist.IndexableSkipList([5, 1, 3, 3, 9])
+    sl.remove(3)
+    self.assertListEqual(list(sl), [1, 3, 5, 9])
+    sl.remove(9)
+    self.assertListEqual(list(sl), [1, 3, 5])
+    self.assertEqual(sl[2], 5)
+    with self.assertRaises(KeyError):
+      sl.remove(4)
+
+  def test_islice(self):
+    sl = skiplist.IndexableSkipList(range(10))
+    self.assertListEqual(list(sl.islice(3, 6)), [3, 4, 5])
+    self.assertListEqual(list(sl.islice(-2, 2)), [0, 1])
+    self.assertListEqual(list(sl.islice(8, 20)), [8, 9])
+    self.assertListEqual(list(sl.islice(6, 3)), [])
+
+
+class RankIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.index = ranking.RankIndex([(1, 10.0), (2, 30.0), (3, 20.0), (4, 20.0), (5, 0.0)])
+
+  def test_rank_of(self):
+    self.assertEqual(len(self.index), 4)
+    self.assertEqual(self.index.rank_of(2), 1)
+    self.assertEqual(self.index.rank_of(3), 2)
+    self.assertEqual(self.index.rank_of(4), 2)
+    self.assertEqual(self.index.rank_of(1), 4)
+    self.assertIsNone(self.index.rank_of(5))
+
+  def test_update(self):
+    self.index.update(1, 40.0)
+    self.assertEqual(self.index.rank_of(1), 1)
+    self.assertEqual(self.index.rank_of(2), 2)
+    self.index.update(2, 0.0)
+    self.assertIsNone(self.index.rank_of(2))
+    self.assertEqual(len(self.index), 3)
+
+  def test_page(self):
+    self.assertListEqual(self.index.page(1, 2), [(1, 2, 30.0), (2, 3, 20.0)])
+    self.assertListEqual(self.index.page(2, 2), [(2, 4, 20.0), (4, 1, 10.0)])
+    self.assertListEqual(self.index.page(3, 2), [])
+
+  def test_neighbors(self):
+    self.assertListEqual(self.index.neighbors(4, 1),
+                         [(2, 3, 20.0), (2, 4, 20.0), (4, 1, 10.0)])
+    self.assertListEqual(self.index.neighbors(2, 1), [(1, 2, 30.0), (2, 3, 20.0)])
+    self.assertListEqual(self.index.neighbors(5, 1), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+import time
+import unittest
+
+from vj4 import db
+from vj4.model import recordstat
+from vj4.test import base
+
+
+class RecordStatTest(base.DatabaseTestCase):
+  @base.wrap_coro
+  async def test_get_counts(self):
+    now = int(time.time())
+    await recordstat.inc(now)
+    await recordstat.inc(now)
+    await recordstat.inc(now - 3 * 86400)
+    await recordstat.inc(now - 100 * 86400)
+    counts = await recordstat.get_counts(datetime.timedelta(days=1),
+                                         datetime.timedelta(days=7),
+                                         None)
+    self.assertListEqual(counts, [2, 3, 4])
+
+  @base.wrap_coro
+  async def test_rollup(self):
+    now = int(time.time())
+    await recordstat.inc(now)
+    await recordstat.inc(now - 3 * 86400)
+    await recordstat.inc(now - 3 * 86400 - 60)
+    await recordstat.inc(now - 100 * 86400)
+    await recordstat.rollup()
+    counts = await recordstat.get_counts(datetime.timedelta(days=1),
+                                         datetime.timedelta(days=7),
+                                         None)
+    self.assertListEqual(counts, [1, 3, 4])
+    periods = {}
+    async for doc in db.coll('record.stat').find():
+      periods[doc['period']] = periods.get(doc['period'], 0) + doc['count']
+    self.assertEqual(periods[recordstat.PERIOD_MINUTE], 1)
+    self.assertEqual(periods[recordstat.PERIOD_DAY], 1)
+
+  @base.wrap_coro
+  async def test_rollup_concurrent(self):
+    now = int(time.time())
+    await recordstat.inc(now)
+    await recordstat.inc(now - 3 * 86400)
+    await recordstat.inc(now - 3 * 86400 - 60)
+    await recordstat.inc(now - 100 * 86400)
+    await asyncio.gather(recordstat.rollup(), recordstat.rollup())
+    counts = await recordstat.get_counts(datetime.timedelta(days=1),
+                                         datetime.timedelta(days=7),
+                                         None)
+    self.assertListEqual(counts, [1, 3, 4])
+
+
+if __name__ == '__main__':
+  unittest.main()
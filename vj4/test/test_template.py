@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from vj4 import template
+from vj4.util import options
+
+
+class TemplateTest(unittest.TestCase):
+  def setUp(self):
+    self.old_env = template._env
+    template._env = None
+    options.template_cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(options.template_cache_dir)
+    del options.template_cache_dir
+    template._env = self.old_env
+
+  def test_get_env(self):
+    self.assertIs(template.get_env(), template.get_env())
+
+  def test_precompile(self):
+    count = template.precompile()
+    self.assertGreater(count, 0)
+    # Templates included by others, e.g. partials in other formats, are compiled too.
+    cached = os.listdir(options.template_cache_dir)
+    self.assertGreaterEqual(len(cached), count)
+    # A new environment, e.g. of another process, loads all templates from the bytecode cache.
+    template._env = None
+    self.assertEqual(template.get_env().warm_up(), count)
+    self.assertCountEqual(os.listdir(options.template_cache_dir), cached)
+
+
+if __name__ == '__main__':
+  unittest.main()
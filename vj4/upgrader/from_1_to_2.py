@@ -0,0 +1,49 @@
+import logging
+import random
+
+from vj4 import db
+from vj4.model import datachange
+from vj4.model import document
+from vj4.model import fs
+from vj4.model import system
+from vj4.util import argmethod
+
+
+_logger = logging.getLogger(__name__)
+
+
+@argmethod.wrap
+async def run():
+  lock = await system.acquire_upgrade_lock()
+  try:
+    await system.ensure_db_version(1)
+
+    # add `random` attribute to problems for random problem selection
+    _logger.info('Updating problem random ...')
+    coll = db.coll('document')
+    bulk = coll.initialize_unordered_bulk_op()
+    execute = False
+    async for pdoc in coll.find({'doc_type': document.TYPE_PROBLEM,
+                                 'random': {'$exists': False}}, projection={'_id': 1}):
+      bulk.find({'_id': pdoc['_id']}).update_one({'$set': {'random': random.random()}})
+      execute = True
+    if execute:
+      await bulk.execute()
+
+    # log problem data changes for judge data list
+    _logger.info('Updating problem data change ...')
+    async for pdoc in coll.find({'doc_type': document.TYPE_PROBLEM,
+                                 'data': {'$type': 'objectId'}},
+                                projection={'domain_id': 1, 'doc_id': 1, 'data': 1}):
+      fdoc = await fs.get_meta(pdoc['data'])
+      if fdoc and fdoc.get('uploadDate'):
+        await datachange.add(pdoc['domain_id'], pdoc['doc_id'], fdoc['uploadDate'])
+
+    _logger.info('Bumping database version...')
+    await system.set_db_version(2)
+  finally:
+    await system.release_upgrade_lock(lock)
+
+
+if __name__ == '__main__':
+  argmethod.invoke_by_args()
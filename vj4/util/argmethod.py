@@ -23,7 +23,10 @@ def wrap(method):
   return method
 
 
-def invoke_by_args():
+def invoke_by_args(*, init_db=True):
+  """Invoke the method named in the command line. Methods which do not use the database may be
+  invoked with init_db=False, so that they run without a database server, e.g. at build time.
+  """
   import argparse
   import asyncio
   import coloredlogs
@@ -53,7 +56,8 @@ def invoke_by_args():
     parser.print_help()
   else:
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(db.init())
+    if init_db:
+      loop.run_until_complete(db.init())
     try:
       result = _methods[name](**vars(args))
       if inspect.iscoroutine(result):
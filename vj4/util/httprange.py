@@ -0,0 +1,48 @@
+"""Parsing of HTTP byte ranges (RFC 7233)."""
+import re
+
+MAX_RANGES = 16
+
+_RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+def parse(header, length):
+  """Parse the Range header of a resource with the length.
+
+  Returns:
+    None if the header should be ignored and the whole resource be sent, otherwise a sorted list
+    of non-overlapping (start, stop) ranges, which is empty if none of the ranges is satisfiable.
+  """
+  if not header:
+    return None
+  unit, _, specs = header.partition('=')
+  if unit.strip().lower() != 'bytes':
+    return None
+  ranges = []
+  for spec in specs.split(','):
+    match = _RANGE_SPEC_RE.match(spec.strip())
+    if not match or not any(match.groups()):
+      return None
+    first, last = match.groups()
+    if not first:
+      # Suffix range of the last bytes.
+      suffix = int(last)
+      if suffix:
+        ranges.append((max(length - suffix, 0), length))
+      continue
+    start = int(first)
+    if last and int(last) < start:
+      return None
+    stop = int(last) + 1 if last else length
+    if start < length:
+      ranges.append((start, min(stop, length)))
+  if len(ranges) > MAX_RANGES:
+    return None
+  ranges.sort()
+  result = []
+  for start, stop in ranges:
+    if result and start <= result[-1][1]:
+      result[-1] = (result[-1][0], max(result[-1][1], stop))
+    else:
+      result.append((start, stop))
+  return result
@@ -1,4 +1,5 @@
 import base64
+import collections
 import hashlib
 import hoedown
 import jinja2
@@ -8,6 +9,10 @@ from urllib import parse
 
 from vj4.util import options
 
+options.define('markdown_cache_max_entries', default=1024,
+               help='Maximum number of rendered markdown texts to cache.')
+options.define('markdown_cache_max_length', default=2 ** 23,
+               help='Maximum total length of rendered markdown texts to cache, in characters.')
 
 MARKDOWN_EXTENSIONS = (hoedown.EXT_TABLES |  # Parse PHP-Markdown style tables.
                        hoedown.EXT_FENCED_CODE |  # Parse fenced code blocks.
@@ -23,6 +28,11 @@ MARKDOWN_RENDER_FLAGS = (hoedown.HTML_ESCAPE |  # Escape all HTML.
 
 FS_RE = re.compile(r'\(vijos\:\/\/fs\/([0-9a-f]{40,})\)')
 
+MARKDOWN_CACHE_MAX_TEXT_LENGTH = 2 ** 14
+
+_markdown_cache = collections.OrderedDict()
+_markdown_cache_length = 0
+
 
 def nl2br(text):
   markup = jinja2.escape(text)
@@ -34,12 +44,35 @@ def fs_replace(m):
   return '(' + options.cdn_prefix.rstrip('/') + '/fs/' + m.group(1) + ')'
 
 
-def markdown(text):
+def _render_markdown(text):
   text = FS_RE.sub(fs_replace, text)
   return markupsafe.Markup(hoedown.html(
       text, extensions=MARKDOWN_EXTENSIONS, render_flags=MARKDOWN_RENDER_FLAGS))
 
 
+def markdown(text):
+  """Render markdown, from an LRU cache keyed by the digest of the text and cdn_prefix.
+
+  The cache is bounded by both the number of entries and the total length of rendered texts.
+  """
+  global _markdown_cache_length
+  if len(text) > MARKDOWN_CACHE_MAX_TEXT_LENGTH:
+    return _render_markdown(text)
+  key = (hashlib.sha1(text.encode()).digest(), options.cdn_prefix)
+  markup = _markdown_cache.get(key)
+  if markup is not None:
+    _markdown_cache.move_to_end(key)
+    return markup
+  markup = _render_markdown(text)
+  _markdown_cache[key] = markup
+  _markdown_cache_length += len(markup)
+  while (len(_markdown_cache) > options.markdown_cache_max_entries
+         or _markdown_cache_length > options.markdown_cache_max_length):
+    _, evicted = _markdown_cache.popitem(False)
+    _markdown_cache_length -= len(evicted)
+  return markup
+
+
 def gravatar_url(gravatar, size=200):
   # TODO: 'd' should be https://domain/img/avatar.png
   if gravatar:
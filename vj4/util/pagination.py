@@ -1,6 +1,20 @@
 import asyncio
+import base64
+import binascii
+import datetime
+
+import bson
+from bson import errors as bson_errors
+from bson import int64
+from bson import objectid
+
 from vj4 import error
 
+# Types of sort key values in cursors. Other types, e.g. documents with operators or regular
+# expressions, would change the meaning of the range query.
+_CURSOR_VALUE_TYPES = (type(None), bool, int, int64.Int64, float, str, objectid.ObjectId,
+                       datetime.datetime)
+
 
 async def paginate(cursor, page: int, page_size: int):
   if page <= 0:
@@ -11,3 +25,85 @@ async def paginate(cursor, page: int, page_size: int):
                                                 .to_list())
   num_pages = (count + page_size - 1) // page_size
   return page_docs, num_pages, count
+
+
+def _encode_cursor(page, doc, sort, direction):
+  data = bson.BSON.encode({'p': page, 'd': direction, 'k': [doc.get(key) for key, _ in sort]})
+  return base64.urlsafe_b64encode(data).decode()
+
+
+def _decode_cursor(cursor, page, sort):
+  try:
+    value = bson.BSON(base64.urlsafe_b64decode(cursor.encode())).decode()
+  except (binascii.Error, bson_errors.BSONError, ValueError):
+    raise error.ValidationError('cursor')
+  if (value.get('p') != page or value.get('d') not in (1, -1)
+      or type(value.get('k')) is not list or len(value['k']) != len(sort)
+      or any(type(v) not in _CURSOR_VALUE_TYPES for v in value['k'])):
+    raise error.ValidationError('cursor')
+  return value['k'], value['d']
+
+
+def _range_query(sort, values):
+  """Build the query of documents strictly after the key values in the sort order."""
+  clauses = []
+  for i, (key, direction) in enumerate(sort):
+    value = values[i]
+    # None sorts before any other value, and MongoDB does not compare None with other types.
+    if value is None:
+      conditions = [] if direction < 0 else [{'$ne': None}]
+    elif direction > 0:
+      conditions = [{'$gt': value}]
+    else:
+      conditions = [{'$lt': value}, None]
+    for condition in conditions:
+      clause = {sort[j][0]: values[j] for j in range(i)}
+      clause[key] = condition
+      clauses.append(clause)
+  return {'$or': clauses} if clauses else {'_id': {'$in': []}}
+
+
+async def paginate_by_key(query_func, count_func, sort, page: int, page_size: int,
+                          cursor: str=None, **kwargs):
+  """Paginate with a range query on the sort key instead of skipping documents.
+
+  Args:
+    query_func: function which takes query keyword arguments and returns a cursor.
+    count_func: coroutine function which takes query keyword arguments and returns the count,
+        usually from vj4.service.countcache.
+    sort: list of (key, direction), which must identify a document, e.g. ending with doc_id.
+    page: page number, starting from 1.
+    page_size: number of documents per page.
+    cursor: opaque cursor of the requested page, which is previous_cursor or next_cursor of an
+        adjacent page. Pages without a cursor are served by skipping documents.
+    kwargs: query.
+
+  Returns:
+    A tuple of (page_docs, num_pages, count, previous_cursor, next_cursor).
+  """
+  if page <= 0:
+    raise error.ValidationError('page')
+  query = kwargs
+  direction = 1
+  skip = (page - 1) * page_size
+  if cursor:
+    values, direction = _decode_cursor(cursor, page, sort)
+    query = dict(kwargs)
+    query['$and'] = query.get('$and', []) + [_range_query([(key, d * direction)
+                                                           for key, d in sort], values)]
+    skip = 0
+  count, page_docs = await asyncio.gather(
+      count_func(**kwargs),
+      query_func(**query).sort([(key, d * direction) for key, d in sort]) \
+                         .skip(skip) \
+                         .limit(page_size) \
+                         .to_list())
+  if direction < 0:
+    page_docs.reverse()
+  num_pages = (count + page_size - 1) // page_size
+  previous_cursor, next_cursor = None, None
+  if page_docs:
+    if page > 1:
+      previous_cursor = _encode_cursor(page - 1, page_docs[0], sort, -1)
+    next_cursor = _encode_cursor(page + 1, page_docs[-1], sort, 1)
+  return page_docs, num_pages, count, previous_cursor, next_cursor
@@ -1,6 +1,5 @@
 import base64
 import binascii
-import functools
 import hashlib
 import os
 
@@ -52,7 +51,6 @@ def hash_vj4(password: str, salt: str):
   return _HASH_TYPE_VJ4 + '|' + binascii.hexlify(dk).decode()
 
 
-@functools.lru_cache()
 @argmethod.wrap
 def check(password: str, salt: str, hash: str):
   hash_type, rest = hash.split('|', 1)
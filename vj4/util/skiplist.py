@@ -0,0 +1,116 @@
+"""An indexable skip list, i.e. a sorted collection with positional access.
+
+Insertion, removal, bisection and positional lookup are all O(log n) on average.
+"""
+import math
+import random
+
+MAX_LEVELS = 32
+
+
+class _Node(object):
+  __slots__ = ('key', 'next', 'width')
+
+  def __init__(self, key, levels):
+    self.key = key
+    self.next = [None] * levels
+    self.width = [1] * levels
+
+
+class IndexableSkipList(object):
+  def __init__(self, keys=()):
+    self._nil = _Node(None, 0)
+    self._head = _Node(None, MAX_LEVELS)
+    for level in range(MAX_LEVELS):
+      self._head.next[level] = self._nil
+    self._size = 0
+    for key in keys:
+      self.insert(key)
+
+  def __len__(self):
+    return self._size
+
+  def __iter__(self):
+    node = self._head.next[0]
+    while node is not self._nil:
+      yield node.key
+      node = node.next[0]
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += self._size
+    if not 0 <= index < self._size:
+      raise IndexError(index)
+    return self._node_at(index).key
+
+  def _node_at(self, index):
+    """Returns the node at the index, or the head node if the index is -1."""
+    node = self._head
+    index += 1
+    for level in reversed(range(MAX_LEVELS)):
+      while node.next[level] is not self._nil and node.width[level] <= index:
+        index -= node.width[level]
+        node = node.next[level]
+    return node
+
+  def insert(self, key):
+    chain = [None] * MAX_LEVELS
+    steps_at_level = [0] * MAX_LEVELS
+    node = self._head
+    for level in reversed(range(MAX_LEVELS)):
+      while node.next[level] is not self._nil and node.next[level].key <= key:
+        steps_at_level[level] += node.width[level]
+        node = node.next[level]
+      chain[level] = node
+    levels = min(MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+    new_node = _Node(key, levels)
+    steps = 0
+    for level in range(levels):
+      prev_node = chain[level]
+      new_node.next[level] = prev_node.next[level]
+      prev_node.next[level] = new_node
+      new_node.width[level] = prev_node.width[level] - steps
+      prev_node.width[level] = steps + 1
+      steps += steps_at_level[level]
+    for level in range(levels, MAX_LEVELS):
+      chain[level].width[level] += 1
+    self._size += 1
+
+  def remove(self, key):
+    chain = [None] * MAX_LEVELS
+    node = self._head
+    for level in reversed(range(MAX_LEVELS)):
+      while node.next[level] is not self._nil and node.next[level].key < key:
+        node = node.next[level]
+      chain[level] = node
+    target = chain[0].next[0]
+    if target is self._nil or target.key != key:
+      raise KeyError(key)
+    for level in range(len(target.next)):
+      prev_node = chain[level]
+      prev_node.width[level] += target.width[level] - 1
+      prev_node.next[level] = target.next[level]
+    for level in range(len(target.next), MAX_LEVELS):
+      chain[level].width[level] -= 1
+    self._size -= 1
+
+  def bisect_left(self, key):
+    """Returns the number of keys which are less than the given key."""
+    index = 0
+    node = self._head
+    for level in reversed(range(MAX_LEVELS)):
+      while node.next[level] is not self._nil and node.next[level].key < key:
+        index += node.width[level]
+        node = node.next[level]
+    return index
+
+  def islice(self, start, stop):
+    """Iterates keys in the index range [start, stop)."""
+    start = max(start, 0)
+    stop = min(stop, self._size)
+    if start >= stop:
+      return
+    node = self._node_at(start - 1).next[0]
+    for _ in range(stop - start):
+      yield node.key
+      node = node.next[0]
@@ -1,22 +1,85 @@
+import asyncio
+import hashlib
+import importlib
+import inspect
 import logging
 import pkgutil
 from os import path
 
+from vj4.model import system
 from vj4.util import argmethod
 from vj4.util import options
 
+INDEX_LEASE_SECONDS = 600
+INDEX_RETRY_SECONDS = 60
+
 _logger = logging.getLogger(__name__)
 
 
-@argmethod.wrap
-async def ensure_all_indexes():
+def _get_index_specs():
+  """Get (name, module, hash) of models with indexes. The hash is of the source of ensure_indexes,
+  so it changes when any index spec of the model changes.
+  """
   model_path = path.join(path.dirname(path.dirname(__file__)), 'model')
-  for module_finder, name, ispkg in pkgutil.iter_modules([model_path]):
+  specs = []
+  for _, name, ispkg in pkgutil.iter_modules([model_path]):
     if not ispkg:
-      module = module_finder.find_module(name).load_module()
+      module = importlib.import_module('vj4.model.' + name)
       if 'ensure_indexes' in dir(module):
+        source = inspect.getsource(module.ensure_indexes)
+        specs.append((name, module, hashlib.sha1(source.encode()).hexdigest()))
+  return specs
+
+
+async def _ensure_changed_indexes(specs):
+  lease = await system.acquire_lease('index', INDEX_LEASE_SECONDS)
+  if not lease:
+    _logger.info('Indexes are being ensured by another process.')
+    return False
+  try:
+    index_hashes = await system.get_index_hashes()
+    for name, module, index_hash in specs:
+      if index_hashes.get(name) != index_hash:
+        if not await system.renew_lease('index', lease, INDEX_LEASE_SECONDS):
+          _logger.warning('Lease of ensuring indexes is lost.')
+          return False
         _logger.info('Ensuring indexes for "%s".' % name)
         await module.ensure_indexes()
+        await system.set_index_hash(name, index_hash)
+    return True
+  finally:
+    await system.release_lease('index', lease)
+
+
+@argmethod.wrap
+async def ensure_all_indexes():
+  """Ensure indexes of models whose index specs changed since they were last ensured.
+
+  Returns:
+    False if indexes are being ensured by another process.
+  """
+  specs = _get_index_specs()
+  index_hashes = await system.get_index_hashes()
+  if all(index_hashes.get(name) == index_hash for name, _, index_hash in specs):
+    return True
+  return await _ensure_changed_indexes(specs)
+
+
+async def _ensure_all_indexes_and_log():
+  # Retry until the indexes are ensured, by this or another process, in case the other process
+  # dies and its lease expires.
+  while True:
+    try:
+      if await ensure_all_indexes():
+        return
+    except Exception as e:
+      _logger.exception(e)
+    await asyncio.sleep(INDEX_RETRY_SECONDS)
+
+
+def ensure_all_indexes_later():
+  """Ensure indexes in background, so that startup is not blocked by building indexes."""
+  asyncio.get_event_loop().create_task(_ensure_all_indexes_and_log())
 
 
 def get_remote_ip(request):